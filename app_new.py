@@ -36,6 +36,7 @@ from utils.config import Config
 from pipeline.modules.extensions import jwt, jwt_blacklist
 from auth.routes import auth_bp
 from query.routes_new import query_bp   # <-- updated import
+from health.routes import health_bp
 
 # ------------------ Logging Setup ------------------
 if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
@@ -71,6 +72,7 @@ def create_app():
     # Register blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(query_bp)  
+    app.register_blueprint(health_bp)
 
     return app
 
@@ -1,22 +1,80 @@
 import sys
 import json
-from pipeline.pipeline import run_pipeline
+import argparse
+from pipeline.pipeline import run_pipeline, run_pipeline_batch
+
+
+def read_batch_file(path):
+    """
+    Read questions from a JSONL file. Each line is either a JSON string or an
+    object with a "question" key (other keys such as "id" are echoed back).
+    """
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            if not record.get("question"):
+                print(f"Skipping line {line_no}: no 'question' field", file=sys.stderr)
+                continue
+            records.append(record)
+    return records
+
+
+def run_batch(path, out_path=None, concurrency=4):
+    """Stream one JSON line per question to stdout (or out_path) as results complete."""
+    records = read_batch_file(path)
+    out = open(out_path, "w", encoding="utf-8") if out_path else sys.stdout
+    try:
+        questions = [r["question"] for r in records]
+        for item in run_pipeline_batch(questions, username="admin", concurrency=concurrency):
+            record = records[item["index"]]
+            line = {k: v for k, v in record.items() if k != "question"}
+            line.update({
+                "question": item["question"],
+                "sql_query": item["result"].get("sql_query"),
+                "response": item["result"].get("response", []),
+                "errors": item["result"].get("errors", []),
+                "time_taken_in_seconds": item["result"].get("time_taken_in_seconds"),
+            })
+            out.write(json.dumps(line, default=str) + "\n")
+            out.flush()
+    finally:
+        if out_path:
+            out.close()
+
 
 def main():
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser(description="Ask the NL-to-SQL pipeline a question.")
+    parser.add_argument("question", nargs="?", help="your question here")
+    parser.add_argument("--batch", metavar="FILE.jsonl", help="run every question in a JSONL file")
+    parser.add_argument("--out", metavar="FILE.jsonl", help="write batch results here instead of stdout")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel pipeline runs in batch mode")
+    args = parser.parse_args()
+
+    if args.batch:
+        run_batch(args.batch, out_path=args.out, concurrency=args.concurrency)
+        return
+
+    if not args.question:
         print("Usage: python ask.py \"your question here\"")
+        print("       python ask.py --batch questions.jsonl [--out results.jsonl] [--concurrency N]")
         sys.exit(1)
-        
-    question = sys.argv[1]
+
+    question = args.question
     print(f"\nRunning pipeline for: '{question}'...")
     try:
         result = run_pipeline(question, username="admin")
-        
+
         print("\n" + "="*50)
         print("SQL QUERY GENERATED:")
         print("="*50)
         print(result.get("sql_query", "No SQL generated"))
-        
+
         print("\n" + "="*50)
         print("DATABASE RESULTS:")
         print("="*50)
@@ -25,7 +83,7 @@ def main():
             print(json.dumps(response, indent=2, default=str))
         else:
             print("No data found or empty result.")
-            
+
         if result.get("errors"):
             print("\n" + "!"*50)
             print("ERRORS:")
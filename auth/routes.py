@@ -6,16 +6,28 @@ from flask_jwt_extended import (
     jwt_required, get_jwt_identity, get_jwt
 )
 import bcrypt
+from functools import lru_cache
 from pipeline.modules.extensions import jwt_blacklist
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
-# In-memory user DB (hashed passwords)
-USER_DB = {
-    "admin": bcrypt.hashpw("admin123".encode(), bcrypt.gensalt()).decode(),
-    "user1": bcrypt.hashpw("password1".encode(), bcrypt.gensalt()).decode()
+_USER_PASSWORDS = {
+    "admin": "admin123",
+    "user1": "password1"
 }
 
+@lru_cache(maxsize=1)
+def get_user_db():
+    """
+    In-memory user DB (hashed passwords).
+    Hashed on first use instead of at import: bcrypt is deliberately slow and
+    would otherwise add to every app start.
+    """
+    return {
+        username: bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+        for username, password in _USER_PASSWORDS.items()
+    }
+
 @auth_bp.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
@@ -23,7 +35,7 @@ def login():
     password = data.get('password')
     if not username or not password:
         return jsonify({"msg": "Missing username or password"}), 400
-    stored_hash = USER_DB.get(username)
+    stored_hash = get_user_db().get(username)
     if not stored_hash or not bcrypt.checkpw(password.encode(), stored_hash.encode()):
         return jsonify({"msg": "Bad credentials"}), 401
     access_token = create_access_token(identity=username)
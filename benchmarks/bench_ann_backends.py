@@ -0,0 +1,92 @@
+# bench_ann_backends.py
+"""
+Few-shot vector index backends (ann_index.py) on synthetic corpora.
+
+Vectors are drawn around random cluster centres (questions cluster by topic)
+and L2-normalized like the Embedder output; queries are perturbed corpus
+vectors. For each corpus size and backend / search knob it reports:
+
+    build_s     index build (training included)
+    mem_mb      serialized index size
+    recall@k    overlap of the top k with the exact (flat) top k
+    p50/p99_ms  single-query search latency, as the pipeline issues them
+
+Usage (from the repo root):
+    python benchmarks/bench_ann_backends.py
+    python benchmarks/bench_ann_backends.py --sizes 20000 --queries 500 --k 10
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def clustered_vectors(n, d, rng, clusters=256, spread=0.35):
+    centres = rng.standard_normal((clusters, d)).astype("float32")
+    x = centres[rng.integers(0, clusters, n)] + spread * rng.standard_normal((n, d)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def time_queries(index, queries, k):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = index.search(q.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids[0])
+    return np.array(latencies), np.array(results)
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 200000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    args = parser.parse_args()
+
+    from pipeline.modules.ann_index import index_spec, build_index, apply_search_params, index_memory_bytes
+
+    rng = np.random.default_rng(0)
+    for n in args.sizes:
+        corpus = clustered_vectors(n, args.dim, rng)
+        queries = corpus[rng.integers(0, n, args.queries)] + 0.05 * rng.standard_normal((args.queries, args.dim)).astype("float32")
+        faiss.normalize_L2(queries)
+
+        print(f"\n=== n={n} d={args.dim} queries={args.queries} k={args.k} ===")
+        print(f"{'backend':28s} {'build_s':>8s} {'mem_mb':>8s} {'recall@k':>9s} {'p50_ms':>8s} {'p99_ms':>8s}")
+        truth = None
+        for kind, knob, values in (("flat", None, [None]),
+                                   ("hnsw", "efSearch", args.ef_search),
+                                   ("ivfpq", "nprobe", args.nprobe)):
+            start = time.perf_counter()
+            index, spec = build_index(corpus, index_spec(kind))
+            build_s = time.perf_counter() - start
+            mem_mb = index_memory_bytes(index) / 2 ** 20
+            for value in values:
+                label = spec["type"]
+                if knob is not None and spec["type"] == kind:
+                    apply_search_params(index, {"search": {knob: value}})
+                    label = f"{kind} {knob}={value}"
+                latencies, found = time_queries(index, queries, args.k)
+                if truth is None:
+                    truth = found
+                print(f"{label:28s} {build_s:8.2f} {mem_mb:8.1f} {recall(found, truth):9.3f} "
+                      f"{np.percentile(latencies, 50):8.3f} {np.percentile(latencies, 99):8.3f}")
+
+
+if __name__ == "__main__":
+    main()
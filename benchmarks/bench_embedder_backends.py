@@ -0,0 +1,125 @@
+# bench_embedder_backends.py
+"""
+Embedder backends: torch (SentenceTransformer) vs ONNX fp32 vs ONNX int8.
+
+Each backend runs in a fresh interpreter so imports and model weights of one do
+not inflate the memory of the next. Texts are the few-shot questions, encoded
+with the query cache off. For each backend it reports:
+
+    load_s          import + model load
+    rss_mb          process resident memory after load and a warm-up encode
+    p50/p99_ms      single-query encode latency (batch size 1)
+    qps@1/8/64      texts per second at batch sizes 1, 8 and 64
+    cos_min/mean    cosine of its vectors vs the torch backend's
+
+Export the ONNX models first:
+    python -m pipeline.modules.onnx_encoder export
+
+Usage (from the repo root):
+    python benchmarks/bench_embedder_backends.py
+    python benchmarks/bench_embedder_backends.py --backends onnx:model_int8.onnx --threads 1
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHILD = r"""
+import json, sys, time
+import numpy as np
+t0 = time.perf_counter()
+from pipeline.modules.embedder import Embedder
+embedder = Embedder(model_name=sys.argv[4], backend=sys.argv[1], cache_size=0)
+load_s = time.perf_counter() - t0
+texts = json.load(open(sys.argv[2], encoding="utf-8"))
+embedder.embed_batch(texts[:8], use_cache=False)
+
+latencies = []
+for text in texts[:200]:
+    start = time.perf_counter()
+    embedder.embed_batch([text], use_cache=False)
+    latencies.append((time.perf_counter() - start) * 1000)
+qps = {}
+for batch_size in (1, 8, 64):
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        embedder.embed_batch(texts[i:i + batch_size], batch_size=batch_size, use_cache=False)
+    qps[batch_size] = len(texts) / (time.perf_counter() - start)
+np.save(sys.argv[3], embedder.embed_batch(texts, use_cache=False))
+
+try:
+    import psutil
+    rss = psutil.Process().memory_info().rss
+except ImportError:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak, KiB on Linux
+print(json.dumps({"load_s": load_s, "rss_mb": rss / 2 ** 20, "p50_ms": float(np.percentile(latencies, 50)),
+                  "p99_ms": float(np.percentile(latencies, 99)), "qps": qps}))
+"""
+
+
+def load_texts(n):
+    from pipeline.modules.onnx_encoder import _sample_texts
+    texts = _sample_texts(limit=n)
+    while len(texts) < n:
+        texts = texts + texts
+    return texts[:n]
+
+
+def run_backend(label, model_name, texts_path, vectors_path, threads):
+    backend, _, file_name = label.partition(":")
+    env = dict(os.environ, EMBEDDER_BACKEND=backend)
+    if file_name:
+        env["EMBEDDER_ONNX_FILE"] = file_name
+    if threads:
+        env.update(EMBEDDER_ONNX_THREADS=str(threads), OMP_NUM_THREADS=str(threads))
+    out = subprocess.run([sys.executable, "-c", CHILD, backend, texts_path, vectors_path, model_name], cwd=ROOT, env=env,
+                         capture_output=True, text=True)
+    if out.returncode:
+        print(f"{label:28s} failed: {out.stderr.strip().splitlines()[-1] if out.stderr.strip() else out.returncode}")
+        return None
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx:model.onnx", "onnx:model_int8.onnx"])
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads for every backend (0 = default)")
+    args = parser.parse_args()
+
+    from pipeline.modules.onnx_encoder import cosine_agreement
+
+    with tempfile.TemporaryDirectory() as tmp:
+        texts_path = os.path.join(tmp, "texts.json")
+        with open(texts_path, "w", encoding="utf-8") as f:
+            json.dump(load_texts(args.texts), f)
+
+        print(f"{'backend':28s} {'load_s':>7s} {'rss_mb':>8s} {'p50_ms':>7s} {'p99_ms':>7s} "
+              f"{'qps@1':>8s} {'qps@8':>8s} {'qps@64':>8s} {'cos_min':>8s} {'cos_mean':>8s}")
+        reference = None
+        for i, label in enumerate(args.backends):
+            vectors_path = os.path.join(tmp, f"{i}.npy")
+            result = run_backend(label, args.model, texts_path, vectors_path, args.threads)
+            if result is None:
+                continue
+            vectors = np.load(vectors_path)
+            if reference is None and label == "torch":
+                reference = vectors
+            cos = cosine_agreement(reference, vectors) if reference is not None else {"min": float("nan"), "mean": float("nan")}
+            qps = result["qps"]
+            print(f"{label:28s} {result['load_s']:7.2f} {result['rss_mb']:8.1f} {result['p50_ms']:7.2f} "
+                  f"{result['p99_ms']:7.2f} {qps['1']:8.0f} {qps['8']:8.0f} {qps['64']:8.0f} "
+                  f"{cos['min']:8.4f} {cos['mean']:8.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# bench_embedding_sidecar.py
+"""
+Per-worker embedders vs one shared embedding sidecar (embedding_server.py).
+
+Simulates N pipeline worker processes that each embed one question at a time,
+as the pipeline does per request. Query caches are off, and every question is
+unique, so every request reaches the model.
+
+    local     every worker loads its own Embedder (backend --backend)
+    sidecar   one server process loads the model; workers use EMBEDDER_BACKEND=socket
+
+For each mode and worker count it reports:
+
+    qps         questions per second across all workers
+    p50/p99_ms  per-question latency seen by a worker
+    rss_mb      summed resident memory of all processes (workers + server)
+    pss_mb      summed proportional set size (shared pages counted once overall)
+    mean_batch  texts per model call in the sidecar
+
+Usage (from the repo root):
+    python benchmarks/bench_embedding_sidecar.py --workers 1 8
+    python benchmarks/bench_embedding_sidecar.py --backend onnx --queries 500 --max-wait-ms 1
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKER = r"""
+import json, sys, time
+from pipeline.modules.embedder import Embedder
+worker, queries, model = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3]
+embedder = Embedder(model_name=model, cache_size=0)
+texts = [f"total outstanding portfolio for branch {worker}-{i} in area {i % 97}" for i in range(queries)]
+embedder.embed_batch(texts[:2])
+print("ready", flush=True)
+sys.stdin.readline()
+latencies = []
+start = time.perf_counter()
+for text in texts:
+    t0 = time.perf_counter()
+    embedder.embed_batch([text])
+    latencies.append((time.perf_counter() - t0) * 1000)
+print(json.dumps({"elapsed": time.perf_counter() - start, "latencies": latencies}), flush=True)
+sys.stdin.readline()
+"""
+
+
+def memory_mb(pids):
+    rss = pss = 0
+    for pid in pids:
+        info = psutil.Process(pid).memory_full_info()
+        rss += info.rss
+        pss += getattr(info, "pss", info.uss)
+    return rss / 2 ** 20, pss / 2 ** 20
+
+
+def start_server(args, socket_path):
+    cmd = [sys.executable, "-m", "pipeline.modules.embedding_server", "--socket", socket_path,
+           "--model", args.model, "--backend", args.backend, "--cache-size", "0",
+           "--max-batch", str(args.max_batch), "--max-wait-ms", str(args.max_wait_ms)]
+    server = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 120
+    while not os.path.exists(socket_path):
+        if server.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("embedding server did not start")
+        time.sleep(0.2)
+    return server
+
+
+def run(mode, n_workers, args, socket_path):
+    env = dict(os.environ, EMBEDDER_BACKEND="socket" if mode == "sidecar" else args.backend,
+               EMBEDDING_SOCKET=socket_path)
+    server = start_server(args, socket_path) if mode == "sidecar" else None
+    workers = [subprocess.Popen([sys.executable, "-c", WORKER, str(w), str(args.queries), args.model], cwd=ROOT,
+                                env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+               for w in range(n_workers)]
+    try:
+        for w in workers:
+            if w.stdout.readline().strip() != "ready":
+                raise RuntimeError("worker failed to start")
+        start = time.perf_counter()
+        for w in workers:
+            w.stdin.write("go\n")
+            w.stdin.flush()
+        results = [json.loads(w.stdout.readline()) for w in workers]
+        wall = time.perf_counter() - start
+        pids = [w.pid for w in workers] + ([server.pid] if server else [])
+        rss, pss = memory_mb(pids)
+        batch = None
+        if server:
+            from pipeline.modules.embedding_server import EmbeddingClient
+            batch = EmbeddingClient(socket_path, connect_timeout=5).stats()["batcher"]["mean_batch"]
+    finally:
+        for w in workers:
+            w.stdin.close()
+            w.wait()
+        if server:
+            server.terminate()
+            server.wait()
+
+    latencies = np.concatenate([r["latencies"] for r in results])
+    return {"qps": n_workers * args.queries / wall, "p50_ms": np.percentile(latencies, 50),
+            "p99_ms": np.percentile(latencies, 99), "rss_mb": rss, "pss_mb": pss, "mean_batch": batch}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--queries", type=int, default=300, help="questions per worker")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default="torch", choices=("torch", "onnx"))
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "embedder.sock")
+    print(f"{'mode':8s} {'workers':>7s} {'qps':>8s} {'p50_ms':>7s} {'p99_ms':>7s} {'rss_mb':>8s} {'pss_mb':>8s} {'mean_batch':>10s}")
+    for n_workers in args.workers:
+        for mode in ("local", "sidecar"):
+            r = run(mode, n_workers, args, socket_path)
+            batch = f"{r['mean_batch']:10.2f}" if r["mean_batch"] else f"{'-':>10s}"
+            print(f"{mode:8s} {n_workers:7d} {r['qps']:8.0f} {r['p50_ms']:7.2f} {r['p99_ms']:7.2f} "
+                  f"{r['rss_mb']:8.0f} {r['pss_mb']:8.0f} {batch}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# bench_fewshot_retrieval.py
+"""
+Few-shot retrieval latency per request: the previous DataFrame implementation
+vs the NumPy FewShotRetriever, at growing corpus sizes.
+
+The corpus is fewshot_example.csv replicated (with a numeric suffix per copy) up
+to each size, with random unit vectors in a flat inner-product FAISS index, so
+no embedding model is needed. For each size it reports ms per request:
+
+    legacy   copy examples_df, full sorted FAISS search, threshold filters,
+             concat + drop_duplicates, exact-match apply, sort (pre-change path)
+    numpy    fetch_few_shots (id-aligned arrays, argpartition top-k)
+
+BM25 scoring (SparseBM25) is the same in both paths and is excluded unless --bm25.
+
+Usage (from the repo root):
+    python benchmarks/bench_fewshot_retrieval.py
+    python benchmarks/bench_fewshot_retrieval.py --sizes 200 20000 --queries 50 --bm25
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+import numpy as np
+import pandas as pd
+import faiss
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def scaled_examples(examples_df, n):
+    copies = []
+    for c in range(n // len(examples_df) + 1):
+        df = examples_df.copy()
+        if c:
+            df["question"] = df["question"] + f" v{c}"
+        copies.append(df)
+    return pd.concat(copies, ignore_index=True).head(n)
+
+
+def unit_vectors(n, d, rng):
+    x = rng.standard_normal((n, d)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def legacy_fetch(user_question, faiss_index, examples_df, vec, bm25_model, top_k, exact_match_bonus, normalize):
+    """The pre-NumPy implementation (including its positional score write-back)."""
+    examples_df = examples_df.copy()
+    distances, _ = faiss_index.search(vec, len(examples_df))
+    examples_df['semantic_score'] = np.array(distances[0])
+    if bm25_model is not None:
+        examples_df['syntactic_score'] = bm25_model.get_scores(normalize(user_question).split())
+    else:
+        examples_df['syntactic_score'] = 0
+    candidates_df = pd.concat([
+        examples_df[examples_df['semantic_score'] >= 0.2],
+        examples_df[examples_df['syntactic_score'] > 0.5],
+    ]).drop_duplicates().reset_index(drop=True)
+    if candidates_df.empty:
+        return []
+    max_bm25 = candidates_df['syntactic_score'].max()
+    candidates_df['syntactic_score_norm'] = candidates_df['syntactic_score'] / (max_bm25 + 1e-8)
+    candidates_df['exact_bonus'] = candidates_df['question'].apply(lambda x: exact_match_bonus(user_question, x))
+    candidates_df['combined_score'] = (0.4 * candidates_df['semantic_score'] +
+                                       0.4 * candidates_df['syntactic_score_norm'] +
+                                       0.2 * candidates_df['exact_bonus'])
+    return list(candidates_df.sort_values("combined_score", ascending=False).head(top_k).index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 20000, 200000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--bm25", action="store_true", help="include BM25 scoring in both paths")
+    args = parser.parse_args()
+
+    from pipeline.modules.sparse_bm25 import SparseBM25
+    from pipeline.modules.fewshot_module import fetch_few_shots, exact_match_bonus, normalize, log
+    log.setLevel("WARNING")
+
+    rng = np.random.default_rng(0)
+    base = pd.read_csv(os.path.join(ROOT, "fewshot_example.csv"))
+    for n in args.sizes:
+        examples_df = scaled_examples(base, n)
+        vectors = unit_vectors(n, args.dim, rng)
+        index = faiss.IndexFlatIP(args.dim)
+        index.add(vectors)
+        bm25 = SparseBM25.from_documents(examples_df["question"]) if args.bm25 else None
+        tokenized = [] if bm25 is None else [[]]
+
+        questions = list(examples_df["question"].sample(args.queries, random_state=1, replace=True))
+        # queries near existing examples, so candidates pass the semantic threshold
+        query_vecs = vectors[rng.integers(0, n, args.queries)] + 0.05 * unit_vectors(args.queries, args.dim, rng)
+        faiss.normalize_L2(query_vecs)
+
+        start = time.perf_counter()
+        fetch_few_shots(questions[0], index, examples_df, None, bm25, tokenized, query_vec=query_vecs[0])
+        build_ms = (time.perf_counter() - start) * 1000
+
+        timings = {"legacy": [], "numpy": []}
+        for q, v in zip(questions, query_vecs):
+            v = v.reshape(1, -1)
+            start = time.perf_counter()
+            legacy_fetch(q, index, examples_df, v, bm25, 2, exact_match_bonus, normalize)
+            timings["legacy"].append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            fetch_few_shots(q, index, examples_df, None, bm25, tokenized, top_k=2, query_vec=v)
+            timings["numpy"].append((time.perf_counter() - start) * 1000)
+
+        line = f"n={n:<7d} first call (builds retriever) {build_ms:8.1f}ms"
+        for name, values in timings.items():
+            line += f"  {name}: p50={statistics.median(values):8.2f}ms p95={sorted(values)[int(len(values) * 0.95)]:8.2f}ms"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# bench_fewshot_tables.py
+"""
+Few-shot retrieval restricted to the selected tables vs the whole corpus, at
+growing corpus sizes.
+
+Synthetic corpus: --sizes examples whose SQL reads one or two of --tables
+tables (random unit vectors in a FAISS index of --index type, generated
+questions with SparseBM25), so no embedding model is needed. Each request picks
+the tables of a random example, as the intent stage would, and calls
+fetch_few_shots with and without them. For each size it reports:
+
+    p50/p95_ms  per-request latency (BM25 + semantic + fusion + top-k rows)
+    pool        mean number of examples scored
+    on_table    share of returned examples whose SQL reads a selected table
+
+Usage (from the repo root):
+    python benchmarks/bench_fewshot_tables.py
+    python benchmarks/bench_fewshot_tables.py --sizes 20000 200000 --tables 300 --index hnsw
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+import numpy as np
+import pandas as pd
+import faiss
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def build_corpus(n, n_tables, rng):
+    metrics = ["portfolio outstanding", "loan disbursement", "collection efficiency", "overdue amount", "active clients"]
+    dims = ["branch", "zone", "state", "area", "funder", "product"]
+    first = rng.integers(0, n_tables, n)
+    second = np.where(rng.random(n) < 0.3, rng.integers(0, n_tables, n), -1)
+    questions, queries = [], []
+    for i in range(n):
+        questions.append(f"What is the {metrics[i % 5]} by {dims[i % 6]} for {dims[(i // 6) % 6]} {i} in month {i % 12 + 1}?")
+        sql = f"SELECT {dims[i % 6]}_id, SUM(amount) FROM accessdetails.t_{first[i]}_1756049975215338"
+        if second[i] >= 0:
+            sql += f" JOIN accessdetails.t_{second[i]} USING ({dims[i % 6]}_id)"
+        queries.append(sql + " GROUP BY 1")
+    return pd.DataFrame({"question": questions, "query": queries})
+
+
+def build_index(kind, vectors):
+    d = vectors.shape[1]
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(d, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = 128
+    else:
+        index = faiss.IndexFlatIP(d)
+    index.add(vectors)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 20000, 200000])
+    parser.add_argument("--tables", type=int, default=300)
+    parser.add_argument("--index", default="flat", choices=("flat", "hnsw"))
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    from pipeline.modules.sparse_bm25 import SparseBM25
+    from pipeline.modules.fewshot_module import fetch_few_shots, sql_tables, log
+    log.setLevel("WARNING")
+
+    rng = np.random.default_rng(0)
+    print(f"{'n':>7s} {'mode':10s} {'p50_ms':>8s} {'p95_ms':>8s} {'pool':>8s} {'on_table':>8s}")
+    for n in args.sizes:
+        examples_df = build_corpus(n, args.tables, rng)
+        vectors = rng.standard_normal((n, args.dim)).astype("float32")
+        faiss.normalize_L2(vectors)
+        index = build_index(args.index, vectors)
+        bm25 = SparseBM25.from_documents(examples_df["question"])
+        example_tables = [set(sql_tables(sql)) for sql in examples_df["query"]]
+
+        picks = rng.integers(0, n, args.queries)
+        query_vecs = vectors[picks] + 0.05 * rng.standard_normal((args.queries, args.dim)).astype("float32")
+        faiss.normalize_L2(query_vecs)
+        fetch_few_shots(examples_df["question"][0], index, examples_df, None, bm25, query_vec=query_vecs[0])  # builds
+
+        for mode in ("all", "tables"):
+            timings, pools, on_table, returned = [], [], 0, 0
+            for pick, vec in zip(picks, query_vecs):
+                tables = sorted(example_tables[pick])
+                start = time.perf_counter()
+                result = fetch_few_shots(examples_df["question"][pick], index, examples_df, None, bm25, top_k=2,
+                                         query_vec=vec, tables=tables if mode == "tables" else None)
+                timings.append((time.perf_counter() - start) * 1000)
+                pools.append(result["table_candidates"] or n)
+                on_table += sum(bool(example_tables[i] & set(tables)) for i in result["matched_indices"])
+                returned += len(result["matched_indices"])
+            print(f"{n:7d} {mode:10s} {statistics.median(timings):8.2f} {sorted(timings)[int(len(timings) * 0.95)]:8.2f} "
+                  f"{statistics.mean(pools):8.0f} {on_table / max(returned, 1):8.2f}")
+
+
+if __name__ == "__main__":
+    main()
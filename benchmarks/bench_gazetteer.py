@@ -0,0 +1,135 @@
+# bench_gazetteer.py
+"""
+Location labelling per question: the previous per-name regex scan vs the
+compiled Gazetteer trie, against a large synthetic gazetteer.
+
+Builds --names location names spread over the LOCATION_MAP types (one to three
+words, some with branch-style "-2" suffixes) and --queries questions that
+mention zero to three of them, some already labelled ("state X"). Reports:
+
+    compile_ms   building the Gazetteer (once per load / refresh)
+    label        label_locations_in_query per question
+    entities     extract_entities on the labelled question
+    correct      share of questions labelled exactly as generated ("<type> <name>"
+                 for every mentioned name). With many names the legacy path also
+                 labels names that occur inside longer ones ("area zone X area Y").
+
+The legacy path is slow at this size; --legacy-queries limits how many
+questions it runs on.
+
+Usage (from the repo root):
+    python benchmarks/bench_gazetteer.py --names 50000
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SYLLABLES = ["ka", "ra", "na", "pur", "gar", "ab", "ad", "di", "ko", "lam", "va", "ti", "sha", "dhi", "man", "pal", "li", "ur", "bad", "ne"]
+
+
+def legacy_label(query, location_map):
+    """The pre-gazetteer label_locations_in_query (including detect_labeled_location)."""
+    found = set()
+    for loc_type, names in location_map.items():
+        pattern = re.compile(rf'\b{loc_type}\s+([\w\- ]+)\b', re.IGNORECASE)
+        for match in pattern.finditer(query):
+            labeled_name = match.group(1).strip().lower()
+            known_names = [n.lower() for n in names]
+            found.add((labeled_name, loc_type) if labeled_name in known_names else (labeled_name, "invalid"))
+    lowered_query = query.lower()
+    matches = [(name, loc_type) for loc_type, names in location_map.items() for name in names if name.lower() in lowered_query]
+    for name, loc_type in sorted(matches, key=lambda x: -len(x[0])):
+        if (name.lower(), loc_type) in found or (name.lower(), "invalid") in found:
+            continue
+        if re.compile(rf'\b{loc_type}\s+{re.escape(name)}\b', re.IGNORECASE).search(query):
+            continue
+        query = re.compile(rf'\b{re.escape(name)}\b', re.IGNORECASE).sub(f"{loc_type} {name}", query)
+    return query
+
+
+def legacy_entities(text, location_map):
+    lowered = text.lower()
+    return {(loc_type, name.lower()) for loc_type, names in location_map.items() for name in names
+            if re.search(rf'\b{re.escape(loc_type)}\s+{re.escape(name.lower())}\b', lowered)}
+
+
+def synthetic_locations(n, types, rng):
+    names, seen = {t: [] for t in types}, set()
+    while len(seen) < n:
+        words = ["".join(rng.choice(SYLLABLES, rng.integers(2, 4))).title() for _ in range(rng.integers(1, 4))]
+        loc_type = types[len(seen) % len(types)]
+        name = " ".join(words)
+        if loc_type == "branch":
+            name = f"{name.upper()}-{rng.integers(1, 5)}"
+        if name.lower() not in seen:
+            seen.add(name.lower())
+            names[loc_type].append(name)
+    return names
+
+
+def synthetic_queries(locations, n, rng):
+    pool = [(t, name) for t, names in locations.items() for name in names]
+    templates = ["total disbursement in {} for Month January 2025", "portfolio outstanding by branch for {} and {}",
+                 "overdue amount of {} last month", "active clients in {}, {} and {}", "collection efficiency this year"]
+    queries, expected = [], []
+    for i in range(n):
+        template = templates[i % len(templates)]
+        picks = [pool[j] for j in rng.integers(0, len(pool), template.count("{}"))]
+        queries.append(template.format(*[f"{t} {name}" if rng.random() < 0.3 else name for t, name in picks]))
+        expected.append(template.format(*[f"{t} {name}" for t, name in picks]))
+    return queries, expected
+
+
+def timed(fn, items):
+    timings, results = [], []
+    for item in items:
+        start = time.perf_counter()
+        results.append(fn(item))
+        timings.append((time.perf_counter() - start) * 1000)
+    return results, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--legacy-queries", type=int, default=50)
+    args = parser.parse_args()
+
+    from pipeline.modules.gazetteer import Gazetteer
+    from pipeline.modules.rephrase import LOCATION_MAP, label_locations_in_query, extract_entities
+
+    rng = np.random.default_rng(0)
+    locations = synthetic_locations(args.names, list(LOCATION_MAP), rng)
+    queries, expected = synthetic_queries(locations, args.queries, rng)
+
+    start = time.perf_counter()
+    gazetteer = Gazetteer(locations, "bench")
+    print(f"names={gazetteer.names} compile_ms={(time.perf_counter() - start) * 1000:.0f}")
+
+    labelled, label_ms = timed(lambda q: label_locations_in_query(q, gazetteer), queries)
+    _, entity_ms = timed(lambda q: extract_entities(q, gazetteer), labelled)
+    legacy_queries = queries[:args.legacy_queries]
+    legacy_labelled, legacy_label_ms = timed(lambda q: legacy_label(q, locations), legacy_queries)
+    _, legacy_entity_ms = timed(lambda q: legacy_entities(q, locations), legacy_labelled)
+
+    p = lambda values, q: sorted(values)[int(len(values) * q)]
+    correct = lambda results: sum(a == b for a, b in zip(results, expected)) / len(results)
+    print(f"{'path':8s} {'step':9s} {'p50_ms':>8s} {'p95_ms':>8s} {'queries':>8s} {'correct':>8s}")
+    for path, step, values, results in (("trie", "label", label_ms, labelled), ("trie", "entities", entity_ms, None),
+                                        ("legacy", "label", legacy_label_ms, legacy_labelled),
+                                        ("legacy", "entities", legacy_entity_ms, None)):
+        share = f"{correct(results):8.2f}" if results else f"{'-':>8s}"
+        print(f"{path:8s} {step:9s} {statistics.median(values):8.3f} {p(values, 0.95):8.3f} {len(values):8d} {share}")
+
+
+if __name__ == "__main__":
+    main()
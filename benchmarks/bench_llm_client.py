@@ -0,0 +1,117 @@
+# bench_llm_client.py
+"""
+Per-call client overhead of call_llm, before vs after the model registry.
+
+A local stub of the Gemini REST API (generateContent / countTokens) answers
+instantly, so the measured latency is client-side work plus one loopback round
+trip -- no network or model time:
+
+    fresh   genai.GenerativeModel(...) built per call (old call_llm behaviour)
+    pooled  handle from llm_utils.model_registry (one per model name)
+    async   acall_llm awaited from an event loop (same registry + retry path)
+
+Usage (from the repo root):
+    python benchmarks/bench_llm_client.py --calls 300
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STUB_REPLY = {
+    "candidates": [{"content": {"parts": [{"text": "SELECT 1"}], "role": "model"},
+                    "finishReason": "STOP", "index": 0}],
+    "usageMetadata": {"promptTokenCount": 5, "candidatesTokenCount": 2, "totalTokenCount": 7},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is visible
+
+    def setup(self):
+        super().setup()
+        # headers and body go out in separate writes; without this Nagle adds ~40ms per call
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = {"totalTokens": 1} if self.path.endswith(":countTokens") else STUB_REPLY
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def summarize(name, samples):
+    samples = sorted(samples)
+    print(f"{name:8s} mean={statistics.mean(samples) * 1000:7.3f}ms  "
+          f"p50={samples[len(samples) // 2] * 1000:7.3f}ms  "
+          f"p95={samples[int(len(samples) * 0.95)] * 1000:7.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--model", default="gemini-flash-latest")
+    args = parser.parse_args()
+
+    server = start_stub()
+    import google.generativeai as genai
+    from pipeline.modules import llm_utils
+
+    genai.configure(api_key="stub", transport="rest",
+                    client_options={"api_endpoint": f"http://127.0.0.1:{server.server_port}"})
+    llm_utils.model_registry.clear()
+    llm_utils.model_registry.warmup([args.model])
+
+    def fresh_call():
+        model = genai.GenerativeModel(args.model)
+        return model.generate_content("ping").text
+
+    def pooled_call():
+        return llm_utils.model_registry.get(args.model).generate_content("ping").text
+
+    async def async_calls(n):
+        samples = []
+        for _ in range(n):
+            start = time.perf_counter()
+            await llm_utils.acall_llm("bench", "ping", model_name=args.model)
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    for name, fn in (("fresh", fresh_call), ("pooled", pooled_call)):
+        fn()  # first call pays lazy imports / connection setup
+        samples = []
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+        summarize(name, samples)
+
+    summarize("async", asyncio.run(async_calls(args.calls)))
+    print(json.dumps(llm_utils.model_registry.stats()))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
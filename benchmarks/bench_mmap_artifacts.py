@@ -0,0 +1,133 @@
+# bench_mmap_artifacts.py
+"""
+Private copies vs memory-mapped few-shot artifacts across worker processes.
+
+Builds a synthetic few-shot corpus of --examples rows (random unit vectors,
+generated questions/SQL) with FewShotIndex.sync into a temp directory, then
+starts --workers processes that each load it and run --queries retrievals:
+
+    copy   FewShotIndex(mmap=False).load(): the generation's FAISS index and .npy arrays read into memory
+    mmap   FewShotIndex(mmap=True).load():  the same files, FAISS IO_FLAG_MMAP_IFC + .npy mmap_mode="r"
+
+With all workers still alive it reports:
+
+    load_s      per-worker load time (mean)
+    rss_mb      per-worker resident memory (mean; counts shared pages in full)
+    uss_mb      per-worker private memory (mean)
+    pss_sum_mb  host total: shared pages divided among the processes mapping them
+
+Usage (from the repo root):
+    python benchmarks/bench_mmap_artifacts.py --examples 200000 --workers 1 4 8
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+import pandas as pd
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKER = r"""
+import json, sys, time
+import numpy as np
+from pipeline.modules.fewshot_index import FewShotIndex
+from pipeline.modules.fewshot_module import few_shot_retriever
+from pipeline.modules.fewshot_store import process_memory
+paths, mmap, queries = json.loads(sys.argv[1]), sys.argv[2] == "mmap", int(sys.argv[3])
+start = time.perf_counter()
+state = FewShotIndex(**paths, mmap=mmap).load()
+few_shot_retriever.ensure_built(state.examples_df, state.faiss_index)
+load_s = time.perf_counter() - start
+rng = np.random.default_rng()
+for i in range(queries):
+    vec = rng.standard_normal((1, state.faiss_index.d)).astype("float32")
+    vec /= np.linalg.norm(vec)
+    ids, *_ = few_shot_retriever.search(f"total loan disbursement for branch {i} by zone", vec, state.bm25, top_k=2)
+    state.examples_df.iloc[ids]
+print(json.dumps({"load_s": load_s, **process_memory()}), flush=True)
+sys.stdin.readline()
+"""
+
+
+class RandomEmbedder:
+    """Unit vectors in place of the model: the benchmark measures memory, not relevance."""
+    model_name = "bench-random"
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.rng = np.random.default_rng(0)
+
+    def embed_batch(self, texts, batch_size=64, use_cache=True):
+        x = self.rng.standard_normal((len(texts), self.dim)).astype("float32")
+        return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def build_corpus(directory, n, dim):
+    from pipeline.modules.fewshot_index import FewShotIndex
+    rng = np.random.default_rng(0)
+    metrics = ["portfolio outstanding", "loan disbursement", "collection efficiency", "overdue amount", "active clients"]
+    dims = ["branch", "zone", "state", "area", "funder", "product"]
+    df = pd.DataFrame({
+        "question": [f"What is the {metrics[i % 5]} by {dims[i % 6]} for {dims[(i // 6) % 6]} {i} in month {i % 12 + 1}?" for i in range(n)],
+        "query": [f"SELECT {dims[i % 6]}_id, SUM(amount_{i % 40}) FROM accessdetails.t_{int(rng.integers(0, 300))} "
+                  f"WHERE {dims[(i // 6) % 6]}_id = '{i}' GROUP BY 1" for i in range(n)],
+    })
+    paths = {"csv_path": os.path.join(directory, "fewshot_example.csv"),
+             "faiss_path": os.path.join(directory, "fewshot.faiss"),
+             "bm25_path": os.path.join(directory, "fewshot_bm25.npz"),
+             "manifest_path": os.path.join(directory, "fewshot_manifest.json"),
+             "store_dir": os.path.join(directory, "fewshot_store")}
+    df.to_csv(paths["csv_path"], index=False)
+    FewShotIndex(**paths).sync(RandomEmbedder(dim))
+    return paths
+
+
+def run(paths, mode, n_workers, queries):
+    workers = [subprocess.Popen([sys.executable, "-c", WORKER, json.dumps(paths), mode, str(queries)], cwd=ROOT,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+               for _ in range(n_workers)]
+    try:
+        results = [json.loads(w.stdout.readline()) for w in workers]
+        pss = sum(getattr(psutil.Process(w.pid).memory_full_info(), "pss", 0) for w in workers) / 2 ** 20
+    finally:
+        for w in workers:
+            w.stdin.close()
+            w.wait()
+    mean = lambda key: float(np.mean([r[key] for r in results]))
+    return {"load_s": mean("load_s"), "rss_mb": mean("rss_mb"), "uss_mb": mean("uss_mb"), "pss_sum_mb": pss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--examples", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        paths = build_corpus(directory, args.examples, args.dim)
+        print(f"built {args.examples} examples in {time.perf_counter() - start:.1f}s "
+              f"(generation {sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(paths['store_dir']) for f in files) / 2 ** 20:.0f} MB, "
+              f"of which faiss {os.path.getsize(paths['faiss_path']) / 2 ** 20:.0f} MB)")
+        print(f"{'mode':6s} {'workers':>7s} {'load_s':>7s} {'rss_mb':>8s} {'uss_mb':>8s} {'pss_sum_mb':>10s}")
+        for n_workers in args.workers:
+            for mode in ("copy", "mmap"):
+                r = run(paths, mode, n_workers, args.queries)
+                print(f"{mode:6s} {n_workers:7d} {r['load_s']:7.2f} {r['rss_mb']:8.0f} {r['uss_mb']:8.0f} {r['pss_sum_mb']:10.0f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
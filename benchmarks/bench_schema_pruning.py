@@ -0,0 +1,112 @@
+# bench_schema_pruning.py
+"""
+Full vs retrieval-pruned schema in the intent and column prompts.
+
+The real catalog (crs_tables.csv / crs_columns.csv) is replicated up to --tables
+tables so the numbers reflect the catalog size we are heading for. For each few-shot
+question it reports:
+
+    tokens      intent + column prompt tokens (token_counter)
+    build_ms    prompt assembly time, including schema retrieval for "pruned"
+    llm_s       (--llm only) intent + column Gemini round trips
+
+Usage (from the repo root):
+    python benchmarks/bench_schema_pruning.py --tables 300
+    python benchmarks/bench_schema_pruning.py --tables 300 --llm --questions 5
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def scaled_catalog(tables_reference, columns_reference, n_tables):
+    """Copies of the real tables (renamed _v1, _v2, ...) until there are n_tables."""
+    tables, columns = [tables_reference], [columns_reference]
+    copy = 1
+    while sum(len(t) for t in tables) < n_tables:
+        t = tables_reference.copy()
+        c = columns_reference.copy()
+        t["Table_names"] = t["Table_names"] + f"_v{copy}"
+        t["Table_description"] = f"(archive copy {copy}) " + t["Table_description"].fillna("")
+        c["Table_name"] = c["Table_name"] + f"_v{copy}"
+        tables.append(t)
+        columns.append(c)
+        copy += 1
+    tables = pd.concat(tables, ignore_index=True).head(n_tables)
+    columns = pd.concat(columns, ignore_index=True)
+    columns = columns[columns["Table_name"].isin(tables["Table_names"])].reset_index(drop=True)
+    return tables, columns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, default=300)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--model", default="gemini-flash-latest")
+    parser.add_argument("--llm", action="store_true", help="also time real intent/column Gemini calls")
+    args = parser.parse_args()
+
+    from pipeline.modules.reference_catalog import ReferenceCatalog, COLUMN_PROMPT_DROP
+    from pipeline.modules.prompt_loader import load_prompt
+    from pipeline.modules.token_counter import count_tokens
+    from pipeline.modules.fewshot_module import normalize
+    from pipeline.modules.embedder import Embedder
+    from pipeline.modules.schema_retriever import schema_retriever
+    from pipeline.modules import llm_utils
+
+    catalog = ReferenceCatalog.load()
+    columns_reference, tables_reference = catalog.columns_reference, catalog.tables_reference
+    tables_reference, columns_reference = scaled_catalog(tables_reference, columns_reference, args.tables)
+    questions = list(pd.read_csv(os.path.join(ROOT, "fewshot_example.csv"))["question"].head(args.questions))
+    embedder = Embedder()
+
+    start = time.perf_counter()
+    schema_retriever.ensure_built(tables_reference, columns_reference, embedder)
+    print(f"catalog: {len(tables_reference)} tables, {len(columns_reference)} columns "
+          f"(index build {time.perf_counter() - start:.2f}s)")
+    llm_utils.llm_response_cache.enabled = False
+
+    results = {"full": [], "pruned": []}
+    for q in questions:
+        for mode in results:
+            start = time.perf_counter()
+            tables, columns = tables_reference, columns_reference
+            if mode == "pruned":
+                vec = embedder.embed_batch([normalize(q)])[0]
+                tables = schema_retriever.prune_tables(q, vec, tables_reference, columns_reference)
+            intent_prompt = load_prompt("intent.yml", rephrased_question=q, tables_reference=tables.to_csv(index=False))
+            if mode == "pruned":
+                # stand-in for the intent result: every retrieved table
+                columns = schema_retriever.prune_columns(q, vec, columns_reference, list(tables["Table_names"]))
+            column_prompt = load_prompt("column.yml", rephrased_question=q, intent_result="{}",
+                                        columns_reference=columns.drop(columns=COLUMN_PROMPT_DROP).to_csv(index=False))
+            build = time.perf_counter() - start
+
+            row = {
+                "tokens": count_tokens(intent_prompt, args.model) + count_tokens(column_prompt, args.model),
+                "build_ms": build * 1000,
+            }
+            if args.llm:
+                start = time.perf_counter()
+                llm_utils.call_llm("bench_intent", intent_prompt, model_name=args.model)
+                llm_utils.call_llm("bench_columns", column_prompt, model_name=args.model)
+                row["llm_s"] = time.perf_counter() - start
+            results[mode].append(row)
+
+    for mode, rows in results.items():
+        line = f"{mode:7s}"
+        for key in rows[0]:
+            values = [r[key] for r in rows]
+            line += f"  {key}: mean={statistics.mean(values):10.1f} p95={sorted(values)[int(len(values) * 0.95)]:10.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
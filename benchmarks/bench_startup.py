@@ -0,0 +1,67 @@
+# bench_startup.py
+"""
+Cold vs warm start of the pipeline, in seconds.
+
+Each run is a fresh interpreter (so torch/model/file caches inside the process do
+not leak between runs) that imports pipeline.pipeline and waits for readiness:
+
+    import_s  time until `import pipeline.pipeline` returns (app can start serving)
+    ready_s   time until every resource is loaded (/health/ready turns 200)
+
+"cold" deletes the startup snapshot before every run, "warm" keeps it.
+
+Usage (from the repo root):
+    python benchmarks/bench_startup.py --runs 3
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import pipeline.pipeline as p
+t1 = time.perf_counter()
+p.resources.wait_ready()
+t2 = time.perf_counter()
+status = p.resources.status()
+print(json.dumps({"import_s": t1 - t0, "ready_s": t2 - t0,
+                  "from_snapshot": status["from_snapshot"], "timings": status["timings"]}))
+"""
+
+
+def run_once(env):
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    from pipeline.utils.startup import SNAPSHOT_NAME
+    from pipeline.utils.cache_manager import CacheManager
+    snapshot_path = CacheManager().get_cache_path(SNAPSHOT_NAME)
+    env = dict(os.environ, PIPELINE_STARTUP="background", STARTUP_SNAPSHOT="1")
+
+    for mode in ("cold", "warm"):
+        results = []
+        for _ in range(args.runs):
+            if mode == "cold" and os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+            results.append(run_once(env))
+        print(f"{mode:5s}  import_s median={statistics.median(r['import_s'] for r in results):.3f}  "
+              f"ready_s median={statistics.median(r['ready_s'] for r in results):.3f}  "
+              f"from_snapshot={results[-1]['from_snapshot']}  timings={results[-1]['timings']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+#routes.py
+from flask import Blueprint, jsonify
+from pipeline.utils.startup import resources
+
+health_bp = Blueprint("health", __name__, url_prefix="/health")
+
+@health_bp.route("/live", methods=["GET"])
+def live():
+    """
+    Process is up and serving HTTP.
+    """
+    return jsonify({"live": True})
+
+@health_bp.route("/ready", methods=["GET"])
+def ready():
+    """
+    200 once references, few-shot indexes and the embedder are loaded, 503 while
+    they are still loading (load balancers should wait for this).
+    """
+    status = resources.status()
+    return jsonify(status), (200 if status["ready"] else 503)
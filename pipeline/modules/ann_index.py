@@ -0,0 +1,112 @@
+# ann_index.py
+import os
+import math
+import logging
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Few-shot vector index type and its knobs. Build parameters are fixed when the
+# index is built; efSearch / nprobe are search-time and can be changed on load.
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+FEWSHOT_INDEX_TYPE = os.getenv("FEWSHOT_INDEX_TYPE", "flat")
+DEFAULT_PARAMS = {
+    "flat": {"build": {}, "search": {}},
+    "hnsw": {
+        "build": {"M": int(os.getenv("FEWSHOT_HNSW_M", "32")),
+                  "efConstruction": int(os.getenv("FEWSHOT_HNSW_EF_CONSTRUCTION", "200"))},
+        "search": {"efSearch": int(os.getenv("FEWSHOT_HNSW_EF_SEARCH", "128"))},
+    },
+    "ivfpq": {
+        # nlist 0 = about 4 * sqrt(n); pq_m must divide the embedding dimension
+        "build": {"nlist": int(os.getenv("FEWSHOT_IVF_NLIST", "0")),
+                  "pq_m": int(os.getenv("FEWSHOT_PQ_M", "48")),
+                  "pq_nbits": int(os.getenv("FEWSHOT_PQ_NBITS", "8"))},
+        "search": {"nprobe": int(os.getenv("FEWSHOT_IVF_NPROBE", "16"))},
+    },
+}
+# Training points per IVF list faiss wants; fewer lists are used on small corpora
+MIN_POINTS_PER_LIST = 39
+
+
+def index_spec(index_type: str = None, build: dict = None, search: dict = None) -> dict:
+    """{"type", "build", "search"}: defaults for the type, overridden by the given params."""
+    index_type = (index_type or FEWSHOT_INDEX_TYPE).lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+    defaults = DEFAULT_PARAMS[index_type]
+    return {
+        "type": index_type,
+        "build": {**defaults["build"], **(build or {})},
+        "search": {**defaults["search"], **(search or {})},
+    }
+
+
+def build_index(vectors, spec: dict = None):
+    """
+    Inner-product index over L2-normalized vectors -> (index, spec actually built).
+    A corpus too small to train IVF-PQ falls back to flat.
+    """
+    spec = spec or index_spec()
+    n, d = vectors.shape
+    kind, build = spec["type"], dict(spec["build"])
+
+    if kind == "ivfpq":
+        # PQ trains 2**pq_nbits centroids per sub-quantizer on the same points
+        if n < MIN_POINTS_PER_LIST * 2 ** build["pq_nbits"]:
+            logger.warning("[ANN] %d vectors are too few to train IVF-PQ; building a flat index", n)
+            return build_index(vectors, index_spec("flat"))
+        if d % build["pq_m"]:
+            raise ValueError(f"pq_m={build['pq_m']} does not divide the embedding dimension {d}")
+        nlist = build["nlist"] or int(4 * math.sqrt(n))
+        build["nlist"] = max(1, min(nlist, n // MIN_POINTS_PER_LIST))
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFPQ(quantizer, d, build["nlist"], build["pq_m"], build["pq_nbits"], faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(d, build["M"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = build["efConstruction"]
+    else:
+        index = faiss.IndexFlatIP(d)
+
+    index.add(vectors)
+    spec = {"type": kind, "build": build, "search": dict(spec["search"])}
+    apply_search_params(index, spec)
+    return index, spec
+
+
+def apply_search_params(index, spec: dict):
+    """Set efSearch / nprobe from spec["search"] on a built or loaded index."""
+    params = faiss.ParameterSpace()
+    for name, value in (spec or {}).get("search", {}).items():
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError as e:
+            logger.warning("[ANN] Cannot set %s=%s on %s: %s", name, value, type(index).__name__, e)
+    return index
+
+
+def filtered_search_params(index, ids):
+    """SearchParameters restricting a search to `ids`, keeping the index's efSearch / nprobe."""
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype=np.int64))
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def index_type_of(index) -> str:
+    """Spec type of a loaded faiss index (for indexes written before manifests recorded it)."""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    return "flat"
+
+
+def index_memory_bytes(index) -> int:
+    """Serialized size: vectors/codes plus graph or inverted lists."""
+    return int(faiss.serialize_index(index).nbytes)
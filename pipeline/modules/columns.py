@@ -2,38 +2,37 @@
 
 import json
 import re
-from datetime import datetime
 import pandas as pd
-from pipeline.modules.llm_utils import call_llm   # centralized LLM wrapper
-from pipeline.modules.prompt_loader import load_prompt
-from pipeline.modules.load_references import load_references
+from pipeline.modules.llm_utils import call_llm, discard_cached_response   # centralized LLM wrapper
+from pipeline.modules.prompt_loader import load_prompt_suffix, prompt_timestamp
+from pipeline.utils.prompt_prefix import prompt_prefixes
 
 
-# Load reference data once
-metrics_reference, columns_reference, tables_reference= load_references()
-
-
-def identify_columns(rephrased_question, intent_result, columns_reference, model="gemini-flash-latest"):
+def identify_columns(rephrased_question, intent_result, columns_reference, model="gemini-flash-latest", deadline=None, columns_csv=None):
     """
     Identify the intent, metrics, keywords, locations, and time frame from a user question
     using the Gemini model and the YAML-based prompt template.
     Token counting + logging is handled centrally inside call_llm.
+    columns_csv: prompt columns already rendered (ReferenceCatalog.columns_prompt_csv).
     """
     print("Inside column intent****************")
-    # Build full prompt directly via load_prompt
+    # Static prefix (system + columns CSV) is rendered once per loaded columns_reference
     
     # columns_reference = columns_reference.drop(columns=['id','Column_Confidential_Subclass','Table_name'])  # today_change
-    columns_reference = columns_reference.copy().drop(columns=['id','Column_Confidential_Subclass','Table_name'])
+    prefix = prompt_prefixes.render(
+        "column.yml",
+        sources=(columns_reference,),
+        build=lambda: {"columns_reference": columns_csv if columns_csv is not None else columns_reference.drop(columns=['id','Column_Confidential_Subclass','Table_name']).to_csv(index=False)}
+    )
     
     # Pass new format into prompt
-    full_prompt = load_prompt(
+    full_prompt = load_prompt_suffix(
         "column.yml",
         rephrased_question=rephrased_question,
         #metrics_reference=metrics_package,
         #tables_reference=tables_reference,
         intent_result=intent_result,
-        columns_reference=columns_reference.to_csv(index=False),
-        current_date_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        current_date_time=prompt_timestamp()
     )
 
     #print("full_prompt*****************:", full_prompt)
@@ -43,7 +42,9 @@ def identify_columns(rephrased_question, intent_result, columns_reference, model
         step_name="identify_columns",
         prompt=full_prompt,
         model_name=model,
-        response_format="text"
+        response_format="text",
+        deadline=deadline,
+        prefix=prefix
     )  
 
     # Clean JSON (strip Markdown fencing if model added it)
@@ -52,6 +53,7 @@ def identify_columns(rephrased_question, intent_result, columns_reference, model
     try:
         result = json.loads(cleaned)
     except json.JSONDecodeError:
+        discard_cached_response("identify_columns", full_prompt, model, prefix)  # don't replay a bad answer
         raise ValueError(f"Invalid JSON from model:\n{column_result}")
     
     return result, intent_usage
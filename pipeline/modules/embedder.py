@@ -83,71 +83,149 @@
 
 # embedder.py
 import os
+import hashlib
 import numpy as np
-import pandas as pd
 import faiss
-import pickle
-import time
-from rank_bm25 import BM25Okapi
-from sentence_transformers import SentenceTransformer
+import threading
+from collections import OrderedDict
 from pipeline.utils.cache_manager import CacheManager
+from pipeline.modules.ann_index import index_spec, build_index
 
 cache = CacheManager()
 
+# Query embeddings kept in memory (per Embedder); 0 disables the cache
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+# "torch" (SentenceTransformer), "onnx" (exported / int8 model, see onnx_encoder.py)
+# or "socket" (the shared per-host sidecar, see embedding_server.py)
+EMBEDDER_BACKEND = os.getenv("EMBEDDER_BACKEND", "torch")
+EMBEDDER_BACKENDS = ("torch", "onnx", "socket")
+
 # ---- Flexible Embedder using Hugging Face ----
 class Embedder:
     """
     Drop-in replacement for OpenAI Embedder using Hugging Face SentenceTransformer.
     Interface stays the same for embedding_creation.
+
+    Vectors of recently embedded texts are kept in a bounded LRU keyed by the
+    text with whitespace collapsed (callers pass fewshot_module.normalize()d
+    text, so repeated questions and their case/punctuation variants hit it).
+
+    backend="onnx" runs the ONNX export of the same model on onnxruntime instead
+    of torch; model_name is unchanged so existing indexes stay valid.
+    backend="socket" sends encodes to the embedding sidecar, so N worker
+    processes share one model (the local LRU still answers repeats).
     """
-    def __init__(self, model_name="all-MiniLM-L6-v2", device=None):
-        self.model = SentenceTransformer(model_name, device=device)
+    def __init__(self, model_name="all-MiniLM-L6-v2", device=None, cache_size: int = EMBEDDING_CACHE_SIZE,
+                 backend: str = None):
+        self.backend = (backend or EMBEDDER_BACKEND).lower()
+        if self.backend not in EMBEDDER_BACKENDS:
+            raise ValueError(f"Unknown embedder backend {self.backend!r}; expected one of {EMBEDDER_BACKENDS}")
+        self.model_name = model_name
+        if self.backend == "socket":
+            from pipeline.modules.embedding_server import EmbeddingClient
+            self.model = EmbeddingClient()
+            served = self.model.info.get("model")
+            if served != model_name:
+                raise ValueError(f"Embedding server runs {served!r}, not {model_name!r}")
+        elif self.backend == "onnx":
+            from pipeline.modules.onnx_encoder import OnnxEncoder
+            self.model = OnnxEncoder()
+            exported = self.model.manifest.get("model")
+            if exported and exported != model_name:
+                raise ValueError(f"ONNX export is of {exported!r}, not {model_name!r}; re-export it")
+        else:
+            # Imported here: sentence_transformers pulls in torch, which dominates import time
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(model_name, device=device)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()     # text -> read-only (dim,) float32 vector
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.encode_calls = 0
 
     def embed(self, query: str):
         """
         Return normalized embedding vector as list (compatible with FAISS)
         """
-        emb = self.model.encode(query, convert_to_numpy=True)
-        emb = emb.astype("float32")
-        emb /= np.linalg.norm(emb) + 1e-10
-        return emb.tolist()
-
-
-# ---- Embedding wrapper ----
-def _embed(query, embedder):
-    return embedder.embed(query)
+        return self.embed_batch([query])[0].tolist()
 
+    def _encode(self, texts, batch_size):
+        embs = self.model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+        embs = np.ascontiguousarray(embs, dtype="float32").reshape(len(texts), -1)
+        embs /= np.linalg.norm(embs, axis=1, keepdims=True) + 1e-10
+        self.encode_calls += 1
+        return embs
 
-def embedding_creation(df_summ, embedding_column_name: str, output_name: str, embedder):
+    def embed_batch(self, texts, batch_size: int = 64, use_cache: bool = True):
+        """
+        Encode many texts in one model call (only the ones not in the cache).
+        Returns an (n, dim) float32 matrix with L2-normalized rows (FAISS-ready).
+        use_cache=False for corpus builds, which would only flush the query cache.
+        """
+        texts = list(texts)
+        if not use_cache or self.cache_size <= 0:
+            return self._encode(texts, batch_size) if texts else np.empty((0, 0), dtype="float32")
+
+        keys = [" ".join(str(t).split()) for t in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                vec = self._cache.get(key)
+                if vec is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = vec
+        missing = list(dict.fromkeys(k for k in keys if k not in found))
+        if missing:
+            embs = self._encode(missing, batch_size)
+            embs.flags.writeable = False
+            with self._lock:
+                for key, vec in zip(missing, embs):
+                    found[key] = self._cache[key] = vec
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if not keys:
+            return np.empty((0, 0), dtype="float32")
+        return np.stack([found[k] for k in keys])
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "backend": self.backend,
+                "cache_size": len(self._cache),
+                "cache_max": self.cache_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "encode_calls": self.encode_calls,
+            }
+
+
+def embedding_creation(df_summ, embedding_column_name: str, output_name: str, embedder, index_type: str = None):
     """
     Create (or load from cache) FAISS index for given DataFrame and column.
+    index_type: "flat" | "hnsw" | "ivfpq" (default FEWSHOT_INDEX_TYPE, see ann_index.py).
     """
-    cache_key = f"faiss_{os.path.basename(output_name)}"
+    spec = index_spec(index_type)
+    # Keyed on the content too: a basename-only key served a stale index after the CSV changed
+    content = hashlib.sha1("\x1f".join(map(str, df_summ[embedding_column_name])).encode("utf-8")).hexdigest()[:12]
+    cache_key = f"faiss_{os.path.basename(output_name)}_{spec['type']}_{content}"
     cached_index = cache.load(cache_key)
     if cached_index is not None:
         print(f"✅ Loaded FAISS index from cache for {output_name}")
         return cached_index
 
-    embeddings_list_chunks = []
-    for index, row in df_summ.iterrows():
-        Column_chunk = row[embedding_column_name]
-        try:
-            embeddings_chunk = _embed(Column_chunk, embedder)
-            embeddings_list_chunks.append(embeddings_chunk)
-        except Exception as e:
-            print(f'error {e} at {index}, retrying in 10s...')
-            time.sleep(10)
-            embeddings_chunk = _embed(Column_chunk, embedder)
-            embeddings_list_chunks.append(embeddings_chunk)
-
-        print(f'{index} embedding created')
+    # One batched encode of the whole column (rows come back L2-normalized)
+    array_chunk = embedder.embed_batch(df_summ[embedding_column_name].astype(str).tolist(), use_cache=False)
+    print(f'{len(array_chunk)} embeddings created')
 
     # Convert to FAISS index
-    dimension = len(embeddings_list_chunks[0])
-    array_chunk = np.asarray(embeddings_list_chunks).astype(np.float32)
-    faiss.normalize_L2(array_chunk)
-    index_1 = faiss.IndexFlatIP(dimension)
-    index_1.add(array_chunk)
+    index_1, spec = build_index(array_chunk, spec)
 
     # Save FAISS to disk and cache
     output = f'{output_name}.faiss'
@@ -163,18 +241,20 @@ def embedding_creation(df_summ, embedding_column_name: str, output_name: str, em
 def create_sparse_model(documents: list, bm25_model_name: str):
     """
     Create (or load from cache) BM25 model for given list of documents.
+    Saved as a SparseBM25 .npz; documents are tokenized with sparse_bm25.tokenize,
+    the same tokenizer applied to queries.
     """
-    cache_key = f"bm25_{os.path.basename(bm25_model_name)}"
+    from pipeline.modules.sparse_bm25 import SparseBM25  # imports fewshot_module, which imports this module
+
+    content = hashlib.sha1("\x1f".join(map(str, documents)).encode("utf-8")).hexdigest()[:12]
+    cache_key = f"bm25_{os.path.basename(bm25_model_name)}_{content}"
     cached_bm25 = cache.load(cache_key)
     if cached_bm25 is not None:
         print(f"✅ Loaded BM25 model from cache for {bm25_model_name}")
         return cached_bm25
 
-    tokenized_docs = [doc.split(" ") for doc in documents]
-    bm25 = BM25Okapi(tokenized_docs)
-    os.makedirs(os.path.dirname(bm25_model_name), exist_ok=True)
-    with open(bm25_model_name, 'wb') as f:
-        pickle.dump(bm25, f)
+    bm25 = SparseBM25.from_documents(documents)
+    bm25.save(bm25_model_name)
     cache.save(cache_key, bm25)
 
     print(f"✅ Saved BM25 model at {bm25_model_name} and cached in memory.")
@@ -183,11 +263,9 @@ def create_sparse_model(documents: list, bm25_model_name: str):
 
 # ---- Run pipeline ----
 if __name__ == "__main__":
-    df_few_shots = pd.read_csv(r"C:\Users\akash\Desktop\Projects\crs_genai\fewshot_example.csv")
-    print("Columns:", df_few_shots.columns)
+    # Few-shot FAISS + BM25 are maintained incrementally (only new rows are embedded)
+    from pipeline.modules.fewshot_index import fewshot_index
 
     embedder = Embedder(model_name="all-MiniLM-L6-v2")  # Hugging Face embeddings
-
-    # 🚀 Cached FAISS + BM25 creation
-    embedding_creation(df_few_shots, "question", r"embeddings/fewshot_embeddings", embedder)
-    create_sparse_model(df_few_shots["question"].to_list(), r"pickles/sysntactic_model_few_shot.pkl")
+    state = fewshot_index.sync(embedder)
+    print(f"✅ Few-shot index up to date: {len(state.hashes)} examples")
@@ -0,0 +1,342 @@
+# embedding_server.py
+import os
+import json
+import stat
+import time
+import errno
+import queue
+import struct
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# One embedding process per host, shared by every pipeline worker (EMBEDDER_BACKEND=socket)
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET", "/tmp/crs_embedder.sock")
+EMBEDDING_SOCKET_TIMEOUT = float(os.getenv("EMBEDDING_SOCKET_TIMEOUT", "30"))
+# How long a starting worker waits for the sidecar to come up
+EMBEDDING_SOCKET_CONNECT_TIMEOUT = float(os.getenv("EMBEDDING_SOCKET_CONNECT_TIMEOUT", "60"))
+# Pending connections the sidecar's listen() queue holds; every worker thread
+# connects once, so it has to cover a full restart of all workers
+EMBEDDING_SOCKET_BACKLOG = int(os.getenv("EMBEDDING_SOCKET_BACKLOG", "128"))
+# Server side: texts per model call, and how long to hold a batch open for more
+# requests (0 = take only what queued up while the previous batch ran)
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "0"))
+
+_HEADER = struct.Struct("!II")  # JSON metadata length, raw payload length
+
+
+# ---------------- Framing: header, JSON metadata, raw float32 payload ----------------
+def _send(sock, meta: dict, data: bytes = b""):
+    body = json.dumps(meta).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body), len(data)) + body + data)
+
+
+def _recv_exact(sock, n: int):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        read = sock.recv_into(view[got:])
+        if not read:
+            return None
+        got += read
+    return buf
+
+
+def _recv(sock):
+    """-> (meta, payload bytearray), or None when the peer closed the connection."""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    meta_len, data_len = _HEADER.unpack(header)
+    meta = _recv_exact(sock, meta_len)
+    data = _recv_exact(sock, data_len) if data_len else bytearray()
+    if meta is None or data is None:
+        return None
+    return json.loads(meta.decode("utf-8")), data
+
+
+# ---------------- Server ----------------
+class MicroBatcher:
+    """
+    Merges concurrent embed requests into one embed_batch call.
+
+    A single thread owns the model: it takes the first queued request, adds
+    every request that is already waiting (and, with max_wait_ms, whatever
+    arrives within that window) up to max_batch texts, encodes them together
+    and resolves each request's Future with its slice of the result.
+    """
+    def __init__(self, embedder, max_batch: int = EMBEDDING_MAX_BATCH, max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS):
+        self.embedder = embedder
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self.largest_batch = 0
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts) -> Future:
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+
+    def _gather(self, first):
+        items, size = [first], len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            items.append(item)
+            size += len(item[0])
+        return items
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            items = self._gather(first)
+            texts = [t for item_texts, _ in items for t in item_texts]
+            try:
+                vectors = self.embedder.embed_batch(texts, batch_size=self.max_batch)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for item_texts, future in items:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+            with self._lock:
+                self.requests += len(items)
+                self.batches += 1
+                self.texts += len(texts)
+                self.largest_batch = max(self.largest_batch, len(texts))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "texts": self.texts,
+                "mean_batch": round(self.texts / self.batches, 2) if self.batches else None,
+                "largest_batch": self.largest_batch,
+                "queued": self._queue.qsize(),
+            }
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        batcher = self.server.batcher
+        while True:
+            try:
+                message = _recv(self.request)
+            except OSError:
+                return
+            if message is None:
+                return
+            meta, _ = message
+            try:
+                if meta.get("op") == "stats":
+                    _send(self.request, {**batcher.embedder.stats(), "batcher": batcher.stats()})
+                    continue
+                vectors = batcher.submit(meta["texts"]).result()
+                vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+                _send(self.request, {"shape": list(vectors.shape)}, vectors.tobytes())
+            except OSError:
+                return
+            except Exception as e:
+                logger.exception("[EmbeddingServer] Request failed")
+                _send(self.request, {"error": f"{type(e).__name__}: {e}"})
+
+
+def _remove_stale_socket(path):
+    """
+    Remove the socket file of a previous run that is no longer served. Raises
+    if a server still answers on it, or if the path is not a socket.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(errno.EEXIST, "not a socket, refusing to replace it", path)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe.settimeout(1.0)
+    try:
+        probe.connect(path)
+        alive = True
+    except ConnectionRefusedError:
+        alive = False  # nobody listening: left over from a run that died
+    except (BlockingIOError, socket.timeout):
+        alive = True   # listening, accept queue full
+    finally:
+        probe.close()
+    if alive:
+        raise OSError(errno.EADDRINUSE, "embedding server already running", path)
+    os.remove(path)
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves embed / stats over a Unix socket; one connection thread per client.
+    Refuses to start while another server answers on the path. The socket is
+    owner-only (0600), since it usually lives in /tmp.
+    """
+    daemon_threads = True
+    request_queue_size = EMBEDDING_SOCKET_BACKLOG
+
+    def __init__(self, embedder, path: str = EMBEDDING_SOCKET, max_batch: int = EMBEDDING_MAX_BATCH,
+                 max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS):
+        _remove_stale_socket(path)
+        self.path = path
+        self._inode = None
+        self.batcher = MicroBatcher(embedder, max_batch, max_wait_ms)
+        super().__init__(path, _Handler, bind_and_activate=False)
+        try:
+            self.server_bind()
+            self._inode = os.stat(path).st_ino
+            # Before listen(): until then nobody can connect, whatever the umask gave it
+            os.chmod(path, 0o600)
+            self.server_activate()
+        except BaseException:
+            self.server_close()
+            raise
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+        # Only our own socket: another server may have taken over the path since
+        try:
+            if self._inode is not None and os.stat(self.path).st_ino == self._inode:
+                os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# ---------------- Client ----------------
+class EmbeddingClient:
+    """
+    Stand-in for the SentenceTransformer model inside Embedder that sends
+    encode() to the sidecar. One connection per calling thread, reopened once
+    if the sidecar restarted. A connect refused because the sidecar's accept
+    queue is full is retried with backoff for up to the socket timeout.
+    """
+    def __init__(self, path: str = EMBEDDING_SOCKET, timeout: float = EMBEDDING_SOCKET_TIMEOUT,
+                 connect_timeout: float = EMBEDDING_SOCKET_CONNECT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self.info = self._wait_for_server(connect_timeout)
+
+    def _connect(self):
+        deadline = time.monotonic() + self.timeout
+        delay = 0.01
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+                break
+            except (BlockingIOError, ConnectionRefusedError):
+                # Backlog full (EAGAIN) or the listener is between restarts
+                sock.close()
+                if time.monotonic() + delay >= deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+            except OSError:
+                sock.close()
+                raise
+        self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def _call(self, meta):
+        for attempt in (0, 1):
+            try:
+                sock = getattr(self._local, "sock", None) or self._connect()
+                _send(sock, meta)
+                message = _recv(sock)
+                if message is None:
+                    raise ConnectionError("embedding server closed the connection")
+                break
+            except OSError:
+                self._close()
+                if attempt:
+                    raise
+        reply, data = message
+        if "error" in reply:
+            raise RuntimeError(f"Embedding server: {reply['error']}")
+        return reply, data
+
+    def _wait_for_server(self, connect_timeout):
+        deadline = time.monotonic() + connect_timeout
+        while True:
+            try:
+                return self.stats()
+            except OSError as e:
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(f"Embedding server not reachable at {self.path}: {e}") from e
+                time.sleep(0.5)
+
+    def stats(self) -> dict:
+        return self._call({"op": "stats"})[0]
+
+    def encode(self, texts, batch_size: int = 64, convert_to_numpy: bool = True, **_):
+        if isinstance(texts, str):
+            texts = [texts]
+        reply, data = self._call({"op": "embed", "texts": [str(t) for t in texts]})
+        return np.frombuffer(data, dtype=np.float32).reshape(reply["shape"])
+
+
+if __name__ == "__main__":
+    # python -m pipeline.modules.embedding_server --backend onnx
+    from pipeline.modules.embedder import Embedder, EMBEDDER_BACKEND, EMBEDDING_CACHE_SIZE
+
+    parser = argparse.ArgumentParser(description="Shared embedding sidecar for pipeline workers")
+    parser.add_argument("--socket", default=EMBEDDING_SOCKET)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default=EMBEDDER_BACKEND if EMBEDDER_BACKEND != "socket" else "torch",
+                        choices=("torch", "onnx"))
+    parser.add_argument("--max-batch", type=int, default=EMBEDDING_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=EMBEDDING_BATCH_WAIT_MS)
+    parser.add_argument("--cache-size", type=int, default=EMBEDDING_CACHE_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    embedder = Embedder(model_name=args.model, backend=args.backend, cache_size=args.cache_size)
+    server = EmbeddingServer(embedder, args.socket, args.max_batch, args.max_wait_ms)
+    logger.info("[EmbeddingServer] %s (%s) listening on %s", args.model, args.backend, args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,379 @@
+# fewshot_index.py
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import threading
+
+import faiss
+import pandas as pd
+from filelock import FileLock
+
+from pipeline.modules.fewshot_module import normalize, word_postings, table_postings
+from pipeline.modules.sparse_bm25 import SparseBM25, BM25_FILE
+from pipeline.modules.ann_index import index_spec, build_index, apply_search_params, index_type_of
+from pipeline.modules.fewshot_store import (FEWSHOT_STORE_DIR, FEWSHOT_MMAP, GENERATION_INDEX, load_store, write_store,
+                                             read_index_mapped, new_generation, prune_generations)
+
+logger = logging.getLogger(__name__)
+
+FEWSHOT_CSV = "fewshot_example.csv"
+FAISS_FILE = "embeddings/fewshot_embeddings.faiss"
+MANIFEST_FILE = "embeddings/fewshot_manifest.json"
+MANIFEST_VERSION = 2
+
+# How often a running pipeline checks the manifest for examples added by another process
+FEWSHOT_RELOAD_INTERVAL_SECONDS = float(os.getenv("FEWSHOT_RELOAD_INTERVAL_SECONDS", "30"))
+
+
+def row_hash(question, query) -> str:
+    return hashlib.sha1(f"{question}\x1f{query}".encode("utf-8")).hexdigest()[:16]
+
+
+def file_hash(path) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _atomic_write_index(index, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, path)
+
+
+def _build_matches(built, requested):
+    """Same index type and every explicitly requested build parameter (0 = auto) as built."""
+    return (built or {}).get("type") == requested["type"] and all(
+        built["build"].get(k) == v for k, v in requested["build"].items() if v
+    )
+
+
+class FewShotState:
+    """One consistent (examples, FAISS, BM25) generation; replaced, never mutated."""
+    __slots__ = ("examples_df", "faiss_index", "bm25", "hashes", "spec")
+
+    def __init__(self, examples_df, faiss_index, bm25, hashes, spec):
+        self.examples_df = examples_df
+        self.faiss_index = faiss_index
+        self.bm25 = bm25
+        self.hashes = hashes
+        self.spec = spec    # ann_index spec the FAISS index was built with
+
+
+class FewShotIndex:
+    """
+    Incremental maintenance of the few-shot artifacts (CSV, FAISS index, BM25 .npz)
+    and their manifest.
+
+    The manifest records the embedding model, the FAISS index spec (type, build
+    parameters and search knobs, see ann_index.py), a content hash per example
+    row and a hash of each artifact:
+      - sync(): compares the CSV rows with the manifest. Rows appended since the
+        last build are embedded in one batch and added to FAISS and BM25. Only an
+        edited/removed row, a different embedding model or a different index
+        type/build parameter forces a full rebuild; changed search knobs are
+        only applied and recorded.
+      - add_examples(): appends vetted question/SQL pairs (duplicates skipped) and
+        syncs. This is the entry point for harvesting successful queries.
+      - refresh(): called per request by the pipeline. At most every
+        FEWSHOT_RELOAD_INTERVAL_SECONDS it checks the manifest, and when another
+        process has published a new generation it loads it. Returns the current
+        state, or None while the startup-loaded resources are still current.
+    Every sync writes a new generation: a directory under store_dir holding the
+    memory-mapped store (fewshot_store.py: example texts, overlap and table
+    postings and BM25 arrays as .npy files) and the FAISS index. Only then is the
+    manifest, which names the generation, replaced (one os.replace), so a reader
+    sees the old generation or the new one, never a mix. load() reads exactly
+    that generation; with FEWSHOT_MMAP (default) it maps the arrays and the FAISS
+    file instead of reading private copies, so worker processes share one set of
+    pages. The current and previous generations are kept, older ones deleted.
+    The loose CSV / FAISS / BM25 files are still written for startup without
+    FEWSHOT_MMAP.
+    Writers are serialized within the process (RLock) and across processes (a
+    file lock next to the manifest), so concurrent add_examples() never lose
+    rows. Without a manifest (artifacts from the old embedder.py script) the
+    first sync rebuilds everything once.
+    """
+    def __init__(self, csv_path=FEWSHOT_CSV, faiss_path=FAISS_FILE, bm25_path=BM25_FILE,
+                 manifest_path=MANIFEST_FILE, reload_interval=FEWSHOT_RELOAD_INTERVAL_SECONDS, spec=None,
+                 store_dir=FEWSHOT_STORE_DIR, mmap=FEWSHOT_MMAP):
+        self.spec = spec or index_spec()
+        self.csv_path = csv_path
+        self.faiss_path = faiss_path
+        self.bm25_path = bm25_path
+        self.manifest_path = manifest_path
+        self.store_dir = store_dir
+        self.mmap = mmap
+        self.reload_interval = reload_interval
+        self._write_lock = threading.RLock()
+        self._file_lock = FileLock(f"{manifest_path}.lock")
+        self._state = None
+        self._seen_mtime = self._manifest_mtime()   # the generation startup loaded
+        self._checked_at = time.time()
+        self.appended = 0
+        self.rebuilds = 0
+        self.reloads = 0
+
+    # ---------------- Manifest ----------------
+    def _manifest_mtime(self):
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+    def _write_manifest(self, state, model_name, generation):
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "generation": generation,
+            "embedding_model": model_name,
+            "dim": state.faiss_index.d,
+            "count": len(state.hashes),
+            "index": state.spec,
+            "updated_at": time.time(),
+            "files": {path: file_hash(path) for path in (self.csv_path, self.faiss_path, self.bm25_path)},
+            "rows": state.hashes,
+        }
+        tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.manifest_path)
+        self._seen_mtime = self._manifest_mtime()
+
+    # ---------------- Loading ----------------
+    def _read_examples(self):
+        examples_df = pd.read_csv(self.csv_path)
+        return examples_df, [row_hash(q, s) for q, s in zip(examples_df["question"], examples_df["query"])]
+
+    def load(self):
+        """
+        The generation the manifest names, with its search knobs applied. Only
+        when none has been published (artifacts from before generations) are the
+        loose CSV / FAISS / BM25 files read, and only if they agree.
+        """
+        manifest = self.load_manifest() or {}
+        if manifest.get("generation"):
+            return self.load_generation(manifest)
+        examples_df, hashes = self._read_examples()
+        index = faiss.read_index(self.faiss_path)
+        bm25 = SparseBM25.load(self.bm25_path)
+        if not len(hashes) == index.ntotal == bm25.corpus_size:
+            raise ValueError(f"{self.csv_path} ({len(hashes)} rows), {self.faiss_path} ({index.ntotal}) and "
+                             f"{self.bm25_path} ({bm25.corpus_size}) disagree (written concurrently?)")
+        spec = manifest.get("index") or index_spec(index_type_of(index))
+        apply_search_params(index, spec)
+        return FewShotState(examples_df, index, bm25, hashes, spec)
+
+    def load_generation(self, manifest=None, mmap=None):
+        """
+        The generation the manifest names: store arrays and FAISS index from its
+        directory, memory-mapped (mmap, default self.mmap) or read into memory.
+        Raises if no generation is published or it does not match the manifest.
+        """
+        manifest = manifest or self.load_manifest()
+        if not manifest or not manifest.get("generation"):
+            raise ValueError(f"no generation published in {self.manifest_path}")
+        mmap = self.mmap if mmap is None else mmap
+        directory = os.path.join(self.store_dir, manifest["generation"])
+        examples, bm25 = load_store(manifest["rows"], directory, mmap=mmap)
+        path = os.path.join(directory, GENERATION_INDEX)
+        index = read_index_mapped(path) if mmap else faiss.read_index(path)
+        if index.ntotal != len(manifest["rows"]):
+            raise ValueError(f"{path} has {index.ntotal} vectors, manifest {len(manifest['rows'])}")
+        apply_search_params(index, manifest["index"])
+        return FewShotState(examples, index, bm25, manifest["rows"], manifest["index"])
+
+    def load_mapped(self):
+        """The published generation, memory-mapped (startup with FEWSHOT_MMAP)."""
+        return self.load_generation(mmap=True)
+
+    def apply_manifest_params(self, index):
+        """efSearch / nprobe recorded in the manifest, for an index loaded elsewhere (startup)."""
+        manifest = self.load_manifest()
+        if manifest and manifest.get("index"):
+            apply_search_params(index, manifest["index"])
+        return index
+
+    def refresh(self):
+        now = time.time()
+        if now - self._checked_at < self.reload_interval:
+            return self._state
+        self._checked_at = now
+        mtime = self._manifest_mtime()
+        if mtime is None or mtime == self._seen_mtime:
+            return self._state
+        with self._write_lock:
+            if mtime != self._seen_mtime:
+                try:
+                    state = self.load()
+                except Exception as e:
+                    logger.warning("[FewShotIndex] New generation not loaded: %s", e)
+                    return self._state
+                self._state, self._seen_mtime = state, mtime
+                self.reloads += 1
+                logger.info("[FewShotIndex] Picked up %d examples from %s", len(state.hashes), self.manifest_path)
+        return self._state
+
+    def current(self):
+        return self._state
+
+    # ---------------- Building ----------------
+    @staticmethod
+    def _embed(questions, embedder):
+        return embedder.embed_batch([normalize(q) for q in questions], use_cache=False)
+
+    def _rebuild(self, examples_df, hashes, embedder):
+        vectors = self._embed(examples_df["question"], embedder)
+        index, spec = build_index(vectors, self.spec)
+        self.rebuilds += 1
+        return FewShotState(examples_df, index, SparseBM25.from_documents(examples_df["question"]), hashes, spec)
+
+    def _append(self, base, examples_df, hashes, embedder):
+        new = examples_df.iloc[len(base.hashes):]
+        # Owned copy: readers keep searching the old one, and a memory-mapped index
+        # (clone_index would keep viewing the file) cannot be added to
+        index = faiss.deserialize_index(faiss.serialize_index(base.faiss_index))
+        index.add(self._embed(new["question"], embedder))
+        apply_search_params(index, base.spec)
+        self.appended += len(new)
+        return FewShotState(examples_df, index, base.bm25.append(new["question"]), hashes, base.spec)
+
+    def _base(self, manifest):
+        """Current generation if it matches the manifest (in memory first, else from disk)."""
+        state = self._state
+        if state is not None and state.hashes == manifest["rows"]:
+            return state
+        try:
+            state = self.load()
+        except Exception as e:
+            logger.warning("[FewShotIndex] Existing artifacts unusable: %s", e)
+            return None
+        if state.faiss_index.ntotal != len(manifest["rows"]) or state.bm25.corpus_size != len(manifest["rows"]):
+            return None
+        return FewShotState(state.examples_df.iloc[:len(manifest["rows"])], state.faiss_index, state.bm25,
+                            manifest["rows"], state.spec)
+
+    def _locked(self):
+        """Cross-process writer lock; taken after the in-process RLock."""
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        return self._file_lock
+
+    def _write_generation(self, state):
+        generation = new_generation(state.hashes)
+        directory = os.path.join(self.store_dir, generation)
+        os.makedirs(directory)
+        _atomic_write_index(state.faiss_index, os.path.join(directory, GENERATION_INDEX))
+        write_store(state.examples_df, state.bm25, state.hashes,
+                    word_postings(state.examples_df["question"]),
+                    table_postings(state.examples_df["query"]), directory)
+        return generation
+
+    def sync(self, embedder, examples_df=None, model_name=None):
+        """
+        Bring FAISS/BM25/manifest up to date with the CSV (or examples_df).
+        Returns the new state and publishes it to this process.
+        """
+        model_name = model_name or getattr(embedder, "model_name", None)
+        with self._write_lock, self._locked():
+            if examples_df is None:
+                examples_df, hashes = self._read_examples()
+            else:
+                hashes = [row_hash(q, s) for q, s in zip(examples_df["question"], examples_df["query"])]
+            manifest = self.load_manifest()
+            base = None
+            if (manifest and manifest.get("embedding_model") == model_name
+                    and _build_matches(manifest.get("index"), self.spec)
+                    and hashes[:len(manifest["rows"])] == manifest["rows"]):
+                base = self._base(manifest)
+
+            if base is not None and len(base.hashes) == len(hashes):
+                state = base
+                if base.spec["search"] != self.spec["search"]:
+                    spec = dict(base.spec, search=dict(self.spec["search"]))
+                    apply_search_params(base.faiss_index, spec)
+                    state = FewShotState(base.examples_df, base.faiss_index, base.bm25, base.hashes, spec)
+            elif base is not None:
+                state = self._append(base, examples_df, hashes, embedder)
+                logger.info("[FewShotIndex] Appended %d examples", len(hashes) - len(base.hashes))
+            else:
+                state = self._rebuild(examples_df, hashes, embedder)
+                logger.info("[FewShotIndex] Rebuilt index for %d examples", len(hashes))
+
+            previous = (manifest or {}).get("generation")
+            generation = previous
+            if base is None or state.faiss_index is not base.faiss_index or not previous:
+                _atomic_write_index(state.faiss_index, self.faiss_path)
+                state.bm25.save(self.bm25_path)
+                generation = self._write_generation(state)
+            if state is not base or generation != previous:
+                # The switch to the new generation: one rename
+                self._write_manifest(state, model_name, generation)
+                prune_generations(self.store_dir, keep={generation, previous})
+            self._state = state
+            return state
+
+    def add_examples(self, examples, embedder, model_name=None):
+        """
+        Append vetted {"question", "query"} pairs to the CSV and the indexes.
+        Pairs already present are skipped. Returns the number added.
+        """
+        with self._write_lock, self._locked():
+            # Re-read under the file lock: another process may have appended meanwhile
+            examples_df, hashes = self._read_examples()
+            seen = set(hashes)
+            rows = []
+            for ex in examples:
+                h = row_hash(ex["question"], ex["query"])
+                if h not in seen:
+                    seen.add(h)
+                    rows.append({"question": ex["question"], "query": ex["query"]})
+            if not rows:
+                return 0
+            examples_df = pd.concat([examples_df, pd.DataFrame(rows)], ignore_index=True)
+            tmp = f"{self.csv_path}.{os.getpid()}.tmp"
+            examples_df.to_csv(tmp, index=False)
+            os.replace(tmp, self.csv_path)
+            self.sync(embedder, examples_df=examples_df, model_name=model_name)
+        return len(rows)
+
+    def stats(self) -> dict:
+        state = self._state
+        return {
+            "examples": len(state.hashes) if state is not None else None,
+            "appended": self.appended,
+            "rebuilds": self.rebuilds,
+            "reloads": self.reloads,
+        }
+
+
+# Single shared instance for the process
+fewshot_index = FewShotIndex()
+
+
+if __name__ == "__main__":
+    # python -m pipeline.modules.fewshot_index sync
+    # python -m pipeline.modules.fewshot_index add "<question>" "<sql>"
+    from pipeline.modules.embedder import Embedder
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "sync"
+    embedder = Embedder()
+    if command == "add":
+        added = fewshot_index.add_examples([{"question": sys.argv[2], "query": sys.argv[3]}], embedder)
+        print(f"Added {added} example(s)")
+    else:
+        state = fewshot_index.sync(embedder)
+        print(f"Index up to date: {len(state.hashes)} examples")
@@ -1,9 +1,12 @@
 # fewshot_module.py
+import os
 import faiss
 import numpy as np
 import pandas as pd
 import re
+import threading
 from pipeline.modules.embedder import Embedder  # OpenAI Embedder
+from pipeline.modules.ann_index import filtered_search_params
 from rank_bm25 import BM25Okapi
 import logging
 
@@ -17,6 +20,12 @@ def get_logger(silent=False):
 
 log = get_logger(silent=False)  # set silent=True to suppress logs
 
+# Neighbours requested from approximate (HNSW / IVF-PQ) indexes; examples outside
+# them can still qualify through BM25, with a semantic score of 0
+FEWSHOT_ANN_CANDIDATES = int(os.getenv("FEWSHOT_ANN_CANDIDATES", "256"))
+# Score only examples whose SQL uses one of the tables the intent stage picked
+FEWSHOT_TABLE_FILTER = os.getenv("FEWSHOT_TABLE_FILTER", "1") == "1"
+
 def normalize(text: str) -> str:
         text = text.lower()
         text = re.sub(r'[^a-z0-9\s]', '', text)
@@ -28,10 +37,7 @@ def embed_text(query: str, embedder: Embedder):
     """
     Return a normalized FAISS-ready embedding vector for a single query.
     """
-    embedding = embedder.embed(query)  # returns list
-    vec = np.array(embedding, dtype="float32").reshape(1, -1)
-    faiss.normalize_L2(vec)
-    return vec
+    return embedder.embed_batch([query])  # (1, dim), already L2-normalized
 
 # ----------------- Exact Match Bonus -----------------
 def exact_match_bonus(user_question: str, example_question: str):
@@ -39,6 +45,199 @@ def exact_match_bonus(user_question: str, example_question: str):
     eq = set(example_question.lower().split())
     return len(uq & eq) / (len(uq) + 1e-8)
 
+def word_postings(questions) -> dict:
+    """Lowercased word -> ids of the questions containing it (exact_match_bonus tokens)."""
+    postings = {}
+    for i, q in enumerate(questions):
+        for word in set(str(q).lower().split()):
+            postings.setdefault(word, []).append(i)
+    return {word: np.asarray(ids, dtype=np.int64) for word, ids in postings.items()}
+
+# ----------------- Table Tags -----------------
+_SQL_TABLE = re.compile(r'\b(?:from|join)\s+([a-z_"][\w$".]*)', re.IGNORECASE)
+_SQL_CTE = re.compile(r'\b([a-z_]\w*)\s+as\s*\(', re.IGNORECASE)
+_LOAD_SUFFIX = re.compile(r'(_\d{8,})+$')
+
+def table_key(name: str) -> str:
+    """
+    Comparable table name: lowercased, unquoted, without the trailing load
+    timestamps (..._1756049975215338_1756053175), so an example written against
+    an earlier load of a table still matches the catalog's current one.
+    """
+    return _LOAD_SUFFIX.sub("", str(name).replace('"', '').strip().lower())
+
+def sql_tables(sql: str) -> list:
+    """table_key of every table the SQL reads (FROM / JOIN), CTE names excluded."""
+    ctes = {m.lower() for m in _SQL_CTE.findall(sql or "")}
+    tables = {table_key(t) for t in _SQL_TABLE.findall(sql or "")}
+    return sorted(t for t in tables if t and t not in ctes)
+
+def table_postings(queries) -> dict:
+    """table_key -> ids of the examples whose SQL uses that table."""
+    postings = {}
+    for i, sql in enumerate(queries):
+        for table in sql_tables(str(sql)):
+            postings.setdefault(table, []).append(i)
+    return {table: np.asarray(ids, dtype=np.int64) for table, ids in postings.items()}
+
+# ----------------- Hybrid Retriever -----------------
+class FewShotRetriever:
+    """
+    Hybrid (FAISS + BM25 + word overlap) few-shot retrieval on NumPy arrays.
+
+    Everything that depends only on the corpus is built once per loaded
+    examples_df / FAISS index (ensure_built):
+      - the FAISS vectors as a zero-copy (n, d) view when the index is a flat
+        inner-product index, so the semantic score of every example is one
+        mat-vec product instead of a full sorted search (approximate indexes
+        are searched for the FEWSHOT_ANN_CANDIDATES nearest examples instead)
+      - word -> example-id posting arrays for the exact-match bonus, and
+        table -> example-id posting arrays from the tables each example's SQL
+        reads (both taken as-is, memory-mapped, when examples come from
+        fewshot_store)
+    Per request every score lives in an array indexed by example id (FAISS ids
+    are row positions of examples_df), the fusion is vectorized, the top k come
+    from argpartition and only those k rows of the DataFrame are read.
+
+    search(..., ids=) scores only the given example ids: the union of the
+    table postings of the tables picked for the question (candidate_ids), so
+    per-request work follows the size of those tables' example sets rather
+    than the corpus.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built_for = None      # (examples_df, faiss_index) the arrays were built from
+        self._vectors = None        # (n, d) view for flat IP indexes, else None
+        self._postings = {}         # lowercased word -> example ids containing it (dict or MappedPostings)
+        self._tables = {}           # table_key -> example ids whose SQL uses it (dict or MappedPostings)
+        self.size = 0
+
+    def ensure_built(self, examples_df, faiss_index):
+        with self._lock:
+            built = self._built_for
+            if built is not None and built[0] is examples_df and built[1] is faiss_index:
+                return
+            n = len(examples_df)
+            self._vectors = None
+            if isinstance(faiss_index, faiss.IndexFlat) and faiss_index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                self._vectors = faiss.rev_swig_ptr(
+                    faiss_index.get_xb(), faiss_index.ntotal * faiss_index.d
+                ).reshape(faiss_index.ntotal, faiss_index.d)[:n]
+                self._vectors.flags.writeable = False   # may be an mmap of the index file
+
+            postings = getattr(examples_df, "word_postings", None)
+            self._postings = postings if postings is not None else word_postings(examples_df["question"])
+            tables = getattr(examples_df, "table_postings", None)
+            self._tables = tables if tables is not None else table_postings(examples_df["query"])
+            self.size = n
+            self._built_for = (examples_df, faiss_index)
+            log.info("[FewShot] Retriever built for %d examples (flat scan: %s)", n, self._vectors is not None)
+
+    def candidate_ids(self, tables):
+        """Sorted ids of the examples that use any of `tables` (names as in the catalog)."""
+        postings = [self._tables.get(table_key(t)) for t in tables]
+        postings = [p for p in postings if p is not None]
+        if not postings:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(postings))
+
+    def semantic_scores(self, vec, faiss_index, ids=None):
+        """
+        Inner-product score per example id (or per entry of `ids`); -inf for ids
+        the index did not return.
+        """
+        size = self.size if ids is None else len(ids)
+        scores = np.full(size, -np.inf, dtype="float32")
+        if self._vectors is not None:
+            if ids is None:
+                scores[:len(self._vectors)] = self._vectors @ vec[0]
+            else:
+                ids = ids[ids < len(self._vectors)]
+                scores[:len(ids)] = self._vectors[ids] @ vec[0]
+            return scores
+        k = min(size, faiss_index.ntotal, FEWSHOT_ANN_CANDIDATES)
+        if ids is None:
+            distances, found_ids = faiss_index.search(vec, k)
+            found = (found_ids[0] >= 0) & (found_ids[0] < self.size)
+            scores[found_ids[0][found]] = distances[0][found]
+        else:
+            distances, found_ids = faiss_index.search(vec, k, params=filtered_search_params(faiss_index, ids))
+            found = found_ids[0] >= 0
+            scores[np.searchsorted(ids, found_ids[0][found])] = distances[0][found]
+        return scores
+
+    def overlap_bonus(self, user_question, ids):
+        """exact_match_bonus for the (sorted) example ids, from the posting arrays."""
+        words = set(user_question.lower().split())
+        overlap = np.zeros(len(ids), dtype="float32")
+        for word in words:
+            posting = self._postings.get(word)
+            if posting is None or not len(posting):
+                continue
+            # Binary-search the shorter sorted array in the longer one: postings of
+            # common words are as long as the corpus, a table-filtered pool is not
+            if len(posting) < len(ids):
+                pos = np.minimum(np.searchsorted(ids, posting), len(ids) - 1)
+                overlap[pos[ids[pos] == posting]] += 1
+            else:
+                pos = np.minimum(np.searchsorted(posting, ids), len(posting) - 1)
+                overlap += posting[pos] == ids
+        return overlap / (len(words) + 1e-8)
+
+    def search(self, user_question, vec, bm25_model=None, top_k=2,
+               semantic_threshold=0.2, syntactic_threshold=0.5, ids=None):
+        """
+        -> (ids, combined, semantic, syntactic) of the top_k examples, best first.
+        ids: sorted example ids to restrict scoring to (None = whole corpus).
+        """
+        query_clean = normalize(user_question)
+        size = self.size if ids is None else len(ids)
+        semantic = self.semantic_scores(vec, self._built_for[1], ids)
+        if bm25_model is None:
+            syntactic = np.zeros(size, dtype="float32")
+        elif ids is None:
+            syntactic = np.asarray(bm25_model.get_scores(query_clean.split()), dtype="float32")[:self.size]
+        elif isinstance(bm25_model, BM25Okapi):
+            syntactic = np.asarray(bm25_model.get_batch_scores(query_clean.split(), ids.tolist()), dtype="float32")
+        else:
+            syntactic = np.asarray(bm25_model.get_scores(query_clean.split(), doc_ids=ids), dtype="float32")
+
+        candidates = np.flatnonzero((semantic >= semantic_threshold) | (syntactic > syntactic_threshold))
+        if not len(candidates):
+            empty = np.empty(0, dtype="float32")
+            return candidates, empty, empty, empty
+
+        sem = semantic[candidates]
+        sem = np.where(np.isfinite(sem), sem, 0.0)
+        syn = syntactic[candidates]
+        syn_norm = syn / (syn.max() + 1e-8) if bm25_model is not None else np.zeros_like(syn)
+        if ids is not None:
+            candidates = ids[candidates]
+        combined = 0.4 * sem + 0.4 * syn_norm + 0.2 * self.overlap_bonus(user_question, candidates)
+
+        k = min(top_k, len(candidates))
+        top = np.argpartition(-combined, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+        top = top[np.lexsort((candidates[top], -combined[top]))]   # best first, ties by id
+        return candidates[top], combined[top], sem[top], syn[top]
+
+
+# Single shared instance for the process
+few_shot_retriever = FewShotRetriever()
+
+
+def _query_vector(query_clean, embedder, faiss_index, query_vec=None):
+    # query_vec lets batch callers pass a row from one batched encode call
+    if query_vec is None:
+        vec = embed_text(query_clean, embedder)
+    else:
+        vec = np.ascontiguousarray(np.asarray(query_vec, dtype="float32").reshape(1, -1))
+
+    # Automatic dimension detection
+    if vec.shape[1] != faiss_index.d:
+        raise ValueError(f"FAISS index dimension ({faiss_index.d}) does not match embedding ({vec.shape[1]})")
+    return vec
+
+
 # ----------------- Hybrid Similarity Search -----------------
 def hybrid_similarity_search(
     query: str,
@@ -49,33 +248,20 @@ def hybrid_similarity_search(
     tokenized_corpus: list = None,
     semantic_threshold: float = 0.2,
     syntactic_threshold: float = 0.5,
+    query_vec: np.ndarray = None,
 ):
-
-    query_clean = normalize(query)
-
-    # --- Semantic FAISS ---
-    vec = embed_text(query_clean, embedder)
-
-    # Automatic dimension detection
-    if vec.shape[1] != faiss_index.d:
-        raise ValueError(f"FAISS index dimension ({faiss_index.d}) does not match embedding ({vec.shape[1]})")
-
-    distances, indices = faiss_index.search(vec, len(examples_df))
-    examples_df['semantic_score'] = np.array(distances[0])
-
-    # --- Optional Syntactic BM25 ---
-    if bm25_model and tokenized_corpus:
-        bm25_scores = bm25_model.get_scores(query_clean.split())
-        examples_df['syntactic_score'] = bm25_scores
-    else:
-        examples_df['syntactic_score'] = 0
-
-    # Filter by thresholds
-    semantic_selection = examples_df[examples_df['semantic_score'] >= semantic_threshold]
-    syntactic_selection = examples_df[examples_df['syntactic_score'] > syntactic_threshold]
-    filtered_df = pd.concat([semantic_selection, syntactic_selection]).drop_duplicates().reset_index(drop=True)
-
-    return filtered_df
+    """Examples passing either threshold, with their (id-aligned) semantic/syntactic scores."""
+    few_shot_retriever.ensure_built(examples_df, faiss_index)
+    vec = _query_vector(normalize(query), embedder, faiss_index, query_vec)
+    ids, _, semantic, syntactic = few_shot_retriever.search(
+        query, vec, bm25_model, top_k=len(examples_df),
+        semantic_threshold=semantic_threshold, syntactic_threshold=syntactic_threshold
+    )
+    order = np.argsort(ids)
+    filtered_df = examples_df.iloc[ids[order]].copy()
+    filtered_df['semantic_score'] = semantic[order]
+    filtered_df['syntactic_score'] = syntactic[order]
+    return filtered_df.reset_index(drop=True)
 
 # ----------------- Fetch Few-Shot Examples -----------------
 def fetch_few_shots(
@@ -85,49 +271,52 @@ def fetch_few_shots(
     embedder: Embedder,
     bm25_model: BM25Okapi = None,
     tokenized_corpus: list = None,
-    top_k: int = 2
+    top_k: int = 2,
+    query_vec: np.ndarray = None,
+    tables: list = None
 ):
-    candidates_df = hybrid_similarity_search(
-        query=user_question,
-        examples_df=examples_df.copy(),
-        faiss_index=faiss_index,
-        embedder=embedder,
-        bm25_model=bm25_model,
-        tokenized_corpus=tokenized_corpus
-    )
+    """
+    Top-k few-shot examples by 0.4 * semantic + 0.4 * normalized BM25 + 0.2 * word
+    overlap, among examples with semantic >= 0.2 or BM25 > 0.5.
+    matched_indices are row positions in examples_df. tokenized_corpus is no
+    longer used (BM25 is applied whenever bm25_model is given).
+
+    tables: the tables selected for the question. With FEWSHOT_TABLE_FILTER on,
+    only examples whose SQL uses one of them are scored (BM25 normalized within
+    that pool); when none does, the whole corpus is searched as before.
+    """
+    few_shot_retriever.ensure_built(examples_df, faiss_index)
+    candidates = None
+    if FEWSHOT_TABLE_FILTER and tables:
+        candidates = few_shot_retriever.candidate_ids(tables)
+        if not len(candidates):
+            log.info("No few-shot examples use %s; searching all examples", tables)
+            candidates = None
+    vec = _query_vector(normalize(user_question), embedder, faiss_index, query_vec)
+    ids, combined, semantic, syntactic = few_shot_retriever.search(user_question, vec, bm25_model, top_k=top_k,
+                                                                   ids=candidates)
 
-    similarity_flag = not candidates_df.empty
+    similarity_flag = len(ids) > 0
     few_shots = {}
     matched_indices = []
 
     if similarity_flag:
-        if bm25_model and tokenized_corpus:
-            max_bm25 = candidates_df['syntactic_score'].max()
-            candidates_df['syntactic_score_norm'] = candidates_df['syntactic_score'] / (max_bm25 + 1e-8)
-        else:
-            candidates_df['syntactic_score_norm'] = 0
-
-        candidates_df['exact_bonus'] = candidates_df['question'].apply(lambda x: exact_match_bonus(user_question, x))
-        candidates_df['combined_score'] = (
-            0.4 * candidates_df['semantic_score'] +
-            0.4 * candidates_df['syntactic_score_norm'] +
-            0.2 * candidates_df['exact_bonus']
-        )
-
-        # Logging
-        log.info("\n--- Candidate Examples and Scores ---\n%s",
-                 candidates_df[['question','semantic_score','syntactic_score','combined_score']].sort_values('combined_score', ascending=False))
+        # Only the winning rows are read from the DataFrame
+        selected = examples_df.iloc[ids]
+        if log.isEnabledFor(logging.INFO):
+            log.info("\n--- Selected Examples and Scores ---\n%s",
+                     selected[['question']].assign(semantic_score=semantic, syntactic_score=syntactic, combined_score=combined))
 
-        selected = candidates_df.sort_values("combined_score", ascending=False).head(top_k)
-        for i, row in enumerate(selected.itertuples()):
+        for i, (idx, row) in enumerate(zip(ids, selected.itertuples())):
             few_shots[f"Example Question {i+1}"] = row.question
             few_shots[f"Example Query {i+1}"] = row.query
-            matched_indices.append(row.Index)
+            matched_indices.append(int(idx))
 
     return {
         "similarity_flag": similarity_flag,
         "few_shot_examples": few_shots,
-        "matched_indices": matched_indices
+        "matched_indices": matched_indices,
+        "table_candidates": len(candidates) if candidates is not None else None
     }
 
 # # ----------------- Initialize FAISS and BM25 -----------------
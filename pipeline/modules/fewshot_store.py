@@ -0,0 +1,243 @@
+# fewshot_store.py
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+
+import faiss
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Memory-mapped few-shot artifacts: every array is a plain .npy opened with
+# mmap_mode="r", so its pages live in the OS page cache and are shared by every
+# worker process on the host instead of being copied into each one.
+FEWSHOT_STORE_DIR = "embeddings/fewshot_store"
+FEWSHOT_MMAP = os.getenv("FEWSHOT_MMAP", "1") == "1"
+STORE_VERSION = 2
+TEXT_COLUMNS = ("question", "query")
+# Every sync writes a complete generation (store arrays + FAISS index) into its
+# own directory under the store dir; the manifest names the current one
+GENERATION_PREFIX = "gen-"
+GENERATION_INDEX = "index.faiss"
+
+
+def rows_digest(hashes) -> str:
+    """One hash over the manifest's per-row hashes: which examples the store holds."""
+    return hashlib.sha1("\n".join(hashes).encode("utf-8")).hexdigest()
+
+
+# ---------------- Text columns as UTF-8 blob + offsets ----------------
+class MappedTexts:
+    """Read-only string column: row i is blob[offsets[i]:offsets[i + 1]] decoded as UTF-8."""
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @staticmethod
+    def encode(texts):
+        encoded = [str(t).encode("utf-8") for t in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _get(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._get(i) for i in range(*key.indices(len(self)))]
+        if np.ndim(key):
+            return [self._get(int(i)) for i in key]
+        return self._get(int(key))
+
+    def __iter__(self):
+        return (self._get(i) for i in range(len(self)))
+
+    def tolist(self):
+        return list(self)
+
+
+class MappedPostings:
+    """word (or table) -> example ids (CSR over a sorted key array); dict-style get() for FewShotRetriever."""
+    def __init__(self, words, indptr, ids):
+        self.words = words
+        self.indptr = indptr
+        self.ids = ids
+
+    @staticmethod
+    def encode(postings: dict):
+        words = sorted(postings)
+        indptr = np.zeros(len(words) + 1, dtype=np.int64)
+        np.cumsum([len(postings[w]) for w in words], out=indptr[1:])
+        ids = np.concatenate([postings[w] for w in words]) if words else np.empty(0, dtype=np.int64)
+        return np.asarray(words, dtype=str), indptr, ids.astype(np.int64)
+
+    def get(self, word, default=None):
+        i = int(np.searchsorted(self.words, word))
+        if i < len(self.words) and self.words[i] == word:
+            return self.ids[self.indptr[i]:self.indptr[i + 1]]
+        return default
+
+    def __len__(self):
+        return len(self.words)
+
+
+class MappedExamples:
+    """
+    The parts of the few-shot examples DataFrame that retrieval uses, over
+    mapped text columns: len(), ["question"] / ["query"] (iterable columns) and
+    .iloc[rows], which materializes only the requested rows as a DataFrame.
+    """
+    def __init__(self, columns: dict, word_postings: MappedPostings = None, table_postings: MappedPostings = None):
+        self._columns = columns
+        self.columns = list(columns)
+        self.word_postings = word_postings
+        self.table_postings = table_postings
+        self.iloc = _RowIndexer(self)
+
+    def __len__(self):
+        return len(next(iter(self._columns.values())))
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({name: col.tolist() for name, col in self._columns.items()})
+
+
+class _RowIndexer:
+    def __init__(self, examples):
+        self._examples = examples
+
+    def __getitem__(self, rows):
+        positions = range(*rows.indices(len(self._examples))) if isinstance(rows, slice) else np.atleast_1d(rows)
+        positions = np.asarray(positions, dtype=np.int64)
+        return pd.DataFrame({name: col[positions] for name, col in self._examples._columns.items()}, index=positions)
+
+
+# ---------------- Read / write ----------------
+def _save_array(directory, name, array):
+    path = os.path.join(directory, f"{name}.npy")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, np.asarray(array), allow_pickle=False)
+    os.replace(tmp, path)
+
+
+def write_store(examples_df, bm25, hashes, word_postings: dict, table_postings: dict,
+                directory: str = FEWSHOT_STORE_DIR):
+    """
+    Write example texts, the overlap-bonus and table postings and the BM25
+    arrays (precomputed weights included) as .npy files; meta.json is written
+    last and names the rows the store was built from.
+    """
+    os.makedirs(directory, exist_ok=True)
+    arrays = {}
+    for name in TEXT_COLUMNS:
+        arrays[f"{name}_blob"], arrays[f"{name}_offsets"] = MappedTexts.encode(examples_df[name])
+    arrays["words"], arrays["words_indptr"], arrays["words_ids"] = MappedPostings.encode(word_postings)
+    arrays["tables"], arrays["tables_indptr"], arrays["tables_ids"] = MappedPostings.encode(table_postings)
+    arrays.update({f"bm25_{key}": value for key, value in bm25.arrays(include_weights=True).items()})
+
+    for name, array in arrays.items():
+        _save_array(directory, name, array)
+    meta = {
+        "version": STORE_VERSION,
+        "count": len(hashes),
+        "rows_digest": rows_digest(hashes),
+        "arrays": {name: [list(np.shape(a)), np.asarray(a).dtype.str] for name, a in arrays.items()},
+    }
+    tmp = os.path.join(directory, f"meta.json.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(directory, "meta.json"))
+    logger.info("[FewShotStore] Wrote %d examples to %s", len(hashes), directory)
+
+
+def load_store(hashes=None, directory: str = FEWSHOT_STORE_DIR, mmap: bool = True):
+    """
+    (MappedExamples, SparseBM25) backed by memory-mapped arrays (read into
+    memory with mmap=False). Raises ValueError if the store is missing,
+    partially written or was built from rows other than `hashes`.
+    """
+    from pipeline.modules.sparse_bm25 import SparseBM25  # imports fewshot_module, which imports this module
+
+    with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != STORE_VERSION:
+        raise ValueError(f"{directory}: unsupported store version {meta.get('version')}")
+    if hashes is not None and meta["rows_digest"] != rows_digest(hashes):
+        raise ValueError(f"{directory} holds other examples than the manifest")
+
+    arrays = {}
+    for name, (shape, dtype) in meta["arrays"].items():
+        array = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None, allow_pickle=False)
+        if list(array.shape) != shape or array.dtype.str != dtype:
+            raise ValueError(f"{directory}/{name}.npy does not match meta.json (written concurrently?)")
+        arrays[name] = array
+
+    examples = MappedExamples(
+        {name: MappedTexts(arrays[f"{name}_blob"], arrays[f"{name}_offsets"]) for name in TEXT_COLUMNS},
+        MappedPostings(arrays["words"], arrays["words_indptr"], arrays["words_ids"]),
+        MappedPostings(arrays["tables"], arrays["tables_indptr"], arrays["tables_ids"]),
+    )
+    bm25 = SparseBM25.from_arrays({key[len("bm25_"):]: value for key, value in arrays.items() if key.startswith("bm25_")})
+    return examples, bm25
+
+
+def read_index_mapped(path: str):
+    """FAISS index whose vector storage (flat / HNSW codes) is mmap'ed from the file, not copied."""
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC)
+
+
+# ---------------- Generations ----------------
+def new_generation(hashes) -> str:
+    """Directory name for a generation about to be written: unique and ordered by write time."""
+    return f"{GENERATION_PREFIX}{time.time_ns()}-{rows_digest(hashes)[:12]}"
+
+
+def prune_generations(directory: str, keep):
+    """
+    Delete the generation directories not in `keep`. Workers that still map
+    an old generation keep their pages (unlinked files stay mapped); where a
+    directory cannot be deleted yet (Windows), the next sync retries.
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        if name.startswith(GENERATION_PREFIX) and name not in keep:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+# ---------------- Process memory ----------------
+def process_memory() -> dict:
+    """
+    Memory of this process in MB. rss counts shared pages in full; pss divides
+    them by the number of processes mapping them (sum pss over workers for the
+    host total); uss is memory only this process holds.
+    """
+    try:
+        import psutil
+        info = psutil.Process().memory_full_info()
+        values = {"rss": info.rss, "pss": getattr(info, "pss", None), "uss": info.uss,
+                  "shared": getattr(info, "shared", None)}
+    except Exception:
+        values = {"rss": None, "pss": None, "uss": None, "shared": None}
+        try:
+            with open("/proc/self/smaps_rollup", encoding="ascii") as f:
+                fields = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in f if line.endswith("kB\n")}
+            values = {"rss": fields.get("Rss"), "pss": fields.get("Pss"),
+                      "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+                      "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)}
+        except OSError:
+            pass
+    return {f"{key}_mb": round(value / 2 ** 20, 1) if value is not None else None for key, value in values.items()}
@@ -0,0 +1,288 @@
+# gazetteer.py
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Where location names come from:
+#   auto    GAZETTEER_FILE if it exists, else the branch-master table when DATABASE_URL is set
+#   file    GAZETTEER_FILE only (CSV with `type,name` columns)
+#   db      the branch-master table only
+#   static  rephrase.LOCATION_MAP only
+GAZETTEER_SOURCE = os.getenv("GAZETTEER_SOURCE", "auto")
+GAZETTEER_FILE = os.getenv("GAZETTEER_FILE", "crs_locations.csv")
+# Empty = the table of the reference catalog whose name contains "branch_master"
+GAZETTEER_TABLE = os.getenv("GAZETTEER_TABLE", "")
+GAZETTEER_REFRESH_SECONDS = float(os.getenv("GAZETTEER_REFRESH_SECONDS", "3600"))
+
+# Branch-master column -> location type
+BRANCH_MASTER_COLUMNS = {
+    "state_name": "state",
+    "region_name": "region",
+    "zone_name": "zone",
+    "area_name": "area",
+    "branch_name": "branch",
+}
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_END = None  # trie key of the entry that ends at a node
+
+# start/end: character span of the name in the text; label: the location type
+# written right before it ("state Karnataka"), label_start: where that label starts
+LocationMatch = namedtuple("LocationMatch", "start end name types label label_start")
+
+
+def _tokens(text):
+    return [(m.group().lower(), m.start(), m.end()) for m in _TOKEN.finditer(text)]
+
+
+class Gazetteer:
+    """
+    Location names compiled once into a token trie, matched in one left-to-right
+    pass over a question.
+
+    Names and questions are split into word and punctuation tokens (lowercased),
+    so a match always starts and ends on a word boundary and "AP -TS Zone"
+    matches "ap - ts zone" as well. At each position the longest name wins and
+    matching resumes after it, so "Aurangabad Zone" is never also read as
+    "Aurangabad". Cost per question is the number of tokens times the depth
+    walked in the trie, independent of how many names are loaded.
+
+    A name listed under several types keeps them in location_map order; the
+    first is the one used for labelling. Treat instances as immutable
+    (GazetteerHolder swaps in a new one).
+    """
+    def __init__(self, location_map: dict, source: str = "static"):
+        self.location_map = {loc_type: tuple(dict.fromkeys(str(n).strip() for n in names if str(n).strip()))
+                             for loc_type, names in location_map.items()}
+        self.source = source
+        self.version = hashlib.sha1(repr(sorted(self.location_map.items())).encode("utf-8")).hexdigest()[:16]
+        self._labels = sorted(((tuple(t for t, _, _ in _tokens(loc_type)), loc_type) for loc_type in self.location_map),
+                              key=lambda label: -len(label[0]))
+        self._trie = {}
+        self.names = 0
+        for loc_type, names in self.location_map.items():
+            for name in names:
+                node = self._trie
+                for token, _, _ in _tokens(name):
+                    node = node.setdefault(token, {})
+                entry = node.get(_END)
+                if entry is None:
+                    node[_END] = (name, (loc_type,))
+                    self.names += 1
+                elif loc_type not in entry[1]:
+                    node[_END] = (entry[0], entry[1] + (loc_type,))
+
+    @classmethod
+    def of(cls, location_map):
+        """location_map as a Gazetteer (compiled now if it is a plain {type: [names]} dict)."""
+        return location_map if isinstance(location_map, Gazetteer) else cls(location_map)
+
+    def _label_before(self, tokens, i):
+        for label_tokens, loc_type in self._labels:
+            n = len(label_tokens)
+            if n <= i and tuple(t for t, _, _ in tokens[i - n:i]) == label_tokens:
+                return loc_type, tokens[i - n][1]
+        return None, None
+
+    def matches(self, text: str) -> list:
+        """Every location name in `text`, leftmost-longest and non-overlapping, in order."""
+        tokens = _tokens(text or "")
+        found, i = [], 0
+        while i < len(tokens):
+            node, best, j = self._trie, None, i
+            while j < len(tokens):
+                node = node.get(tokens[j][0])
+                if node is None:
+                    break
+                j += 1
+                if _END in node:
+                    best = (j, node[_END])
+            if best is None:
+                i += 1
+                continue
+            end, (name, types) = best
+            label, label_start = self._label_before(tokens, i)
+            found.append(LocationMatch(tokens[i][1], tokens[end - 1][2], name, types, label, label_start))
+            i = end
+        return found
+
+    def labeled(self, text: str) -> list:
+        """Matches already written as "<type> <name>" with a type the name is listed under."""
+        return [m for m in self.matches(text) if m.label in m.types]
+
+    def label(self, text: str) -> str:
+        """
+        Prefix every unlabelled location name with its type: "disbursement in
+        Karnataka" -> "disbursement in state Karnataka". Names already preceded by
+        a location type (valid or not) are left as written.
+        """
+        parts, pos = [], 0
+        for m in self.matches(text):
+            if m.label is not None:
+                continue
+            parts.append(text[pos:m.start])
+            parts.append(f"{m.types[0]} {m.name}")
+            pos = m.end
+        if not parts:
+            return text
+        parts.append(text[pos:])
+        return "".join(parts)
+
+    def stats(self) -> dict:
+        return {
+            "source": self.source,
+            "version": self.version,
+            "names": self.names,
+            "types": {loc_type: len(names) for loc_type, names in self.location_map.items()},
+        }
+
+
+# ---------------- Sources ----------------
+def read_location_file(path: str = GAZETTEER_FILE) -> dict:
+    """{type: [names]} from a CSV with `type` and `name` columns."""
+    df = pd.read_csv(path, dtype=str).dropna(subset=["type", "name"])
+    locations = {}
+    for loc_type, name in zip(df["type"].str.strip().str.lower(), df["name"]):
+        locations.setdefault(loc_type, []).append(name)
+    return locations
+
+
+def branch_master_table(catalog=None) -> str:
+    """GAZETTEER_TABLE, else the reference table whose name contains "branch_master"."""
+    if GAZETTEER_TABLE:
+        return GAZETTEER_TABLE
+    if catalog is None:
+        from pipeline.modules.reference_catalog import ReferenceCatalog, reference_catalogs
+        catalog = reference_catalogs.current() or ReferenceCatalog.load()
+    tables = sorted(t for t in catalog.table_names if "branch_master" in t.lower())
+    if not tables:
+        raise LookupError("no branch master table in the reference catalog; set GAZETTEER_TABLE")
+    return tables[-1]
+
+
+def read_branch_master(table: str = None) -> dict:
+    """{type: [names]} from the distinct state/region/zone/area/branch names of the branch master."""
+    from utils.db_cred import execute_sql  # needs DATABASE_URL; keep it off the import path
+
+    table = table or branch_master_table()
+    if not re.fullmatch(r"[\w$.\"]+", table):
+        raise ValueError(f"invalid table name {table!r}")
+    columns = ", ".join(BRANCH_MASTER_COLUMNS)
+    rows = execute_sql(f"SELECT DISTINCT {columns} FROM {table}")
+    if not rows:
+        raise LookupError(f"no rows read from {table}")
+    locations = {loc_type: [] for loc_type in BRANCH_MASTER_COLUMNS.values()}
+    for row in rows:
+        for column, loc_type in BRANCH_MASTER_COLUMNS.items():
+            if row.get(column):
+                locations[loc_type].append(row[column])
+    return locations
+
+
+def load_locations(source: str = GAZETTEER_SOURCE, path: str = GAZETTEER_FILE, table: str = GAZETTEER_TABLE):
+    """-> ({type: [names]}, source description), or (None, "static") when there is nothing to load."""
+    if source in ("auto", "file") and (source == "file" or os.path.exists(path)):
+        return read_location_file(path), f"file:{path}"
+    if source == "db" or (source == "auto" and os.getenv("DATABASE_URL")):
+        table = table or branch_master_table()
+        return read_branch_master(table), f"db:{table}"
+    if source not in ("auto", "static"):
+        raise ValueError(f"GAZETTEER_SOURCE must be auto, file, db or static, got {source!r}")
+    return None, "static"
+
+
+# ---------------- Current gazetteer ----------------
+class GazetteerHolder:
+    """
+    The current Gazetteer. Starts as the compiled static map; on first use a
+    daemon thread loads the configured source, merges it with the static map,
+    compiles it and swaps it in, then reloads every refresh_seconds (0 = load
+    once). Compilation happens on that thread, so requests never wait for it,
+    and a failed or empty load keeps the previous gazetteer.
+    """
+    def __init__(self, static_map: dict, source: str = GAZETTEER_SOURCE, path: str = GAZETTEER_FILE,
+                 table: str = GAZETTEER_TABLE, refresh_seconds: float = GAZETTEER_REFRESH_SECONDS):
+        self.static_map = static_map
+        self.source = source
+        self.path = path
+        self.table = table
+        self.refresh_seconds = refresh_seconds
+        self._gazetteer = Gazetteer(static_map, "static")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._started = False
+        self.swaps = 0
+        self.failures = 0
+        self.last_error = None
+        self.loaded_at = None
+        self.compile_seconds = None
+
+    def current(self) -> Gazetteer:
+        self.start()
+        return self._gazetteer
+
+    def start(self):
+        """Start the background load/refresh thread (idempotent; no-op for the static source)."""
+        if self._started or self.source == "static":
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._refresh_loop, name="gazetteer-refresh", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.reload()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning("[Gazetteer] Load failed, keeping %s: %s", self._gazetteer.source, e)
+            if self.refresh_seconds <= 0 or self._stop.wait(self.refresh_seconds):
+                return
+
+    def reload(self) -> Gazetteer:
+        """Load, merge with the static map and compile; swapped in only if the names changed."""
+        locations, source = load_locations(self.source, self.path, self.table)
+        merged = {loc_type: list(names) for loc_type, names in self.static_map.items()}
+        for loc_type, names in (locations or {}).items():
+            merged.setdefault(loc_type, []).extend(names)
+        start = time.perf_counter()
+        gazetteer = Gazetteer(merged, source)
+        self.compile_seconds = time.perf_counter() - start
+        self.loaded_at = time.time()
+        return self.swap(gazetteer)
+
+    def swap(self, gazetteer: Gazetteer) -> Gazetteer:
+        with self._lock:
+            previous = self._gazetteer
+            if previous.version == gazetteer.version:
+                return previous
+            self._gazetteer = gazetteer
+            self.swaps += 1
+        logger.info("[Gazetteer] %d location names from %s (was %d from %s)",
+                    gazetteer.names, gazetteer.source, previous.names, previous.source)
+        return gazetteer
+
+    def stats(self) -> dict:
+        return {
+            **self._gazetteer.stats(),
+            "swaps": self.swaps,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "loaded_at": self.loaded_at,
+            "compile_seconds": self.compile_seconds,
+            "refresh_seconds": self.refresh_seconds,
+        }
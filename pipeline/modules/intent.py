@@ -2,28 +2,30 @@
 
 import json
 import re
-from datetime import datetime
 import pandas as pd
-from pipeline.modules.llm_utils import call_llm, LLMCallError   # import exception too
-from pipeline.modules.prompt_loader import load_prompt
-from pipeline.modules.load_references import load_references
+from pipeline.modules.llm_utils import call_llm, LLMCallError, discard_cached_response   # import exception too
+from pipeline.modules.prompt_loader import load_prompt_suffix, prompt_timestamp
+from pipeline.utils.prompt_prefix import prompt_prefixes
 
-# Load reference data once
-metrics_reference, columns_reference, tables_reference = load_references()
 
-
-def identify_intent(rephrased_question, tables_reference, model="gemini-flash-latest"):
+def identify_intent(rephrased_question, tables_reference, model="gemini-flash-latest", deadline=None, tables_csv=None):
     """
     Identify the intent, metrics, keywords, locations, and time frame from a user question
     using the Gemini model and the YAML-based prompt template.
     Token counting + logging is handled centrally inside call_llm.
+    tables_csv: tables_reference already rendered (ReferenceCatalog.tables_prompt_csv).
     """
 
-    full_prompt = load_prompt(
+    # Static prefix (system + tables CSV) is rendered once per loaded tables_reference
+    prefix = prompt_prefixes.render(
+        "intent.yml",
+        sources=(tables_reference,),
+        build=lambda: {"tables_reference": tables_csv if tables_csv is not None else tables_reference.to_csv(index=False)}
+    )
+    full_prompt = load_prompt_suffix(
         "intent.yml",
         rephrased_question=rephrased_question,
-        tables_reference=tables_reference.to_csv(index=False),
-        current_date_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        current_date_time=prompt_timestamp()
     )
 
     try:
@@ -32,7 +34,9 @@ def identify_intent(rephrased_question, tables_reference, model="gemini-flash-la
             step_name="identify_intent",
             prompt=full_prompt,
             model_name=model,
-            response_format="text"
+            response_format="text",
+            deadline=deadline,
+            prefix=prefix
         )
     except LLMCallError as e:
         # Bubble up a clear error message
@@ -44,6 +48,7 @@ def identify_intent(rephrased_question, tables_reference, model="gemini-flash-la
     try:
         result = json.loads(cleaned)
     except json.JSONDecodeError:
+        discard_cached_response("identify_intent", full_prompt, model, prefix)  # don't replay a bad answer
         raise ValueError(f"[identify_intent] Invalid JSON from model:\n{intent_result}")
 
     return result, intent_usage
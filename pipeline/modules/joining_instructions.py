@@ -1,19 +1,34 @@
 # joining_instructions.py
 
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 CSV_FILE_PATH = 'crs_joining_instructions.csv'
 
-def get_joining_instructions(table_names: List[str]) -> List[Dict[str, Any]]:
+def build_join_adjacency(df: pd.DataFrame) -> Dict[str, Dict[str, str]]:
+    """
+    Joining-instructions matrix (index_col=0) -> {from_table: {to_table: instruction}},
+    table names lowercased, self-joins and empty/"NA" cells left out.
+    """
+    adjacency: Dict[str, Dict[str, str]] = {}
+    for from_table, row in zip(df.index.str.lower(), df.itertuples(index=False)):
+        for to_table, instr in zip(df.columns.str.lower(), row):
+            if from_table == to_table or not isinstance(instr, str):
+                continue
+            instr = instr.strip()
+            if instr and instr.upper() != "NA":
+                adjacency.setdefault(from_table, {})[to_table] = instr
+    return adjacency
+
+def get_joining_instructions(table_names: List[str], adjacency: Optional[Dict[str, Dict[str, str]]] = None) -> List[Dict[str, Any]]:
     """
     Returns joining instructions as a list of dicts suitable for generate_sql_from_dto.
     Each dict has: from_table, to_table, instruction.
+    adjacency: prebuilt build_join_adjacency() map (ReferenceCatalog.join_adjacency);
+    the CSV is read when it is not given.
     """
-    # Load CSV
-    df = pd.read_csv(CSV_FILE_PATH, index_col=0)
-    df.index = df.index.str.lower()
-    df.columns = df.columns.str.lower()
+    if adjacency is None:
+        adjacency = build_join_adjacency(pd.read_csv(CSV_FILE_PATH, index_col=0))
 
     # Flatten table list if any nested lists and lowercase
     table_list = []
@@ -21,26 +36,17 @@ def get_joining_instructions(table_names: List[str]) -> List[Dict[str, Any]]:
         if isinstance(t, list):
             t = t[0]
         table_list.append(t.lower())
-
-    # Filter only tables present in CSV
-    valid_tables = [t for t in table_list if t in df.index]
-    if not valid_tables:
-        return []
-
-    filtered_df = df.loc[valid_tables, valid_tables]
+    selected = set(table_list)
 
     joinings: List[Dict[str, Any]] = []
 
-    for from_table in valid_tables:
-        for to_table in filtered_df.columns:
-            if from_table == to_table:
-                continue  # skip self-join
-            instr = filtered_df.at[from_table, to_table]
-            if pd.notna(instr) and instr.strip().upper() != "NA" and instr.strip() != "":
+    for from_table in selected:
+        for to_table, instr in adjacency.get(from_table, {}).items():
+            if to_table in selected:
                 joinings.append({
                     "from_table": from_table,
                     "to_table": to_table,
-                    "instruction": instr.strip()
+                    "instruction": instr
                 })
 
     # Optional: sort for deterministic order
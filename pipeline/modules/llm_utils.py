@@ -73,11 +73,16 @@ import google.generativeai as genai
 import json
 from pipeline.modules.token_counter import count_tokens
 from pipeline.modules.token_tracker import token_tracker
+from pipeline.utils.deadline import as_deadline
+from pipeline.utils.llm_response_cache import llm_response_cache
+from pipeline.utils.prompt_prefix import prompt_prefixes
 import re
 import os
 from dotenv import load_dotenv
 import time
+import asyncio
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -90,46 +95,191 @@ class LLMCallError(Exception):
     pass
 
 
-def call_llm(step_name: str, prompt: str, model_name: str = "gemini-flash-latest", response_format: str = "text"):
-    """
-    Robust wrapper to call Gemini LLM with retry, token counting + logging.
-    Validates model name, counts tokens, and handles JSON/text output.
-    """
-
-    prompt_tokens = count_tokens(prompt, model_name)
-    model = genai.GenerativeModel(model_name)
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 1.0  # seconds
 
-    MAX_ATTEMPTS = 3
-    BACKOFF_BASE = 1.0  # seconds
 
-    for attempt in range(1, MAX_ATTEMPTS + 1):
-        try:
-            response = model.generate_content(prompt)
-            output = response.text.strip() if response.text else ""
-            break  # ✅ success → exit retry loop
+class ModelRegistry:
+    """
+    One GenerativeModel handle per model name for the whole process.
 
-        except Exception as e:
-            msg = str(e)
-            logger.warning("[%s] LLM call failed (attempt %d/%d): %s",
-                           step_name, attempt, MAX_ATTEMPTS, msg)
-
-            # Specific handling for quota / transient issues
-            if any(x in msg.lower() for x in ["resourceexhausted", "quota", "token"]):
-                if attempt == MAX_ATTEMPTS:
-                    raise LLMCallError(f"[{step_name}] Token exhaustion: {msg}")
-                sleep = 10  # cool-down before retry
+    genai keeps a single default gRPC client (and channel) per process; a handle
+    bound to it is built once here instead of on every call_llm, and warmup()
+    opens the channel (TLS + HTTP/2 handshake) before the first real request.
+    """
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def get(self, model_name: str):
+        model = self._models.get(model_name)
+        if model is not None:
+            self.reused += 1
+            return model
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                model = genai.GenerativeModel(model_name)
+                self._models[model_name] = model
+                self.created += 1
             else:
-                if attempt == MAX_ATTEMPTS:
-                    raise LLMCallError(f"[{step_name}] LLM call failed after {MAX_ATTEMPTS} attempts: {msg}")
-                sleep = BACKOFF_BASE * (2 ** (attempt - 1))
-
-            logger.info("[%s] Retrying in %.1f seconds...", step_name, sleep)
-            time.sleep(sleep)
-
+                self.reused += 1
+            return model
+
+    def get_cached(self, cached_content):
+        """Handle bound to a provider context cache (see prompt_prefix.py)."""
+        key = ("cached", cached_content.name)
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = genai.GenerativeModel.from_cached_content(cached_content)
+                    self._models[key] = model
+                    self.created += 1
+        return model
+
+    def warmup(self, model_names=("gemini-flash-latest",)):
+        """Create handles and open the transport with a cheap count_tokens round trip."""
+        for name in model_names:
+            try:
+                self.get(name).count_tokens("ping")
+                logger.info("[LLM] Warmed up %s", name)
+            except Exception as e:
+                logger.warning("[LLM] Warmup failed for %s: %s", name, e)
+
+    def warmup_in_background(self, model_names=("gemini-flash-latest",)):
+        threading.Thread(target=self.warmup, args=(tuple(model_names),), name="llm-warmup", daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> dict:
+        return {"models": sorted(str(k) for k in self._models), "created": self.created, "reused": self.reused}
+
+
+# Single shared instance for the process
+model_registry = ModelRegistry()
+
+
+# Opt-in: stream responses so time-to-first-token can be measured per step.
+# Off by default, since it changes the transport (and its errors) of every call.
+LLM_STREAM = os.getenv("LLM_STREAM", "0") == "1"
+
+
+class StepStats:
+    """Per-step LLM accounting: calls, prompt/prefix/cached tokens and time-to-first-token."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.steps = {}
+
+    def record(self, usage):
+        with self._lock:
+            s = self.steps.setdefault(usage["step"], {
+                "calls": 0, "response_cache_hits": 0, "prompt_tokens": 0, "prefix_tokens": 0,
+                "provider_cached_tokens": 0, "completion_tokens": 0, "ttft_calls": 0, "ttft_seconds_total": 0.0,
+            })
+            s["calls"] += 1
+            if usage.get("cached"):
+                s["response_cache_hits"] += 1
+                return
+            s["prompt_tokens"] += usage["prompt_tokens"]
+            s["prefix_tokens"] += usage.get("prefix_tokens", 0)
+            s["provider_cached_tokens"] += usage.get("cached_prompt_tokens", 0)
+            s["completion_tokens"] += usage["completion_tokens"]
+            if usage.get("ttft_seconds") is not None:
+                s["ttft_calls"] += 1
+                s["ttft_seconds_total"] += usage["ttft_seconds"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {}
+            for step, s in self.steps.items():
+                sent = s["calls"] - s["response_cache_hits"]
+                out[step] = dict(s, avg_prompt_tokens=s["prompt_tokens"] / sent if sent else 0.0,
+                                 avg_ttft_seconds=s["ttft_seconds_total"] / s["ttft_calls"] if s["ttft_calls"] else None)
+            return out
+
+
+# Single shared instance for the process
+llm_step_stats = StepStats()
+
+
+# ---------------- Shared retry / usage logic ----------------
+def _full_prompt(prompt, prefix):
+    return f"{prefix}\n\n{prompt}" if prefix else prompt
+
+
+def _prepare(prompt, model_name, prefix):
+    """-> (model, text to send, prompt_tokens, prefix_tokens) for a prefix/suffix prompt."""
+    if not prefix:
+        return model_registry.get(model_name), prompt, count_tokens(prompt, model_name), 0
+    handle = prompt_prefixes.handle(model_name, prefix)
+    prompt_tokens = handle.tokens + count_tokens(prompt, model_name)
+    if handle.cached_content is not None:
+        # Provider holds the prefix; only the dynamic suffix goes over the wire
+        return model_registry.get_cached(handle.cached_content), prompt, prompt_tokens, handle.tokens
+    return model_registry.get(model_name), _full_prompt(prompt, prefix), prompt_tokens, handle.tokens
+
+
+def _generate(model, prompt, deadline):
+    """
+    One generate_content attempt with the remaining deadline as request timeout.
+    Returns (text, meta) with provider-reported cached tokens, plus time-to-first-token
+    when LLM_STREAM is on.
+    """
+    kwargs = {}
+    timeout = deadline.timeout()
+    if timeout is not None:
+        kwargs["request_options"] = {"timeout": timeout}
+    start = time.perf_counter()
+    ttft = None
+    if LLM_STREAM:
+        response = model.generate_content(prompt, stream=True, **kwargs)
+        for _ in response:
+            ttft = time.perf_counter() - start
+            break
+        response.resolve()
+    else:
+        response = model.generate_content(prompt, **kwargs)
+    usage_metadata = getattr(response, "usage_metadata", None)
+    meta = {"cached_prompt_tokens": getattr(usage_metadata, "cached_content_token_count", 0) or 0}
+    if ttft is not None:
+        meta["ttft_seconds"] = ttft
+    return (response.text.strip() if response.text else ""), meta
+
+
+def _retry_delay(step_name, attempt, error, deadline):
+    """Seconds to wait before the next attempt, or raise LLMCallError when giving up."""
+    msg = str(error)
+    logger.warning("[%s] LLM call failed (attempt %d/%d): %s",
+                   step_name, attempt, MAX_ATTEMPTS, msg)
+
+    # Specific handling for quota / transient issues
+    if any(x in msg.lower() for x in ["resourceexhausted", "quota", "token"]):
+        if attempt == MAX_ATTEMPTS:
+            raise LLMCallError(f"[{step_name}] Token exhaustion: {msg}")
+        sleep = 10  # cool-down before retry
+    else:
+        if attempt == MAX_ATTEMPTS:
+            raise LLMCallError(f"[{step_name}] LLM call failed after {MAX_ATTEMPTS} attempts: {msg}")
+        sleep = BACKOFF_BASE * (2 ** (attempt - 1))
+
+    if not deadline.has(sleep):
+        raise LLMCallError(f"[{step_name}] LLM call failed and no time budget left to retry: {msg}")
+    logger.info("[%s] Retrying in %.1f seconds...", step_name, sleep)
+    return sleep
+
+
+def _finish(step_name, full_prompt, output, prompt_tokens, model_name, response_format, cached=False, meta=None, prefix_tokens=0):
+    """Count output tokens, log usage and parse the output (cache hits cost no tokens)."""
     print("Output:", output)
 
     # Count output tokens
-    completion_tokens = count_tokens(output, model_name)
+    completion_tokens = 0 if cached else count_tokens(output, model_name)
 
     # Log usage
     usage = {
@@ -138,8 +288,12 @@ def call_llm(step_name: str, prompt: str, model_name: str = "gemini-flash-latest
         "total_tokens": prompt_tokens + completion_tokens,
         "step": step_name,
         "model": model_name,
+        "cached": cached,
+        "prefix_tokens": prefix_tokens,
+        **(meta or {}),
     }
     token_tracker.log_step(step_name, prompt_tokens, completion_tokens)
+    llm_step_stats.record(usage)
 
     # Handle JSON response safely
     if response_format == "json":
@@ -149,6 +303,78 @@ def call_llm(step_name: str, prompt: str, model_name: str = "gemini-flash-latest
         try:
             return json.loads(cleaned), usage
         except json.JSONDecodeError:
+            llm_response_cache.discard(model_name, step_name, full_prompt)
             raise LLMCallError(f"[{step_name}] Failed to parse JSON response: {output}")
 
     return output, usage
+
+
+def discard_cached_response(step_name: str, prompt: str, model_name: str = "gemini-flash-latest", prefix: str = None):
+    """Forget a cached output the caller could not use (e.g. invalid JSON), so it is not replayed."""
+    llm_response_cache.discard(model_name, step_name, _full_prompt(prompt, prefix))
+
+
+def response_cache_key(step_name: str, prompt: str, model_name: str = "gemini-flash-latest", prefix: str = None) -> str:
+    """llm_response_cache key of a call_llm call, to discard its output later (llm_response_cache.discard_key)."""
+    return llm_response_cache.make_key(model_name, step_name, _full_prompt(prompt, prefix))
+
+
+def call_llm(step_name: str, prompt: str, model_name: str = "gemini-flash-latest", response_format: str = "text", deadline=None, prefix: str = None):
+    """
+    Robust wrapper to call Gemini LLM with retry, token counting + logging.
+    Validates model name, counts tokens, and handles JSON/text output.
+    deadline: optional request Deadline (or seconds). Each attempt gets the remaining
+    budget as its timeout, and a retry whose back-off would overrun it is not attempted.
+    prefix: static prompt prefix (see prompt_prefix.py); `prompt` is then only the
+    dynamic suffix. Its token count is computed once and, with a provider context
+    cache, it is not re-sent.
+    Identical (model, step, prompt) calls are answered from llm_response_cache.
+    """
+
+    full_prompt = _full_prompt(prompt, prefix)
+    cached = llm_response_cache.get(model_name, step_name, full_prompt)
+    if cached is not None:
+        return _finish(step_name, full_prompt, cached, 0, model_name, response_format, cached=True)
+
+    deadline = as_deadline(deadline)
+    model, send_prompt, prompt_tokens, prefix_tokens = _prepare(prompt, model_name, prefix)
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        deadline.check(step_name)
+        try:
+            output, meta = _generate(model, send_prompt, deadline)
+            break  # ✅ success → exit retry loop
+        except Exception as e:
+            time.sleep(_retry_delay(step_name, attempt, e, deadline))
+
+    llm_response_cache.put(model_name, step_name, full_prompt, output)
+    return _finish(step_name, full_prompt, output, prompt_tokens, model_name, response_format, meta=meta, prefix_tokens=prefix_tokens)
+
+
+async def acall_llm(step_name: str, prompt: str, model_name: str = "gemini-flash-latest", response_format: str = "text", deadline=None, prefix: str = None):
+    """
+    Async call_llm: same retry, deadline, prefix and usage handling, awaitable from the pipeline's event loop.
+
+    Attempts run on a worker thread over the shared sync channel rather than through
+    generate_content_async: genai's async gRPC client is bound to the event loop that
+    first used it, and run_pipeline starts a new loop per request.
+    """
+
+    full_prompt = _full_prompt(prompt, prefix)
+    cached = llm_response_cache.get(model_name, step_name, full_prompt)
+    if cached is not None:
+        return _finish(step_name, full_prompt, cached, 0, model_name, response_format, cached=True)
+
+    deadline = as_deadline(deadline)
+    model, send_prompt, prompt_tokens, prefix_tokens = await asyncio.to_thread(_prepare, prompt, model_name, prefix)
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        deadline.check(step_name)
+        try:
+            output, meta = await asyncio.to_thread(_generate, model, send_prompt, deadline)
+            break
+        except Exception as e:
+            await asyncio.sleep(_retry_delay(step_name, attempt, e, deadline))
+
+    llm_response_cache.put(model_name, step_name, full_prompt, output)
+    return _finish(step_name, full_prompt, output, prompt_tokens, model_name, response_format, meta=meta, prefix_tokens=prefix_tokens)
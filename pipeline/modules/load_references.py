@@ -1,11 +1,21 @@
+import hashlib
+import os
 import pandas as pd
 import chardet
 
-def detect_encoding(file_path: str) -> str:
-    """Detect encoding of a file."""
+def detect_encoding(file_path: str, sample_size: int = 64 * 1024) -> str:
+    """
+    Detect encoding of a file.
+    UTF-8 (with or without BOM) is checked first with a plain decode; chardet only
+    sniffs a sample of files that are not valid UTF-8.
+    """
     with open(file_path, 'rb') as f:
         raw_data = f.read()
-        result = chardet.detect(raw_data)
+    try:
+        raw_data.decode('utf-8-sig')
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        result = chardet.detect(raw_data[:sample_size])
     return result['encoding']
 
 def load_csv(file_path: str) -> pd.DataFrame:
@@ -24,3 +34,15 @@ def load_references(
     tables_reference = load_csv(tables_path)
 
     return metrics_reference, columns_reference, tables_reference
+
+def reference_version(
+    paths=("crs_metrics.csv", "crs_columns.csv", "crs_tables.csv", "crs_joining_instructions.csv")
+) -> str:
+    """Short content hash of the reference files; changes whenever any of them is edited."""
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(path.encode("utf-8"))
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
@@ -0,0 +1,185 @@
+# onnx_encoder.py
+import os
+import sys
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Exported copy of the sentence-transformers model: model.onnx (fp32),
+# model_int8.onnx (dynamic int8 weights), tokenizer.json and a manifest with the
+# cosine agreement measured against the torch model at export time.
+ONNX_MODEL_DIR = os.getenv("EMBEDDER_ONNX_DIR", "embeddings/onnx/all-MiniLM-L6-v2")
+ONNX_MODEL_FILE = os.getenv("EMBEDDER_ONNX_FILE", "model_int8.onnx")
+ONNX_MANIFEST = "onnx_manifest.json"
+# ORT intra-op threads; 0 = ORT default (all cores). Use 1 with many worker processes.
+ONNX_THREADS = int(os.getenv("EMBEDDER_ONNX_THREADS", "0"))
+# Export fails if an exported model's vectors drift further than this from torch's
+ONNX_MIN_COSINE = float(os.getenv("EMBEDDER_ONNX_MIN_COSINE", "0.98"))
+
+
+class OnnxEncoder:
+    """
+    Mean-pooled sentence embeddings from an exported ONNX transformer.
+
+    Needs only onnxruntime and tokenizers (no torch, no transformers), and
+    exposes the subset of SentenceTransformer.encode that Embedder uses, so the
+    vectors land in the same space as the existing FAISS indexes (see the
+    manifest written by export_onnx for the measured cosine).
+    """
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, file_name: str = ONNX_MODEL_FILE, threads: int = ONNX_THREADS):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("EMBEDDER_BACKEND=onnx needs onnxruntime and tokenizers (pip install onnxruntime)") from e
+
+        self.model_dir = model_dir
+        self.file_name = file_name
+        self.manifest = load_manifest(model_dir)
+        max_length = int(self.manifest.get("max_length", 256))
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, file_name), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        cosine = self.manifest.get("cosine", {}).get(file_name)
+        logger.info("[Embedder] ONNX model %s loaded (min cosine vs torch at export: %s)",
+                    os.path.join(model_dir, file_name), cosine and cosine["min"])
+
+    def _encode_chunk(self, texts):
+        encodings = self.tokenizer.encode_batch([str(t) for t in texts])
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self._inputs})[0]
+        # Mean pooling over real tokens, as the sentence-transformers Pooling layer does
+        mask = feeds["attention_mask"][..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts, batch_size: int = 64, convert_to_numpy: bool = True, **_):
+        if isinstance(texts, str):
+            texts = [texts]
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        chunks = [self._encode_chunk(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        return np.ascontiguousarray(np.concatenate(chunks), dtype=np.float32)
+
+
+def load_manifest(model_dir: str = ONNX_MODEL_DIR) -> dict:
+    try:
+        with open(os.path.join(model_dir, ONNX_MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def cosine_agreement(reference, candidate) -> dict:
+    """Row-wise cosine between two (n, d) embedding matrices."""
+    a = reference / (np.linalg.norm(reference, axis=1, keepdims=True) + 1e-10)
+    b = candidate / (np.linalg.norm(candidate, axis=1, keepdims=True) + 1e-10)
+    cos = (a * b).sum(axis=1)
+    return {"min": round(float(cos.min()), 6), "mean": round(float(cos.mean()), 6)}
+
+
+def export_onnx(model_name: str = "all-MiniLM-L6-v2", output_dir: str = ONNX_MODEL_DIR,
+                quantize: bool = True, sample_texts=None, opset: int = 17) -> dict:
+    """
+    Export the transformer of a sentence-transformers model to ONNX (plus an
+    int8 dynamically quantized copy), then check both against the torch model
+    on sample_texts. Needs the full torch stack; run it once, offline.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    os.makedirs(output_dir, exist_ok=True)
+    st_model.tokenizer.save_pretrained(output_dir)  # writes tokenizer.json (fast tokenizer)
+
+    class _LastHidden(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids).last_hidden_state
+
+    dummy = st_model.tokenizer(["export the embedding model"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    axes = {0: "batch", 1: "tokens"}
+    torch.onnx.export(
+        _LastHidden(transformer),
+        (dummy["input_ids"], dummy["attention_mask"], dummy["token_type_ids"]),
+        fp32_path,
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={"input_ids": axes, "attention_mask": axes, "token_type_ids": axes, "last_hidden_state": axes},
+        opset_version=opset,
+        dynamo=False,
+    )
+    files = ["model.onnx"]
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, os.path.join(output_dir, "model_int8.onnx"), weight_type=QuantType.QInt8)
+        files.append("model_int8.onnx")
+
+    manifest = {"model": model_name, "max_length": int(st_model.max_seq_length), "opset": opset, "cosine": {}}
+    with open(os.path.join(output_dir, ONNX_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    if sample_texts is None:
+        sample_texts = _sample_texts()
+    reference = st_model.encode(sample_texts, convert_to_numpy=True)
+    for file_name in files:
+        agreement = cosine_agreement(reference, OnnxEncoder(output_dir, file_name).encode(sample_texts))
+        manifest["cosine"][file_name] = {**agreement, "samples": len(sample_texts)}
+        logger.info("[Embedder] %s vs torch: min cosine %.4f, mean %.4f", file_name, agreement["min"], agreement["mean"])
+
+    with open(os.path.join(output_dir, ONNX_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    bad = {name: c["min"] for name, c in manifest["cosine"].items() if c["min"] < ONNX_MIN_COSINE}
+    if bad:
+        raise ValueError(f"Exported models disagree with torch beyond cosine {ONNX_MIN_COSINE}: {bad}")
+    return manifest
+
+
+def _sample_texts(limit: int = 500):
+    """Few-shot questions (normalized like queries) to validate an export on."""
+    import pandas as pd
+    from pipeline.modules.fewshot_index import FEWSHOT_CSV
+    from pipeline.modules.fewshot_module import normalize
+    try:
+        questions = pd.read_csv(FEWSHOT_CSV)["question"].astype(str).head(limit)
+        return [normalize(q) for q in questions]
+    except Exception as e:
+        logger.warning("Few-shot CSV not readable (%s); validating on a built-in sample", e)
+        return ["total sales by branch last month", "number of active customers in each district",
+                "top 10 products by revenue this year", "loan disbursement amount per area"]
+
+
+if __name__ == "__main__":
+    # python -m pipeline.modules.onnx_encoder export [model_name] [--no-quantize]
+    logging.basicConfig(level=logging.INFO)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if args and args[0] == "export":
+        result = export_onnx(args[1] if len(args) > 1 else "all-MiniLM-L6-v2", quantize="--no-quantize" not in sys.argv)
+        print(json.dumps(result["cosine"], indent=2))
+    else:
+        print(json.dumps(load_manifest(), indent=2))
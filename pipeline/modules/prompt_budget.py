@@ -0,0 +1,124 @@
+# prompt_budget.py
+import os
+import re
+import logging
+from pipeline.modules.token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Prompt token limit per model: PROMPT_TOKEN_LIMITS="gemini-flash-latest=12000,gemini-pro-latest=30000",
+# anything not listed uses PROMPT_TOKEN_LIMIT
+DEFAULT_PROMPT_TOKEN_LIMIT = int(os.getenv("PROMPT_TOKEN_LIMIT", "16000"))
+PROMPT_TOKEN_LIMITS = {
+    name.strip(): int(limit)
+    for name, _, limit in (item.partition("=") for item in os.getenv("PROMPT_TOKEN_LIMITS", "").split(",") if "=" in item)
+}
+# Instructions shorter than this are never truncated
+MIN_TRUNCATE_CHARS = int(os.getenv("PROMPT_MIN_TRUNCATE_CHARS", "400"))
+TRUNCATION_MARKER = " (truncated)"
+# Where an instruction may be cut: after a line, a ';' or a sentence-ending '.'
+CLAUSE_END = re.compile(r'\n|;|\.(?=\s)')
+
+
+def token_limit(model: str) -> int:
+    return PROMPT_TOKEN_LIMITS.get(model, DEFAULT_PROMPT_TOKEN_LIMIT)
+
+
+class PromptBudget:
+    """
+    Keeps a prompt under the model's token limit by trimming in ranked order.
+
+    fit(render, tiers): render() builds the prompt from the caller's current
+    state; each tier is a callable that removes/shortens one item of that state
+    and returns a description of what it dropped, or None when it has nothing
+    left. Tiers are exhausted in order (cheapest information first) until the
+    prompt fits or nothing trimmable remains.
+    """
+    def __init__(self, model: str, limit: int = None, fixed_tokens: int = 0):
+        self.model = model
+        self.limit = limit or token_limit(model)
+        self.fixed_tokens = fixed_tokens   # e.g. the cached static prefix
+
+    def count(self, text: str) -> int:
+        return self.fixed_tokens + count_tokens(text, self.model)
+
+    def fit(self, render, tiers):
+        """-> (prompt, report) where report = {limit, tokens_before, tokens_after, dropped}."""
+        text = render()
+        tokens = before = self.count(text)
+        dropped = []
+        tiers = list(tiers)
+        while tokens > self.limit and tiers:
+            change = tiers[0]()
+            if change is None:
+                tiers.pop(0)
+                continue
+            dropped.append(change)
+            text = render()
+            tokens = self.count(text)
+
+        report = {"limit": self.limit, "tokens_before": before, "tokens_after": tokens, "dropped": dropped}
+        if dropped:
+            logger.info("[PromptBudget] %d -> %d tokens (limit %d), dropped %s", before, tokens, self.limit, dropped)
+        if tokens > self.limit:
+            logger.warning("[PromptBudget] Prompt still over budget after trimming: %d > %d", tokens, self.limit)
+        return text, report
+
+
+# ---------------- Trimming tiers for the SQL prompt ----------------
+def drop_lowest_few_shot(few_shots: dict):
+    """
+    fetch_few_shots numbers examples by descending combined score, so the
+    highest-numbered Question/Query pair is the weakest one.
+    """
+    numbers = sorted({int(key.rsplit(" ", 1)[-1]) for key in few_shots})
+    if not numbers:
+        return None
+    n = numbers[-1]
+    question = few_shots.pop(f"Example Question {n}", None)
+    few_shots.pop(f"Example Query {n}", None)
+    return {"kind": "few_shot", "item": f"Example {n}", "question": question}
+
+
+def drop_duplicate_join(joinings: list):
+    """Remove a joining whose instruction text repeats an earlier one (e.g. A->B and B->A)."""
+    seen = set()
+    for i, j in enumerate(joinings):
+        text = " ".join(j["instruction"].split()).lower()
+        if text in seen:
+            del joinings[i]
+            return {"kind": "duplicate_join", "item": f"{j['from_table']} -> {j['to_table']}"}
+        seen.add(text)
+    return None
+
+
+def _cut_at_clause(text: str, limit: int) -> str:
+    """Longest prefix of at most `limit` chars that ends on a line / clause boundary ("" if there is none)."""
+    end = 0
+    for m in CLAUSE_END.finditer(text, 0, limit):
+        end = m.end()
+    return text[:end].rstrip()
+
+
+def truncate_longest_instruction(joinings: list):
+    """
+    Shorten the longest remaining instruction (long CTE text) above MIN_TRUNCATE_CHARS
+    to about half, cutting only after a whole line or clause and marking it
+    (truncated), so the prompt never carries a SQL fragment cut mid-token. An
+    instruction with no such boundary in that range is dropped whole.
+    """
+    candidates = [
+        (len(j["instruction"]), i) for i, j in enumerate(joinings)
+        if len(j["instruction"]) > MIN_TRUNCATE_CHARS and not j["instruction"].endswith(TRUNCATION_MARKER)
+    ]
+    if not candidates:
+        return None
+    length, i = max(candidates)
+    j = joinings[i]
+    item = f"{j['from_table']} -> {j['to_table']}"
+    kept = _cut_at_clause(j["instruction"], max(MIN_TRUNCATE_CHARS, length // 2))
+    if not kept:
+        del joinings[i]
+        return {"kind": "dropped_instruction", "item": item, "chars": length}
+    joinings[i] = dict(j, instruction=kept + TRUNCATION_MARKER)
+    return {"kind": "truncated_instruction", "item": item, "chars": length - len(kept)}
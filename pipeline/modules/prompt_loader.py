@@ -1,26 +1,181 @@
 # prompt_loader.py
 
+import os
+import time
+import string
+import threading
 import yaml
+from datetime import datetime
 from pathlib import Path
+from pipeline.modules.token_counter import count_tokens
 
-def load_prompt(filename: str, **kwargs) -> str:
-    path = Path(__file__).resolve().parent.parent / "prompts" / filename
-    with open(path, 'r', encoding="utf-8") as f:
-        data = yaml.safe_load(f)
+PROMPTS_DIR = Path(__file__).resolve().parent.parent / "prompts"
+PROMPT_SECTIONS = ("system", "static", "examples", "user", "format")
+
+# Granularity of the current date/time injected into prompts. Second precision
+# made every prompt unique; a coarser stamp lets identical questions share
+# LLM response cache entries. One of: second, minute, hour, day.
+PROMPT_TIME_GRANULARITY = os.getenv("PROMPT_TIME_GRANULARITY", "day")
+_TIME_FORMATS = {
+    "second": "%Y-%m-%d %H:%M:%S",
+    "minute": "%Y-%m-%d %H:%M",
+    "hour": "%Y-%m-%d %H:00",
+    "day": "%Y-%m-%d",
+}
+
+
+def prompt_timestamp(granularity: str = None) -> str:
+    """Current date/time for prompt templates, truncated to PROMPT_TIME_GRANULARITY."""
+    granularity = granularity or PROMPT_TIME_GRANULARITY
+    if granularity not in _TIME_FORMATS:
+        raise ValueError(f"Unknown prompt time granularity '{granularity}', expected one of {list(_TIME_FORMATS)}")
+    return datetime.now().strftime(_TIME_FORMATS[granularity])
+
+
+class PromptLoadError(ValueError):
+    """A prompt YAML is malformed (unknown section, bad placeholder, ...)."""
+    pass
+
+
+def _placeholders(template: str, where: str):
+    try:
+        return {field for _, field, _, _ in string.Formatter().parse(template) if field}
+    except ValueError as e:
+        raise PromptLoadError(f"{where}: invalid template: {e}")
+
+
+class CompiledPrompt:
+    """
+    One parsed prompt file. Everything that doesn't depend on request data is
+    joined once at load: without a `static` section the whole prefix is a constant.
+    """
+    def __init__(self, filename: str, data: dict, mtime_ns: int):
+        if not isinstance(data, dict):
+            raise PromptLoadError(f"{filename}: expected a mapping of sections, got {type(data).__name__}")
+        unknown = [key for key in data if key not in PROMPT_SECTIONS]
+        if unknown:
+            # e.g. "System:" instead of "system:" would otherwise silently drop the system prompt
+            raise PromptLoadError(f"{filename}: unknown section(s) {unknown}; expected {list(PROMPT_SECTIONS)} (keys are case-sensitive)")
+        for key in ("system", "static", "user", "format"):
+            if key in data and not isinstance(data[key], str):
+                raise PromptLoadError(f"{filename}: section '{key}' must be text")
+
+        self.filename = filename
+        self.mtime_ns = mtime_ns
+        self.static = data.get("static")
+        self.user = data.get("user", "")
+        self.static_fields = _placeholders(self.static, f"{filename}:static") if self.static else set()
+        self.user_fields = _placeholders(self.user, f"{filename}:user")
+
+        head = [data["system"]] if "system" in data else []
+        tail = []
+        for ex in data.get("examples", []):
+            tail.append(f"User: {ex['user']}")
+            tail.append(f"Assistant: {ex['assistant']}")
+        if "format" in data:
+            tail.append("Output Format:\n" + data["format"])
+        self.head = "\n\n".join(head)
+        self.tail = "\n\n".join(tail)
+
+    def _check(self, section, fields, kwargs):
+        missing = fields - kwargs.keys()
+        if missing:
+            raise KeyError(f"{self.filename}:{section} needs {sorted(missing)}")
 
-    parts = []
-    
-    if "system" in data:
-        parts.append(data["system"])
+    def prefix(self, **static_kwargs) -> str:
+        parts = [self.head]
+        if self.static:
+            self._check("static", self.static_fields, static_kwargs)
+            parts.append(self.static.format(**static_kwargs))
+        parts.append(self.tail)
+        return "\n\n".join(p for p in parts if p)
 
-    for ex in data.get("examples", []):
-        parts.append(f"User: {ex['user']}")
-        parts.append(f"Assistant: {ex['assistant']}")
+    def suffix(self, **kwargs) -> str:
+        if not self.user:
+            return ""
+        self._check("user", self.user_fields, kwargs)
+        return self.user.format(**kwargs)
 
-    if "user" in data:
-        parts.append(data["user"].format(**kwargs))  # <-- injects variables
 
-    if "format" in data:
-        parts.append("Output Format:\n" + data["format"])
+class PromptRegistry:
+    """
+    Compiled prompt templates held in memory.
 
-    return "\n\n".join(parts)
+    A file is parsed (and validated) once and re-read only when its mtime changes,
+    so editing a YAML takes effect on the next request without a restart. Per
+    template it records render count, render time and rendered token length.
+    """
+    def __init__(self, prompts_dir=PROMPTS_DIR, token_model: str = "gemini-flash-latest"):
+        self.prompts_dir = Path(prompts_dir)
+        self.token_model = token_model
+        self._lock = threading.Lock()
+        self._compiled = {}
+        self._stats = {}
+        self.reloads = 0
+
+    def get(self, filename: str) -> CompiledPrompt:
+        path = self.prompts_dir / filename
+        mtime_ns = os.stat(path).st_mtime_ns
+        compiled = self._compiled.get(filename)
+        if compiled is not None and compiled.mtime_ns == mtime_ns:
+            return compiled
+        with self._lock:
+            compiled = self._compiled.get(filename)
+            if compiled is None or compiled.mtime_ns != mtime_ns:
+                with open(path, 'r', encoding="utf-8") as f:
+                    compiled = CompiledPrompt(filename, yaml.safe_load(f), mtime_ns)
+                if filename in self._compiled:
+                    self.reloads += 1
+                self._compiled[filename] = compiled
+        return compiled
+
+    def validate_all(self):
+        """Compile every prompt file now so a malformed one fails at startup, not mid-request."""
+        for path in sorted(self.prompts_dir.glob("*.yml")):
+            self.get(path.name)
+
+    def render(self, filename: str, part: str, **kwargs) -> str:
+        start = time.perf_counter()
+        compiled = self.get(filename)
+        text = compiled.prefix(**kwargs) if part == "prefix" else compiled.suffix(**kwargs)
+        elapsed = time.perf_counter() - start
+        tokens = count_tokens(text, self.token_model)
+        with self._lock:
+            s = self._stats.setdefault(f"{filename}:{part}", {"renders": 0, "render_seconds": 0.0, "tokens_total": 0, "last_tokens": 0})
+            s["renders"] += 1
+            s["render_seconds"] += elapsed
+            s["tokens_total"] += tokens
+            s["last_tokens"] = tokens
+        return text
+
+    def stats(self) -> dict:
+        with self._lock:
+            templates = {
+                name: dict(s, avg_render_ms=s["render_seconds"] * 1000 / s["renders"], avg_tokens=s["tokens_total"] / s["renders"])
+                for name, s in self._stats.items()
+            }
+            return {"loaded": sorted(self._compiled), "reloads": self.reloads, "templates": templates}
+
+
+# Single shared instance for the process
+prompt_registry = PromptRegistry()
+
+
+def load_prompt_prefix(filename: str, **static_kwargs) -> str:
+    """
+    Static part of a prompt: system, static (reference data), examples, format.
+    It only changes when the references do, so it can be rendered once and cached
+    (see pipeline/utils/prompt_prefix.py).
+    """
+    return prompt_registry.render(filename, "prefix", **static_kwargs)
+
+
+def load_prompt_suffix(filename: str, **kwargs) -> str:
+    """Per-question part of a prompt: the user section."""
+    return prompt_registry.render(filename, "suffix", **kwargs)
+
+
+def load_prompt(filename: str, **kwargs) -> str:
+    """Full prompt in one string; kwargs fill both the static and the user section."""
+    parts = (load_prompt_prefix(filename, **kwargs), load_prompt_suffix(filename, **kwargs))
+    return "\n\n".join(p for p in parts if p)
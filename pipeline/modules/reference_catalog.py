@@ -0,0 +1,109 @@
+# reference_catalog.py
+import ast
+import logging
+import threading
+
+import pandas as pd
+
+from pipeline.modules.load_references import load_references, reference_version
+from pipeline.modules.joining_instructions import CSV_FILE_PATH, build_join_adjacency
+
+logger = logging.getLogger(__name__)
+
+# Columns of crs_columns.csv that never go into the column prompt
+COLUMN_PROMPT_DROP = ['id', 'Column_Confidential_Subclass', 'Table_name']
+
+
+def _parse_table_list(value):
+    """crs_metrics.csv stores Table_name as a Python list literal: "['schema.table']"."""
+    if not isinstance(value, str):
+        return ()
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return (value,)
+    return tuple(parsed) if isinstance(parsed, (list, tuple)) else (str(parsed),)
+
+
+class ReferenceCatalog:
+    """
+    Every reference CSV loaded once, plus the derived views the stages need, so no
+    stage re-reads a CSV or rebuilds a set/CSV string per request:
+
+        table_names          frozenset of valid table names (fuzzy correction)
+        tables_prompt_csv    tables_reference rendered for the intent prompt
+        columns_prompt_csv   columns_reference minus non-prompt columns, rendered
+        column_tables        column name -> tables that have it
+        table_columns        table name  -> its column names
+        join_adjacency       from_table -> {to_table: instruction} (lowercased names)
+        metrics              metric name (lowercase) -> metrics row as dict
+
+    Treat instances as immutable: a reload builds a new catalog and swaps it in
+    (ReferenceCatalogHolder), so in-flight requests keep a consistent view.
+    """
+    def __init__(self, metrics_reference, columns_reference, tables_reference, joining_reference, version):
+        self.metrics_reference = metrics_reference
+        self.columns_reference = columns_reference
+        self.tables_reference = tables_reference
+        self.version = version
+
+        self.table_names = frozenset(tables_reference["Table_names"])
+        self.tables_prompt_csv = tables_reference.to_csv(index=False)
+        self.columns_prompt_csv = columns_reference.drop(columns=COLUMN_PROMPT_DROP, errors="ignore").to_csv(index=False)
+
+        column_tables, table_columns = {}, {}
+        for column, table in zip(columns_reference["Columns"], columns_reference["Table_name"]):
+            column_tables.setdefault(column, []).append(table)
+            table_columns.setdefault(table, []).append(column)
+        self.column_tables = {k: tuple(v) for k, v in column_tables.items()}
+        self.table_columns = {k: tuple(v) for k, v in table_columns.items()}
+
+        self.join_adjacency = build_join_adjacency(joining_reference) if joining_reference is not None else {}
+
+        self.metrics = {}
+        for row in metrics_reference.to_dict(orient="records"):
+            row["tables"] = _parse_table_list(row.get("Table_name"))
+            self.metrics[str(row["Metrics"]).lower()] = row
+
+    def __iter__(self):
+        # Backwards compatible unpacking: metrics_reference, columns_reference, tables_reference = catalog
+        return iter((self.metrics_reference, self.columns_reference, self.tables_reference))
+
+    @classmethod
+    def load(cls, metrics_path="crs_metrics.csv", columns_path="crs_columns.csv",
+             tables_path="crs_tables.csv", joining_path=CSV_FILE_PATH):
+        metrics_reference, columns_reference, tables_reference = load_references(metrics_path, columns_path, tables_path)
+        try:
+            joining_reference = pd.read_csv(joining_path, index_col=0)
+        except Exception as e:
+            logger.warning("Joining instructions not loaded: %s", e)
+            joining_reference = None
+        version = reference_version((metrics_path, columns_path, tables_path, joining_path))
+        return cls(metrics_reference, columns_reference, tables_reference, joining_reference, version)
+
+
+class ReferenceCatalogHolder:
+    """The current ReferenceCatalog; swap() replaces it atomically for new requests."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalog = None
+        self.swaps = 0
+
+    def current(self):
+        return self._catalog
+
+    def swap(self, catalog):
+        with self._lock:
+            previous, self._catalog = self._catalog, catalog
+            self.swaps += 1
+        if previous is not None and previous.version != catalog.version:
+            logger.info("[Catalog] Reference catalog %s -> %s", previous.version, catalog.version)
+        return catalog
+
+    def reload(self, **paths):
+        """Rebuild from disk and swap in; readers holding the old catalog are unaffected."""
+        return self.swap(ReferenceCatalog.load(**paths))
+
+
+# Single shared instance for the process
+reference_catalogs = ReferenceCatalogHolder()
@@ -72,51 +72,45 @@
 
 
 import re
+import functools
+
+from pipeline.modules.gazetteer import Gazetteer, GazetteerHolder
+
+# Always-known sample names; the full gazetteer (GAZETTEER_SOURCE) is merged over it
+LOCATION_MAP = {
+    "area": ['Adoni Area','Ahamedpur Area','Ahmednagar Area'],
+    "division" : ['Aurangabad Division','Azamgarh Division'],
+    "state": ['Andhra Pradesh','Karnataka','Tamil Nadu'],
+    "zone": ['AP -TS Zone','Aurangabad Zone'],
+    "district": ['Adilabad','Ahmednagar','Ajmer'],
+    "sub-district": ['Adoni','Afzalpur'],
+    "branch": ['AHAMEDPUR-2','ARAKONAM-2']
+}
+
+# Single shared instance for the process: compiled LOCATION_MAP until the
+# gazetteer file / branch master has loaded in the background
+gazetteers = GazetteerHolder(LOCATION_MAP)
+
+def location_gazetteer(location_map=None):
+    """The current gazetteer, or `location_map` ({type: [names]} or Gazetteer) compiled."""
+    return gazetteers.current() if location_map is None else Gazetteer.of(location_map)
 
 # ---------------- Location Handling ----------------
-def detect_labeled_location(query, location_map):
+def detect_labeled_location(query, location_map=None):
     """Detect locations in query with labels, mark unknowns as 'invalid'"""
     found = set()
-    for loc_type, names in location_map.items():
-        pattern = re.compile(rf'\b{loc_type}\s+([\w\- ]+)\b', re.IGNORECASE)
-        for match in pattern.finditer(query):
-            labeled_name = match.group(1).strip().lower()
-            known_names = [n.lower() for n in names]
-            if labeled_name in known_names:
-                found.add((labeled_name, loc_type))
-            else:
-                found.add((labeled_name, "invalid"))
+    for m in location_gazetteer(location_map).matches(query):
+        if m.label is not None:
+            found.add((m.name.lower(), m.label if m.label in m.types else "invalid"))
     return found
 
-def match_locations(query, location_map):
+def match_locations(query, location_map=None):
     """Return all exact location matches in query"""
-    matches = []
-    lowered_query = query.lower()
-    for location_type, names in location_map.items():
-        for name in names:
-            if name.lower() in lowered_query:
-                matches.append((name, location_type))
-    return matches
-
-def label_locations_in_query(query, location_map):
-    """Main function to label locations in the query"""
-    matches = match_locations(query, location_map)
-    labeled = detect_labeled_location(query, location_map)
-    matches = sorted(matches, key=lambda x: -len(x[0]))  # longer names first
-
-    for name, loc_type in matches:
-        name_lc = name.lower()
-        if (name_lc, loc_type) in labeled or (name_lc, "invalid") in labeled:
-            continue
-
-        already_labeled_pattern = re.compile(rf'\b{loc_type}\s+{re.escape(name)}\b', re.IGNORECASE)
-        if already_labeled_pattern.search(query):
-            continue
+    return [(m.name, m.types[0]) for m in location_gazetteer(location_map).matches(query)]
 
-        name_pattern = re.compile(rf'\b{re.escape(name)}\b', re.IGNORECASE)
-        query = name_pattern.sub(f"{loc_type} {name}", query)
-
-    return query
+def label_locations_in_query(query, location_map=None):
+    """Main function to label locations in the query"""
+    return location_gazetteer(location_map).label(query)
 
 # ---------------- Keyword Handling ----------------
 def add_missing_keywords(query):
@@ -141,20 +135,81 @@ def add_missing_keywords(query):
 
 # ---------------- Orchestrator ----------------
 def rephrase_question(question):
-    LOCATION_MAP = {
-        "area": ['Adoni Area','Ahamedpur Area','Ahmednagar Area'],
-        "division" : ['Aurangabad Division','Azamgarh Division'],
-        "state": ['Andhra Pradesh','Karnataka','Tamil Nadu'],
-        "zone": ['AP -TS Zone','Aurangabad Zone'],
-        "district": ['Adilabad','Ahmednagar','Ajmer'],
-        "sub-district": ['Adoni','Afzalpur'],
-        "branch": ['AHAMEDPUR-2','ARAKONAM-2']
-    }
-
     # 1️⃣ Label locations
-    question = label_locations_in_query(question, LOCATION_MAP)
+    question = label_locations_in_query(question)
 
     # 2️⃣ Add missing keywords & normalize
     question = add_missing_keywords(question)
 
     return question
+
+# ---------------- Entity Extraction ----------------
+MONTH_PATTERN = re.compile(
+    r'\bMonth\s+(January|February|March|April|May|June|July|August|September|October|November|December)\s+(\d{4})\b',
+    re.IGNORECASE
+)
+CODE_PATTERN = re.compile(r'\b[A-Za-z]{1,4}-?\d{3,}\b')           # branch / member codes e.g. IN0010097, B001
+DATE_PATTERN = re.compile(r'\b\d{4}-\d{1,2}-\d{1,2}\b|\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b')
+NUMBER_PATTERN = re.compile(r'(?<![\w.-])\d+(?:\.\d+)?(?![\w.])')
+RELATIVE_TIME_PATTERN = re.compile(
+    r'\b(today|yesterday|(?:last|this|previous|current|next)\s+(?:day|week|month|quarter|year|fy|financial year))\b',
+    re.IGNORECASE
+)
+MONTH_NAME_PATTERN = re.compile(
+    r'\b(January|February|March|April|May|June|July|August|September|October|November|December)\b',
+    re.IGNORECASE
+)
+QUARTER_PATTERN = re.compile(r'\b([QH])([1-4])(?!\d)', re.IGNORECASE)    # Q1..Q4, H1/H2 (also in "Q1FY24")
+FISCAL_YEAR_PATTERN = re.compile(r'(?<![A-Za-z])FY\s*\'?\s*(\d{2}(?:\d{2})?(?:\s*[-/]\s*\d{2,4})?)\b', re.IGNORECASE)
+# Label words whose next word is a value even when it is not a known location ("member Ramesh")
+VALUE_LABELS = ("member",)
+# Words after a label that are not a value ("branch wise", "by state and zone")
+LABEL_STOPWORDS = {
+    "wise", "level", "name", "names", "id", "ids", "code", "codes", "count", "master", "type",
+    "for", "in", "of", "by", "and", "or", "the", "with", "to", "from", "on", "at", "is", "are",
+}
+
+@functools.lru_cache(maxsize=8)
+def _label_value_pattern(labels):
+    alternatives = "|".join(re.escape(label) for label in sorted(labels, key=len, reverse=True))
+    return re.compile(rf'(?<![\w-])({alternatives})\s+([\w][\w-]*)', re.IGNORECASE)
+
+def extract_entities(rephrased_question, location_map=None):
+    """
+    Literal values in a rephrased question that change the generated SQL:
+    labelled locations, the word after any location or `member` label (known
+    name or not), month names with or without a year, quarters / fiscal years,
+    codes (branch IDs), dates, relative time phrases and bare numbers.
+    Returns a frozenset of (kind, value) pairs so two questions can be compared exactly.
+    """
+    entities = set()
+    text = rephrased_question or ""
+
+    gazetteer = location_gazetteer(location_map)
+    known_labels = set()
+    for m in gazetteer.labeled(text):
+        entities.add((m.label, m.name.lower()))
+        known_labels.add(m.label_start)
+    for m in _label_value_pattern(tuple(gazetteer.location_map) + VALUE_LABELS).finditer(text):
+        value = m.group(2).lower()
+        if m.start() not in known_labels and value not in LABEL_STOPWORDS:
+            entities.add((m.group(1).lower(), value))
+
+    for month, year in MONTH_PATTERN.findall(text):
+        entities.add(("month", f"{month.lower()} {year}"))
+    for month in MONTH_NAME_PATTERN.findall(text):
+        entities.add(("month_name", month.lower()))
+    for period, n in QUARTER_PATTERN.findall(text):
+        entities.add(("quarter" if period.upper() == "Q" else "half", f"{period.lower()}{n}"))
+    for year in FISCAL_YEAR_PATTERN.findall(text):
+        entities.add(("fiscal_year", re.sub(r'\s+', '', year)))
+    for code in CODE_PATTERN.findall(text):
+        entities.add(("code", code.upper()))
+    for date in DATE_PATTERN.findall(text):
+        entities.add(("date", date))
+    for phrase in RELATIVE_TIME_PATTERN.findall(text):
+        entities.add(("relative_time", re.sub(r'\s+', ' ', phrase.lower())))
+    for number in NUMBER_PATTERN.findall(text):
+        entities.add(("number", number))
+
+    return frozenset(entities)
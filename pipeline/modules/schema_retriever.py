@@ -0,0 +1,187 @@
+# schema_retriever.py
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import faiss
+
+from pipeline.modules.fewshot_module import normalize
+
+logger = logging.getLogger(__name__)
+
+# Pruning is only worth it for large catalogs: below the threshold the full
+# schema is sent (and stays prompt-prefix cacheable). "1" forces it on, "0" off.
+SCHEMA_PRUNING = os.getenv("SCHEMA_PRUNING", "auto")
+SCHEMA_PRUNING_MIN_TABLES = int(os.getenv("SCHEMA_PRUNING_MIN_TABLES", "30"))
+SCHEMA_TOP_TABLES = int(os.getenv("SCHEMA_TOP_TABLES", "8"))
+SCHEMA_TOP_COLUMNS = int(os.getenv("SCHEMA_TOP_COLUMNS", "40"))
+
+TABLE_ID_SUFFIX = re.compile(r'(_\d{6,})+$')
+
+
+def _mention_matcher(names_by_alias):
+    """One precompiled alternation over every alias -> (pattern, alias -> owners)."""
+    aliases = sorted(names_by_alias, key=len, reverse=True)
+    if not aliases:
+        return None, names_by_alias
+    return re.compile(r'\b(' + "|".join(re.escape(a) for a in aliases) + r')\b'), names_by_alias
+
+
+def _mentioned(matcher, text):
+    pattern, owners = matcher
+    found = set()
+    if pattern is not None:
+        for m in pattern.finditer(text):
+            found.update(owners[m.group(1)])
+    return found
+
+
+def table_aliases(table_name: str):
+    """
+    Ways a table can be named in a question:
+        accessdetails.__genai_arrear_details_1756049949594103_1756052901040
+     -> {"arrear details", "arrear_details"}
+    """
+    core = table_name.split(".")[-1]
+    core = TABLE_ID_SUFFIX.sub("", core)
+    core = re.sub(r'^_*(genai_)?', '', core)
+    return {core.lower(), core.replace("_", " ").lower()}
+
+
+class SchemaRetriever:
+    """
+    Embeds table descriptions and column GPT instructions with the few-shot
+    Embedder into two FAISS inner-product indexes and returns only the relevant
+    slice of the catalog for the intent and column prompts.
+
+    Recall safeguards:
+      - tables named in the question are always kept
+      - tables owning one of the best-matching columns are kept
+      - the column prompt keeps every column of the tables the intent step chose
+        that is named in the question or marked "Always use"
+    Subsets are memoized per selection, so a recurring selection returns the same
+    DataFrame object and its rendered prompt prefix is reused.
+    """
+    def __init__(self, top_tables: int = 8, top_columns: int = 40, subset_cache_size: int = 256):
+        self.top_tables = top_tables
+        self.top_columns = top_columns
+        self.subset_cache_size = subset_cache_size
+        self._lock = threading.Lock()
+        self._built_for = None      # (tables_reference, columns_reference) the indexes were built from
+        self.table_index = None
+        self.column_index = None
+        self._table_mentions = (None, {})    # alias -> table names
+        self._column_mentions = (None, {})   # column name form -> row positions
+        self._subsets = OrderedDict()
+
+    # ---------------- Index ----------------
+    def enabled_for(self, tables_reference) -> bool:
+        if SCHEMA_PRUNING == "1":
+            return True
+        if SCHEMA_PRUNING == "0":
+            return False
+        return len(tables_reference) >= SCHEMA_PRUNING_MIN_TABLES
+
+    def ensure_built(self, tables_reference, columns_reference, embedder):
+        """(Re)build both indexes when the reference DataFrames change."""
+        with self._lock:
+            built = self._built_for
+            if built is not None and built[0] is tables_reference and built[1] is columns_reference:
+                return
+            table_texts = [
+                normalize(f"{' '.join(table_aliases(name))} {desc}")
+                for name, desc in zip(tables_reference["Table_names"], tables_reference["Table_description"].fillna(""))
+            ]
+            column_texts = [
+                normalize(f"{col} {instr}")
+                for col, instr in zip(columns_reference["Columns"], columns_reference["GPT Instructions"].fillna(""))
+            ]
+            self.table_index = self._index(embedder.embed_batch(table_texts, use_cache=False))
+            self.column_index = self._index(embedder.embed_batch(column_texts, use_cache=False))
+
+            table_owners, column_owners = {}, {}
+            for name in tables_reference["Table_names"]:
+                for alias in table_aliases(name):
+                    table_owners.setdefault(alias, set()).add(name)
+            for i, col in enumerate(columns_reference["Columns"]):
+                col = str(col).lower()
+                for form in {col, col.replace("_", " ")}:
+                    column_owners.setdefault(form, set()).add(i)
+            self._table_mentions = _mention_matcher(table_owners)
+            self._column_mentions = _mention_matcher(column_owners)
+            self._built_for = (tables_reference, columns_reference)
+            self._subsets.clear()
+            logger.info("[Schema] Indexed %d tables, %d columns", len(table_texts), len(column_texts))
+
+    @staticmethod
+    def _index(vectors):
+        index = faiss.IndexFlatIP(vectors.shape[1])
+        index.add(vectors)
+        return index
+
+    def _subset(self, key, frame, mask):
+        """Same selection -> same DataFrame object (keeps prompt prefixes cacheable)."""
+        with self._lock:
+            subset = self._subsets.get(key)
+            if subset is not None:
+                self._subsets.move_to_end(key)
+                return subset
+            subset = frame[mask].reset_index(drop=True)
+            self._subsets[key] = subset
+            if len(self._subsets) > self.subset_cache_size:
+                self._subsets.popitem(last=False)
+            return subset
+
+    # ---------------- Pruning ----------------
+    def prune_tables(self, question, query_vec, tables_reference, columns_reference):
+        """tables_reference restricted to the top-N tables plus the recall safeguards."""
+        names = list(tables_reference["Table_names"])
+        query = np.ascontiguousarray(np.asarray(query_vec, dtype="float32").reshape(1, -1))
+        text = question.lower()
+
+        keep = set()
+        _, ids = self.table_index.search(query, min(self.top_tables, len(names)))
+        keep.update(names[i] for i in ids[0] if i >= 0)
+
+        # Recall safeguard: explicitly named tables
+        keep.update(_mentioned(self._table_mentions, text))
+
+        # Tables behind the best-matching columns
+        _, ids = self.column_index.search(query, min(self.top_tables, len(columns_reference)))
+        owners = columns_reference["Table_name"].to_numpy()
+        known = set(names)
+        keep.update(owners[i] for i in ids[0] if i >= 0 and owners[i] in known)
+
+        mask = tables_reference["Table_names"].isin(keep).to_numpy()
+        return self._subset(("tables", frozenset(keep)), tables_reference, mask)
+
+    def prune_columns(self, question, query_vec, columns_reference, tables):
+        """Columns of the selected tables: top-N by similarity plus named / "Always use" columns."""
+        in_tables = columns_reference["Table_name"].isin(tables).to_numpy()
+        if not in_tables.any():
+            return columns_reference  # intent picked unknown tables; let the column step see everything
+
+        query = np.ascontiguousarray(np.asarray(query_vec, dtype="float32").reshape(1, -1))
+        scores = np.full(len(columns_reference), -np.inf, dtype="float32")
+        sims, ids = self.column_index.search(query, len(columns_reference))
+        scores[ids[0]] = sims[0]
+        scores[~in_tables] = -np.inf
+
+        keep = np.zeros(len(columns_reference), dtype=bool)
+        top = np.argsort(-scores)[:self.top_columns]
+        keep[top[np.isfinite(scores[top])]] = True
+
+        # Recall safeguards: columns named in the question or always required
+        named = np.zeros(len(columns_reference), dtype=bool)
+        named[list(_mentioned(self._column_mentions, question.lower()))] = True
+        always = columns_reference["GPT Instructions"].fillna("").str.lower().str.contains("always use", regex=False).to_numpy()
+        keep |= in_tables & (named | always)
+
+        return self._subset(("columns", frozenset(np.flatnonzero(keep).tolist())), columns_reference, keep)
+
+
+# Single shared instance for the process
+schema_retriever = SchemaRetriever(top_tables=SCHEMA_TOP_TABLES, top_columns=SCHEMA_TOP_COLUMNS)
@@ -0,0 +1,168 @@
+# sparse_bm25.py
+import os
+import logging
+
+import numpy as np
+from scipy import sparse
+
+from pipeline.modules.fewshot_module import normalize
+
+logger = logging.getLogger(__name__)
+
+BM25_FILE = "pickles/fewshot_bm25.npz"
+FORMAT_VERSION = 1
+
+
+def tokenize(text: str) -> list:
+    """The one tokenizer for BM25 documents and queries (same normalize() as few-shot retrieval)."""
+    return normalize(str(text)).split()
+
+
+class SparseBM25:
+    """
+    BM25Okapi (same k1/b/epsilon, IDF floor and scores as rank_bm25) backed by a
+    term-document sparse matrix.
+
+    The per-(document, term) BM25 weights are precomputed into a CSC matrix, so
+    scoring a query is one sparse matrix x query-term-count product instead of a
+    Python loop over documents per query term. get_scores(tokens) keeps the
+    rank_bm25 interface; get_scores(tokens, doc_ids=) scores only those
+    documents, at a cost that does not grow with the corpus.
+
+    Persisted with np.savez (vocabulary, term frequencies, IDF, document
+    lengths); load() needs no pickle. arrays() / from_arrays() expose the same
+    arrays (plus the weights) for the memory-mapped store (fewshot_store.py).
+    """
+    def __init__(self, vocab, tf, idf, doc_len, k1=1.5, b=0.75, epsilon=0.25, weights=None):
+        self.vocab = np.asarray(vocab, dtype=str)
+        self.term_ids = {term: i for i, term in enumerate(self.vocab)}
+        self.tf = sparse.csr_matrix(tf, dtype=np.float32)
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.doc_len = np.asarray(doc_len, dtype=np.float32)
+        self.k1, self.b, self.epsilon = k1, b, epsilon
+        self.corpus_size = self.tf.shape[0]
+        self.avgdl = float(self.doc_len.mean()) if self.corpus_size else 0.0
+        self.weights = weights if weights is not None else self._weights()
+
+    @staticmethod
+    def _term_frequencies(documents, term_ids):
+        """Tokenize documents into a (docs x len(term_ids)) tf matrix; new terms are added to term_ids."""
+        docs = [tokenize(d) for d in documents]
+        rows, cols = [], []
+        for row, tokens in enumerate(docs):
+            for token in tokens:
+                rows.append(row)
+                cols.append(term_ids.setdefault(token, len(term_ids)))
+        tf = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(docs), len(term_ids))
+        )
+        tf.sum_duplicates()
+        return tf, np.array([len(tokens) for tokens in docs], dtype=np.float32)
+
+    @staticmethod
+    def _idf(tf, epsilon):
+        """rank_bm25 BM25Okapi IDF: log(N - df + 0.5) - log(df + 0.5), negatives floored at epsilon * mean idf."""
+        n = tf.shape[0]
+        df = np.bincount(tf.indices, minlength=tf.shape[1]).astype(np.float64)
+        idf = np.log(n - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            idf[idf < 0] = epsilon * idf.mean()
+        return idf
+
+    @classmethod
+    def from_documents(cls, documents, k1=1.5, b=0.75, epsilon=0.25):
+        term_ids = {}
+        tf, doc_len = cls._term_frequencies(documents, term_ids)
+        vocab = sorted(term_ids, key=term_ids.get)
+        return cls(vocab, tf, cls._idf(tf, epsilon), doc_len, k1=k1, b=b, epsilon=epsilon)
+
+    def append(self, documents) -> "SparseBM25":
+        """
+        Model over the current documents plus `documents`. Only the new documents
+        are tokenized; IDF and weights are recomputed from the stacked tf matrix.
+        Returns a new instance, so readers holding this one are unaffected.
+        """
+        term_ids = dict(self.term_ids)
+        new_tf, new_len = self._term_frequencies(documents, term_ids)
+        old_tf = sparse.csr_matrix(
+            (self.tf.data, self.tf.indices, self.tf.indptr), shape=(self.corpus_size, len(term_ids))
+        )
+        tf = sparse.vstack([old_tf, new_tf], format="csr")
+        vocab = sorted(term_ids, key=term_ids.get)
+        return type(self)(vocab, tf, self._idf(tf, self.epsilon), np.concatenate([self.doc_len, new_len]),
+                          k1=self.k1, b=self.b, epsilon=self.epsilon)
+
+    def _weights(self):
+        """CSC matrix of idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))."""
+        tf = self.tf.tocoo()
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[tf.row] / (self.avgdl or 1.0))
+        data = self.idf[tf.col] * tf.data * (self.k1 + 1) / (tf.data + norm)
+        return sparse.csc_matrix((data.astype(np.float32), (tf.row, tf.col)), shape=self.tf.shape)
+
+    # ---------------- Scoring ----------------
+    def get_scores(self, query_tokens, doc_ids=None) -> np.ndarray:
+        """
+        BM25 score of every document (or of each of `doc_ids`, in that order) for
+        already-tokenized query terms (repeats count).
+        """
+        counts = {}
+        for token in query_tokens:
+            i = self.term_ids.get(token)
+            if i is not None:
+                counts[i] = counts.get(i, 0) + 1
+        if not counts:
+            return np.zeros(self.corpus_size if doc_ids is None else len(doc_ids), dtype=np.float32)
+        ids = np.fromiter(counts, dtype=np.int64, count=len(counts))
+        qtf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        if doc_ids is None:
+            return np.asarray(self.weights[:, ids] @ qtf, dtype=np.float32).ravel()
+
+        # Row slice of the CSR tf matrix: only the candidate documents are touched
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        tf = self.tf[doc_ids][:, ids].tocoo()
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_ids[tf.row]] / (self.avgdl or 1.0))
+        data = self.idf[ids[tf.col]] * tf.data * (self.k1 + 1) / (tf.data + norm) * qtf[tf.col]
+        return np.bincount(tf.row, weights=data, minlength=len(doc_ids)).astype(np.float32)
+
+    def score(self, text: str) -> np.ndarray:
+        return self.get_scores(tokenize(text))
+
+    # ---------------- Persistence ----------------
+    def arrays(self, include_weights: bool = False) -> dict:
+        arrays = {
+            "format_version": np.int64(FORMAT_VERSION),
+            "vocab": self.vocab,
+            "tf_data": self.tf.data, "tf_indices": self.tf.indices, "tf_indptr": self.tf.indptr,
+            "shape": np.asarray(self.tf.shape, dtype=np.int64),
+            "idf": self.idf,
+            "doc_len": self.doc_len,
+            "params": np.asarray([self.k1, self.b, self.epsilon], dtype=np.float64),
+        }
+        if include_weights:
+            arrays.update(w_data=self.weights.data, w_indices=self.weights.indices, w_indptr=self.weights.indptr)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, f, path: str = "<arrays>"):
+        """Inverse of arrays(); the arrays are used as given (memory-mapped ones stay mapped)."""
+        if int(f["format_version"]) != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported BM25 format {int(f['format_version'])}")
+        shape = tuple(int(n) for n in f["shape"])
+        tf = sparse.csr_matrix((f["tf_data"], f["tf_indices"], f["tf_indptr"]), shape=shape, copy=False)
+        weights = None
+        if "w_data" in f:
+            weights = sparse.csc_matrix((f["w_data"], f["w_indices"], f["w_indptr"]), shape=shape, copy=False)
+        k1, b, epsilon = f["params"]
+        return cls(f["vocab"], tf, f["idf"], f["doc_len"], k1=float(k1), b=float(b), epsilon=float(epsilon),
+                   weights=weights)
+
+    def save(self, path: str = BM25_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, **self.arrays())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = BM25_FILE):
+        with np.load(path, allow_pickle=False) as f:
+            return cls.from_arrays(f, path)
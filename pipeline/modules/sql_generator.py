@@ -2,14 +2,17 @@
 
 import re
 import logging
-from .llm_utils import call_llm, LLMCallError   # import exception too
-from .prompt_loader import load_prompt
+from .llm_utils import call_llm, LLMCallError, response_cache_key   # import exception too
+from .prompt_loader import load_prompt_suffix
+from pipeline.utils.prompt_prefix import prompt_prefixes
+from pipeline.utils.llm_response_cache import llm_response_cache
+from .prompt_budget import PromptBudget, drop_lowest_few_shot, drop_duplicate_join, truncate_longest_instruction
 
 # Setup basic logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def generate_sql_from_dto(dto, model="gemini-flash-latest", top_k=2, faiss_index=None, examples_df=None, embedder=None, bm25_model=None, tokenized_corpus=None):
+def generate_sql_from_dto(dto, model="gemini-flash-latest", top_k=2, faiss_index=None, examples_df=None, embedder=None, bm25_model=None, tokenized_corpus=None, deadline=None):
     """
     Generate SQL query from DTO using LLM, injecting few-shot examples directly from DTO.
     Stores few-shot examples and matched indices in the DTO.
@@ -34,22 +37,33 @@ def generate_sql_from_dto(dto, model="gemini-flash-latest", top_k=2, faiss_index
     logger.info(f"Similarity Flag: {bool(few_shot_examples)}")
     logger.info(f"Matched Indices: {matched_indices}")
 
-    # ---------------- Step 1: Format joinings ----------------
-    joinings_list = []
-    for j in dto.joinings:
-        join_str = f"{j['from_table']} -> {j['to_table']}: {j['instruction']}"
-        joinings_list.append(join_str)
-        logger.info(f"🔗 Adding joining: {join_str}")
-
-    # ---------------- Step 2: Load prompt ----------------
-    full_prompt = load_prompt(
-        "sql.yml",
-        rephrased_question=dto.rephrased_question,
-        selected_tables=dto.tables,
-        selected_columns=dto.columns,
-        joinings=joinings_list,
-        few_shot_examples=few_shot_examples  # Inject few-shot examples
-    )
+    # ---------------- Step 1: Working copies the budget may trim ----------------
+    few_shot_examples = dict(few_shot_examples)
+    joinings = [dict(j) for j in dto.joinings]
+    for j in joinings:
+        logger.info(f"🔗 Adding joining: {j['from_table']} -> {j['to_table']}: {j['instruction']}")
+
+    # ---------------- Step 2: Load prompt (within the model's token budget) ----------------
+    prefix = prompt_prefixes.render("sql.yml", sources=(), build=dict)  # system rules only
+
+    def render():
+        return load_prompt_suffix(
+            "sql.yml",
+            rephrased_question=dto.rephrased_question,
+            selected_tables=dto.tables,
+            selected_columns=dto.columns,
+            joinings="\n".join(f"{j['from_table']} -> {j['to_table']}: {j['instruction']}" for j in joinings) or "None",
+            few_shot_examples="\n".join(f"{k}: {v}" for k, v in few_shot_examples.items()) or "None"  # Inject few-shot examples
+        )
+
+    budget = PromptBudget(model, fixed_tokens=prompt_prefixes.handle(model, prefix).tokens)
+    full_prompt, budget_report = budget.fit(render, [
+        lambda: drop_lowest_few_shot(few_shot_examples),     # lower-scored few-shots first
+        lambda: drop_duplicate_join(joinings),               # then repeated join text
+        lambda: truncate_longest_instruction(joinings),      # then long instruction text
+    ])
+    if budget_report["dropped"]:
+        dto.extras = {**(dto.extras or {}), "prompt_budget": budget_report}
 
     # ---------------- Step 3: Call LLM ----------------
     try:
@@ -57,7 +71,9 @@ def generate_sql_from_dto(dto, model="gemini-flash-latest", top_k=2, faiss_index
             step_name="generate_sql",
             prompt=full_prompt,
             model_name=model,
-            response_format="text"
+            response_format="text",
+            deadline=deadline,
+            prefix=prefix
         )
     except LLMCallError as e:
         raise RuntimeError(f"[generate_sql] LLM failed: {str(e)}")
@@ -70,6 +86,14 @@ def generate_sql_from_dto(dto, model="gemini-flash-latest", top_k=2, faiss_index
     # ---------------- Step 5: Update DTO ----------------
     dto.sql_query = sql_query
     dto.sql_usage = sql_usage
+    dto.sql_cache_key = response_cache_key("generate_sql", full_prompt, model, prefix)
     logger.info("[SQL Generator] DTO Updated with SQL Query, Usage, and Few-Shot info")
 
     return dto
+
+
+def discard_generated_sql(dto):
+    """Forget the cached LLM output behind dto.sql_query (it failed to execute), so asking again regenerates it."""
+    if dto.sql_cache_key:
+        llm_response_cache.discard_key(dto.sql_cache_key)
+        dto.sql_cache_key = None
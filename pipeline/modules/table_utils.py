@@ -4,6 +4,9 @@ from pipeline.modules.validation import validate_tables_and_columns
 
 def correct_tables_and_columns(tables, columns, tables_reference):
     """
+    tables_reference: the tables DataFrame, or a prebuilt set of valid table
+    names (ReferenceCatalog.table_names) to skip rebuilding it per call.
+
     1. Fuzzy-correct table names based on reference.
     2. Filter out invalid tables.
     3. Remap columns to corrected table names.
@@ -14,7 +17,10 @@ def correct_tables_and_columns(tables, columns, tables_reference):
         final_columns: Dict of table -> list of columns with proper quoting
         corrections: Dict of original_table -> corrected_table
     """
-    valid_tables = set(tables_reference["Table_names"].tolist())
+    if isinstance(tables_reference, (set, frozenset)):
+        valid_tables = tables_reference
+    else:
+        valid_tables = set(tables_reference["Table_names"].tolist())
     
     # Step 1: Fuzzy correct tables
     corrected_tables = []
@@ -1,16 +1,16 @@
 # test_fewshot_pipeline.py
-import pickle
 import os
 import pandas as pd
 import faiss
 from pipeline.modules.fewshot_module import fetch_few_shots
+from pipeline.modules.sparse_bm25 import SparseBM25, tokenize
 from pipeline.modules.embedder import Embedder  # Your unified embedder
 from Openapi_key_store import OPENAI_API_KEY  # Your API key
 
 # ---- Initialize precomputed few-shot resources ----
 def init_fewshot_precomputed(
     faiss_file="embeddings/fewshot_embeddings.faiss",
-    bm25_file="pickles/sysntactic_model_few_shot.pkl",
+    bm25_file="pickles/fewshot_bm25.npz",
     examples_file="fewshot_example.csv"
 ):
     """
@@ -29,11 +29,10 @@ def init_fewshot_precomputed(
 
     # Load BM25
     if os.path.exists(bm25_file):
-        with open(bm25_file, "rb") as f:
-            bm25_model = pickle.load(f)
-        tokenized_corpus = [q.split() for q in examples_df["question"]]
+        bm25_model = SparseBM25.load(bm25_file)
+        tokenized_corpus = [tokenize(q) for q in examples_df["question"]]
     else:
-        print(f"⚠️ BM25 pickle not found at {bm25_file}")
+        print(f"⚠️ BM25 model not found at {bm25_file}")
         bm25_model = None
         tokenized_corpus = None
 
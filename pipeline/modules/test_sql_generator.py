@@ -0,0 +1,63 @@
+# test_sql_generator.py
+import pytest
+
+from utils.dto import PipelineDTO
+from pipeline.modules import llm_utils, prompt_budget, prompt_loader, sql_generator
+from pipeline.utils import prompt_prefix
+from pipeline.utils.llm_response_cache import llm_response_cache
+
+
+class FakeModel:
+    """Stands in for the Gemini model: returns the next SQL and counts calls."""
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        model = self
+
+        class Response:
+            text = model.outputs[min(model.calls, len(model.outputs)) - 1]
+            usage_metadata = None
+
+            def __iter__(self):
+                return iter([self])
+
+            def resolve(self):
+                pass
+        return Response()
+
+
+@pytest.fixture
+def model(monkeypatch, tmp_path):
+    fake = FakeModel(["SELECT * FROM no_such_table", "SELECT 1 AS x"])
+    monkeypatch.setattr(llm_response_cache, "cache_dir", str(tmp_path))
+    monkeypatch.setattr(llm_response_cache, "enabled", True)
+    monkeypatch.setattr(llm_utils.model_registry, "get", lambda name: fake)
+    # No tokenizer download: a rough count is enough here
+    for module in (llm_utils, prompt_budget, prompt_loader, prompt_prefix):
+        monkeypatch.setattr(module, "count_tokens", lambda text, model: len(text) // 4)
+    return fake
+
+
+def make_dto():
+    return PipelineDTO(input_question="overdue amount by zone", rephrased_question="overdue amount by zone",
+                       tables=["accessdetails.overdue"], columns={"accessdetails.overdue": ["zone", "amount"]})
+
+
+def test_identical_question_is_answered_from_the_response_cache(model):
+    assert sql_generator.generate_sql_from_dto(make_dto()).sql_query == "SELECT * FROM no_such_table"
+    assert sql_generator.generate_sql_from_dto(make_dto()).sql_query == "SELECT * FROM no_such_table"
+    assert model.calls == 1
+
+
+def test_sql_that_failed_to_execute_is_not_replayed(model):
+    dto = sql_generator.generate_sql_from_dto(make_dto())
+    assert dto.sql_query == "SELECT * FROM no_such_table"
+
+    # What run_pipeline_async does on QueryError / QueryTimeout
+    sql_generator.discard_generated_sql(dto)
+
+    assert sql_generator.generate_sql_from_dto(make_dto()).sql_query == "SELECT 1 AS x"
+    assert model.calls == 2
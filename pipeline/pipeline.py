@@ -206,79 +206,69 @@
 #         return dto.to_dict()
 
 #pipeline/pipeline.py
+import asyncio
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
-from pipeline.modules.llm_utils import LLMCallError
+from pipeline.modules.llm_utils import LLMCallError, model_registry, llm_step_stats
 from utils.dto import PipelineDTO
-from .modules.rephrase import rephrase_question
+from .modules.rephrase import rephrase_question, extract_entities, gazetteers
 from .modules.intent import identify_intent
-from pipeline.modules.sql_generator import generate_sql_from_dto
+from pipeline.modules.sql_generator import generate_sql_from_dto, discard_generated_sql
 from .modules.columns import identify_columns
-from pipeline.modules.load_references import load_references
-from utils.db_cred import execute_sql
+from pipeline.modules.reference_catalog import reference_catalogs
+from utils.db_cred import execute_sql, QueryError, QueryTimeout
 from utils.audit import save_master_record, save_child_records
 from pipeline.modules.joining_instructions import get_joining_instructions
 from pipeline.modules.table_utils import correct_tables_and_columns
+from pipeline.utils.answer_cache import answer_cache, normalize_question
+from pipeline.utils.semantic_cache import semantic_cache
+from pipeline.utils.template_cache import template_cache, mask_question
+from pipeline.utils.single_flight import single_flight, SingleFlightTimeout
+from pipeline.utils.startup import resources
+from pipeline.utils.deadline import as_deadline
+from pipeline.utils.llm_response_cache import llm_response_cache
+from pipeline.utils.prompt_prefix import prompt_prefixes
 
 # Few-Shot imports
-from pipeline.modules.fewshot_module import fetch_few_shots
-from pipeline.modules.embedder import Embedder
-import pandas as pd
-
+from pipeline.modules.fewshot_module import fetch_few_shots, normalize, embed_text
+from pipeline.modules.fewshot_index import fewshot_index
+from pipeline.modules.fewshot_store import process_memory
+from pipeline.modules.schema_retriever import schema_retriever
+from pipeline.modules.prompt_loader import prompt_registry
 import logging
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 logger.propagate = True  # let the root logger handle printing
 
-# ------------------ Startup resource init (cached) ------------------
+# ------------------ Startup resource init (background) ------------------
 import os
-import faiss
-import pickle
-
-# Helper that is safe on import: try/catch so server still starts if files missing
-def _load_startup_resources():
-    global metrics_reference, columns_reference, tables_reference
-    global examples_df, embedder, faiss_index, bm25_model, tokenized_corpus
-
-    # # references (already loaded in your code; ensure they are set)
-    # metrics_reference, columns_reference, tables_reference = load_references()
-
-    # # few-shot examples
-    try:
-        examples_df = pd.read_csv("fewshot_example.csv")
-    except Exception as e:
-        logger.warning("Few-shot CSV not found: %s", e)
-        examples_df = pd.DataFrame(columns=["question", "sql"])
-    # embedder instance (fast to create)
-    embedder = Embedder()
 
-    # precomputed FAISS index
-    faiss_index = None
-    try:
-        faiss_index = faiss.read_index("embeddings/fewshot_embeddings.faiss")
-        logger.info("Loaded FAISS index from embeddings/fewshot_embeddings.faiss")
-    except Exception as e:
-        logger.warning("FAISS index not found or failed to load: %s", e)
-
-    # precomputed BM25 model
-    bm25_model = None
-    try:
-        with open("pickles/sysntactic_model_few_shot.pkl", "rb") as f:
-            bm25_model = pickle.load(f)
-        logger.info("Loaded BM25 model from pickles/sysntactic_model_few_shot.pkl")
-    except Exception as e:
-        logger.warning("BM25 model not found or failed to load: %s", e)
-
-    # tokenized corpus for BM25
-    tokenized_corpus = [q.split(" ") for q in examples_df["question"]]
-
-# call once on import
-_load_startup_resources()
-
-
-# Load reference metadata once
-metrics_reference, columns_reference, tables_reference = load_references()
+# References, few-shot CSV, FAISS, BM25 and the embedder load on background
+# threads (restored from a snapshot on warm restarts); stages block on
+# resources.get(...) only for what they need. PIPELINE_STARTUP=lazy defers
+# loading until the first request instead of starting it at import.
+if os.getenv("PIPELINE_STARTUP", "background") != "lazy":
+    resources.start()
+# Open the Gemini channel before the first request instead of on it
+if os.getenv("LLM_WARMUP", "0") == "1":
+    model_registry.warmup_in_background(os.getenv("LLM_WARMUP_MODELS", "gemini-flash-latest").split(","))
+
+# Parse every prompt YAML now: a malformed file (e.g. "System:" instead of
+# "system:") fails at startup instead of silently dropping a section
+prompt_registry.validate_all()
+
+# Answer cache: on a hit, re-run the cached SQL (1) or serve the cached rows (0)
+ANSWER_CACHE_REEXECUTE = os.getenv("ANSWER_CACHE_REEXECUTE", "1") == "1"
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+
+# Request deadline in seconds (unset/0 = no deadline) and the budget one Gemini
+# round trip is assumed to need when deciding which stages to degrade
+PIPELINE_DEADLINE_SECONDS = float(os.getenv("PIPELINE_DEADLINE_SECONDS", "0")) or None
+DEADLINE_LLM_CALL_SECONDS = float(os.getenv("DEADLINE_LLM_CALL_SECONDS", "4"))
+# Minimum similarity for reusing a cached question's intent/columns when out of time
+DEADLINE_INTENT_REUSE_SCORE = float(os.getenv("DEADLINE_INTENT_REUSE_SCORE", "0.8"))
 
 # ------------------ Load Few-Shot Examples & Precomputed Models ------------------
 # examples_df = pd.read_csv("fewshot_example.csv")
@@ -297,74 +287,185 @@ metrics_reference, columns_reference, tables_reference = load_references()
 # tokenized_corpus = [q.split(" ") for q in examples_df["question"]]
 
 
-def run_pipeline(question: str, username: str = "default_user", model: str = "gemini-flash-latest") -> dict:
-    # Initialize DTO with proper defaults
-    dto = PipelineDTO(input_question=question)
-
-    logger.info("[Pipeline] Starting pipeline execution")
-    logger.info("[Pipeline] Original Question: %s", dto.input_question)
-
+def _record_step(dto, step, start, end, usage=None):
+    """Append a step timing/usage row consumed by the audit child records."""
+    usage = usage or {}
+    row = {
+        "step": step,
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "start_time": start,
+        "end_time": end
+    }
+    # LLM steps also report the static-prefix share of the prompt and time-to-first-token
+    for key in ("prefix_tokens", "cached_prompt_tokens", "ttft_seconds"):
+        if key in usage:
+            row[key] = usage[key]
+    dto.steps_usage.append(row)
+
+
+def _request_deadline(deadline=None):
+    """Deadline object for a request: explicit seconds/Deadline, else PIPELINE_DEADLINE_SECONDS."""
+    return as_deadline(deadline if deadline is not None else PIPELINE_DEADLINE_SECONDS)
+
+
+def _degrade(dto, stage, reason):
+    """Record that a stage was skipped or short-circuited to stay within the deadline."""
+    dto.extras = dto.extras or {}
+    dto.extras.setdefault("degraded", []).append({"stage": stage, "reason": reason})
+    logger.warning("[Pipeline] Degraded %s: %s", stage, reason)
+
+
+def _retrieve_few_shots(rephrased_question, query_vec=None, tables=None):
+    """Few-shot retrieval (embedding + FAISS + BM25), restricted to examples using `tables` when given."""
+    step_start = time.time()
+    # Examples added since startup (fewshot_index.add_examples / sync) are picked up here
+    state = fewshot_index.refresh()
+    if state is not None:
+        examples_df, faiss_index, bm25_model = state.examples_df, state.faiss_index, state.bm25
+    else:
+        examples_df, faiss_index, bm25_model = resources.get("examples_df"), resources.get("faiss_index"), resources.get("bm25")[0]
+    retrieval = fetch_few_shots(
+        user_question=rephrased_question,
+        faiss_index=faiss_index,
+        examples_df=examples_df,
+        embedder=resources.get("embedder"),
+        bm25_model=bm25_model,
+        top_k=2,
+        query_vec=query_vec,
+        tables=tables
+    )
+    return retrieval, step_start, time.time()
+
+
+def _embed_question(rephrased_question):
+    """FAISS-ready vector of the normalized question (shared by caches and few-shot retrieval)."""
+    return embed_text(normalize(rephrased_question), resources.get("embedder"))
+
+
+def _reference_catalog():
+    """Current ReferenceCatalog (swapped on reload); blocks only until startup has loaded one."""
+    return reference_catalogs.current() or resources.get("references")
+
+
+def _identify_tables_and_columns(rephrased_question, model, deadline=None, query_vec=None, catalog=None):
+    """
+    Intent LLM -> column LLM chain; returns both results with their step timings.
+    For large catalogs (see schema_retriever.py) each prompt only gets the
+    retrieved slice of the tables / columns reference.
+    """
+    catalog = catalog or _reference_catalog()
+    columns_reference, tables_reference = catalog.columns_reference, catalog.tables_reference
+    tables_csv, columns_csv = catalog.tables_prompt_csv, catalog.columns_prompt_csv
+    prune = schema_retriever.enabled_for(tables_reference)
+    if prune:
+        if query_vec is None:
+            query_vec = _embed_question(rephrased_question)
+        schema_retriever.ensure_built(tables_reference, columns_reference, resources.get("embedder"))
+        tables_reference = schema_retriever.prune_tables(rephrased_question, query_vec, tables_reference, columns_reference)
+        tables_csv = None
+        logger.info("[Pipeline] Schema pruned to %d tables", len(tables_reference))
+    step_start = time.time()
     try:
-        # ---------------- Step 1: Rephrase ----------------
-        step_start = time.time()
-        dto.rephrased_question = rephrase_question(dto.input_question)  # no need for add_missing_keywords
-        dto.keywords = list(set(getattr(dto, "keywords", [])))  # Deduplicate keywords
-        step_end = time.time()
-        dto.steps_usage.append({
-            "step": "rephrase_question",
-            "prompt_tokens": 0,
-            "completion_tokens": 0,
-            "start_time": step_start,
-            "end_time": step_end
-        })
-        logger.info("[Pipeline] Rephrased Question: %s", dto.rephrased_question)
-
+        intent_result, intent_usage = identify_intent(
+            rephrased_question,
+            tables_reference,
+            model=model,
+            deadline=deadline,
+            tables_csv=tables_csv
+        )
+    except LLMCallError as e:
+        # Handle LLM-specific failure
+        raise RuntimeError(f"[Pipeline] LLM failed during intent identification: {str(e)}")
+    intent_step = (step_start, time.time(), intent_usage)
+
+    if prune:
+        columns_reference = schema_retriever.prune_columns(
+            rephrased_question, query_vec, columns_reference, intent_result.get("tables", [])
+        )
+        columns_csv = None
+    step_start = time.time()
+    column_result, column_usage = identify_columns(
+        rephrased_question,
+        intent_result, columns_reference,
+        model=model,
+        deadline=deadline,
+        columns_csv=columns_csv
+    )
+    column_step = (step_start, time.time(), column_usage)
+
+    return intent_result, intent_step, column_result, column_step
+
+
+def _reuse_cached_intent(dto, model, query_vec, deadline, reference_version):
+    """
+    When the deadline leaves no room for the intent + column + SQL round trips, take
+    tables/columns/intent from the closest previously answered question instead.
+    Returns True when the DTO was filled.
+    """
+    if deadline.has(3 * DEADLINE_LLM_CALL_SECONDS) or query_vec is None or not SEMANTIC_CACHE_ENABLED:
+        return False
+    step_start = time.time()
+    entry, score = semantic_cache.nearest(query_vec, reference_version, model, min_score=DEADLINE_INTENT_REUSE_SCORE)
+    if entry is None:
+        return False
+    payload = entry["payload"]
+    dto.tables = list(payload["tables"])
+    dto.columns = dict(payload["columns"])
+    dto.selected_metric = payload["selected_metric"]
+    dto.keywords = list(payload["keywords"])
+    _record_step(dto, "cached_intent", step_start, time.time())
+    _degrade(dto, "intent_identification", f"reused intent of '{entry['question']}' (score {score:.3f}); {deadline.remaining():.1f}s left")
+    return True
+
+
+async def _run_llm_stages(dto, model, query_vec=None, deadline=None, catalog=None):
+    """
+    Everything between rephrasing and SQL execution, run as a small dependency graph:
+
+        (intent -> columns -> fuzzy correction -> joins) --+--> few-shot retrieval --> SQL generation
+        (few-shot embedding) ------------------------------+
+
+    The question embedding only needs the rephrased question, so it runs on a
+    worker thread while the two Gemini round trips for intent/columns are in
+    flight. Retrieval itself waits for the corrected tables and scores only the
+    examples whose SQL uses them (FEWSHOT_TABLE_FILTER).
+
+    With a deadline, stages degrade instead of overrunning it: the intent/columns
+    of the nearest cached question are reused when there is no time for both LLM
+    calls, and few-shots are dropped when retrieval would eat into the time
+    reserved for SQL generation.
+    """
+    deadline = as_deadline(deadline)
+    catalog = catalog or await asyncio.to_thread(_reference_catalog)
+    # ---------------- Step 1.5: Start Few-Shot Embedding in background ----------------
+    embed_task = None
+    if query_vec is None:
+        embed_task = asyncio.create_task(asyncio.to_thread(_embed_question, dto.rephrased_question))
+
+    async def retrieve_few_shots():
+        vec = query_vec if embed_task is None else await embed_task
+        return await asyncio.to_thread(_retrieve_few_shots, dto.rephrased_question, vec, dto.tables)
 
-        # ---------------- Step 2: Intent ----------------
-        step_start = time.time()
-        try:
-            intent_result, intent_usage = identify_intent(
-                dto.rephrased_question,
-                tables_reference,
-                model=model
+    try:
+        # ---------------- Step 2: Intent + Columns (LLM chain) ----------------
+        if not _reuse_cached_intent(dto, model, query_vec, deadline, catalog.version):
+            intent_result, intent_step, column_result, column_step = await asyncio.to_thread(
+                _identify_tables_and_columns, dto.rephrased_question, model, deadline, query_vec, catalog
             )
-        except LLMCallError as e:
-            # Handle LLM-specific failure
-            raise RuntimeError(f"[Pipeline] LLM failed during intent identification: {str(e)}")
-        step_end = time.time()
-        dto.tables = intent_result.get("tables", [])
-        dto.keywords = intent_result.get("keywords", [])
-        dto.selected_metric = intent_result
-        dto.steps_usage.append({
-            "step": "intent_identification",
-            "prompt_tokens": intent_usage.get("prompt_tokens", 0),
-            "completion_tokens": intent_usage.get("completion_tokens", 0),
-            "start_time": step_start,
-            "end_time": step_end
-        })
-
-        # ---------------- Step 2.1: Columns ----------------
-        step_start = time.time()
-        column_result, column_usage = identify_columns(
-            dto.rephrased_question,
-            intent_result, columns_reference,
-            model=model
-        )
-        step_end = time.time()
-        dto.columns = column_result.get("columns", {})
-        dto.keywords.extend(column_result.get("keywords", []))
-        dto.selected_metric = column_result
-        dto.steps_usage.append({
-            "step": "column_identification",
-            "prompt_tokens": column_usage.get("prompt_tokens", 0),
-            "completion_tokens": column_usage.get("completion_tokens", 0),
-            "start_time": step_start,
-            "end_time": step_end
-        })
+            dto.tables = intent_result.get("tables", [])
+            dto.keywords = intent_result.get("keywords", [])
+            dto.selected_metric = intent_result
+            _record_step(dto, "intent_identification", *intent_step)
+
+            dto.columns = column_result.get("columns", {})
+            dto.keywords.extend(column_result.get("keywords", []))
+            dto.selected_metric = column_result
+            _record_step(dto, "column_identification", *column_step)
 
         # ---------------- Step 2.5: Correct tables safely ----------------
 
-        dto.tables, dto.columns, corrections = correct_tables_and_columns(dto.tables, dto.columns, tables_reference)
+        dto.tables, dto.columns, corrections = correct_tables_and_columns(dto.tables, dto.columns, catalog.table_names)
         if corrections:
             logger.info("[Pipeline] Fuzzy Corrected Tables: %s", corrections)
         logger.info("[Pipeline] Final Tables to use: %s", dto.tables)
@@ -373,62 +474,195 @@ def run_pipeline(question: str, username: str = "default_user", model: str = "ge
 
         # ---------------- Step 4: Generate Join Instructions ----------------
         step_start = time.time()
-        dto.joinings = get_joining_instructions(dto.tables)
+        dto.joinings = get_joining_instructions(dto.tables, catalog.join_adjacency)
         logger.info("[Pipeline] Join Instructions: %s", dto.joinings)
 
-        # ---------------- Step 4.5: Run Few-Shot Retrieval ----------------
-        retrieval = fetch_few_shots(
-            user_question=dto.rephrased_question,
-            faiss_index=faiss_index,
-            examples_df=examples_df,
-            embedder=embedder,
-            bm25_model=bm25_model,
-            tokenized_corpus=tokenized_corpus,
-            top_k=2
-        )
+        # ---------------- Step 4.5: Few-Shot Retrieval on the selected tables ----------------
+        # Wait only as long as the budget allows while still leaving one LLM call for SQL
+        fewshot_wait = deadline.timeout()
+        if fewshot_wait is not None:
+            fewshot_wait = max(0.0, fewshot_wait - DEADLINE_LLM_CALL_SECONDS)
+        try:
+            retrieval, fewshot_start, fewshot_end = await asyncio.wait_for(retrieve_few_shots(), timeout=fewshot_wait)
+        except asyncio.TimeoutError:
+            _degrade(dto, "few_shot_retrieval", f"skipped; {deadline.remaining():.1f}s left")
+        else:
+            _record_step(dto, "few_shot_retrieval", fewshot_start, fewshot_end)
 
-        dto.few_shots = retrieval["few_shot_examples"]
-        dto.few_shot_matched_indices = retrieval["matched_indices"]
+            dto.few_shots = retrieval["few_shot_examples"]
+            dto.few_shot_matched_indices = retrieval["matched_indices"]
 
-        logger.info("[Pipeline] Retrieved %d few-shot examples", len(dto.few_shots)//2)
+            logger.info("[Pipeline] Retrieved %d few-shot examples (table candidates: %s)",
+                        len(dto.few_shots)//2, retrieval.get("table_candidates"))
 
         # ---------------- Step 5: Generate SQL ----------------
         try:
-            dto = generate_sql_from_dto(dto, model=model, top_k=2)
+            dto = await asyncio.to_thread(generate_sql_from_dto, dto, model=model, top_k=2, deadline=deadline)
         except LLMCallError as e:
             raise RuntimeError(f"[Pipeline] LLM failed during SQL generation: {str(e)}")
 
         step_end = time.time()
-        dto.steps_usage.append({
-            "step": "sql_generation",
-            "prompt_tokens": getattr(dto, "sql_usage", {}).get("prompt_tokens", 0),
-            "completion_tokens": getattr(dto, "sql_usage", {}).get("completion_tokens", 0),
-            "start_time": step_start,
-            "end_time": step_end
-        })
+        _record_step(dto, "sql_generation", step_start, step_end, getattr(dto, "sql_usage", None))
         logger.info("[Pipeline] Generated SQL:\n%s", dto.sql_query)
         logger.info("[Pipeline] Step Time: %.3fs", step_end - step_start)
+        return dto
+
+    finally:
+        # Don't leave a dangling embedding task behind when an earlier stage failed
+        if embed_task is not None and not embed_task.done():
+            embed_task.cancel()
+
+
+def _apply_cached_answer(dto, cached):
+    """Fill the DTO from an answer-cache entry instead of running the LLM stages."""
+    dto.query_in_cache = True
+    dto.tables = list(cached["tables"])
+    dto.columns = dict(cached["columns"])
+    dto.joinings = list(cached["joinings"])
+    dto.selected_metric = cached["selected_metric"]
+    dto.keywords = list(cached["keywords"])
+    dto.sql_query = cached["sql_query"]
+
+
+def _cacheable_answer(dto):
+    return {
+        "tables": dto.tables,
+        "columns": dto.columns,
+        "joinings": dto.joinings,
+        "selected_metric": dto.selected_metric,
+        "keywords": dto.keywords,
+        "sql_query": dto.sql_query,
+        "response": dto.response,
+    }
+
+
+async def run_pipeline_async(question: str, username: str = "default_user", model: str = "gemini-flash-latest", query_vec=None, deadline=None, rephrased_question=None) -> dict:
+    """
+    Async pipeline entry point.
+
+    The rephrased question is first looked up in the exact answer cache, then in
+    the semantic cache (paraphrases with identical entity literals), then in the
+    SQL template cache (same question shape, different literals). On a hit every
+    LLM stage is skipped and the cached SQL is re-executed (or, with
+    ANSWER_CACHE_REEXECUTE=0, the cached response is returned as-is).
+    query_vec: optional precomputed few-shot embedding (see run_pipeline_batch).
+    rephrased_question: rephrase_question(question) when the caller already computed it.
+    deadline: end-to-end budget in seconds (or a Deadline), default
+    PIPELINE_DEADLINE_SECONDS. Stages degrade to stay within it (see _run_llm_stages);
+    when nothing is left for SQL execution the generated SQL is returned without
+    rows and with an error explaining why.
+    """
+    deadline = _request_deadline(deadline)
+    # One catalog for the whole request; a reload mid-request does not mix versions
+    catalog = reference_catalogs.current() or await asyncio.to_thread(_reference_catalog)
+    # Initialize DTO with proper defaults
+    dto = PipelineDTO(input_question=question)
+
+    logger.info("[Pipeline] Starting pipeline execution")
+    logger.info("[Pipeline] Original Question: %s", dto.input_question)
+
+    try:
+        # ---------------- Step 1: Rephrase ----------------
+        step_start = time.time()
+        dto.rephrased_question = rephrased_question if rephrased_question is not None else rephrase_question(dto.input_question)
+        dto.keywords = list(set(getattr(dto, "keywords", [])))  # Deduplicate keywords
+        _record_step(dto, "rephrase_question", step_start, time.time())
+        logger.info("[Pipeline] Rephrased Question: %s", dto.rephrased_question)
+
+        # ---------------- Step 1.1: Answer cache ----------------
+        step_start = time.time()
+        cache_source = None
+        cache_key = answer_cache.make_key(dto.rephrased_question, catalog.version, model)
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            cache_source = "answer_cache"
+            _apply_cached_answer(dto, cached)
+            _record_step(dto, "answer_cache_hit", step_start, time.time())
+            logger.info("[Pipeline] Answer cache hit; skipping LLM stages")
+
+        # ---------------- Step 1.2: Semantic (near-duplicate) cache ----------------
+        entities = extract_entities(dto.rephrased_question)
+        if cached is None and SEMANTIC_CACHE_ENABLED:
+            step_start = time.time()
+            if query_vec is None:
+                # Same vector few-shot retrieval uses, so it is computed only once
+                query_vec = await asyncio.to_thread(_embed_question, dto.rephrased_question)
+            entry, score = semantic_cache.lookup(query_vec, entities, catalog.version, model)
+            if entry is not None:
+                cache_source = "semantic_cache"
+                cached = entry["payload"]
+                _apply_cached_answer(dto, cached)
+                dto.extras = {**(dto.extras or {}), "semantic_cache": {"matched_question": entry["question"], "score": score}}
+                _record_step(dto, "semantic_cache_hit", step_start, time.time())
+                logger.info("[Pipeline] Semantic cache hit (%.3f): %s", score, entry["question"])
+
+        # ---------------- Step 1.3: SQL template cache ----------------
+        masked_question, slots = mask_question(dto.rephrased_question)
+        sql_params = None
+        if cached is None and slots:
+            step_start = time.time()
+            hit = template_cache.lookup(masked_question, slots, catalog.version, model)
+            if hit is not None:
+                template, sql_params, rendered_sql = hit
+                cache_source = "template_cache"
+                cached = dict(template["payload"], sql_query=rendered_sql, response=[])
+                _apply_cached_answer(dto, cached)
+                dto.extras = {**(dto.extras or {}), "template_cache": {"template": masked_question, "params": sql_params}}
+                _record_step(dto, "template_cache_hit", step_start, time.time())
+                logger.info("[Pipeline] SQL template cache hit: %s", masked_question)
+
+        if cached is None:
+            dto = await _run_llm_stages(dto, model, query_vec, deadline, catalog)
 
 
         # ---------------- Step 6: Execute SQL ----------------
         step_start = time.time()
-        if dto.sql_query.strip():
-            dto.response = execute_sql(dto.sql_query)
-        else:
+        execution_failed = False
+        if dto.query_in_cache and not ANSWER_CACHE_REEXECUTE and cache_source != "template_cache":
+            dto.response = cached["response"]
+        elif not dto.sql_query.strip():
             dto.response = []
             logger.warning("[Pipeline] SQL Query was empty; skipping execution")
-        step_end = time.time()
-        dto.steps_usage.append({
-            "step": "sql_execution",
-            "prompt_tokens": 0,
-            "completion_tokens": 0,
-            "start_time": step_start,
-            "end_time": step_end
-        })
+        elif deadline.expired():
+            # Partial response: the SQL is returned, but there is no budget left to run it
+            dto.response = []
+            dto.errors.append(f"Deadline of {deadline.budget_seconds:.1f}s exceeded before SQL execution; returning the generated SQL without results")
+            _degrade(dto, "sql_execution", "aborted; deadline exceeded")
+        else:
+            try:
+                if sql_params is not None:
+                    # Template hit: run the shared skeleton with this question's literals as bound parameters
+                    dto.response = await asyncio.to_thread(execute_sql, template["skeleton"], sql_params, deadline.timeout())
+                else:
+                    dto.response = await asyncio.to_thread(execute_sql, dto.sql_query, None, deadline.timeout())
+            except QueryTimeout as e:
+                dto.response = []
+                dto.errors.append(str(e))
+                discard_generated_sql(dto)  # don't replay it from the LLM response cache
+                _degrade(dto, "sql_execution", "statement timeout")
+            except QueryError as e:
+                dto.response = []
+                dto.errors.append(str(e))
+                discard_generated_sql(dto)
+                execution_failed = True
+                logger.warning("[Pipeline] %s", e)
+        _record_step(dto, "sql_execution", step_start, time.time())
 
         logger.info("[Pipeline] SQL Execution Result : %s", json.dumps(dto.response, indent=2, default=str))
 
+        # Degraded answers (no few-shots, borrowed intent, no rows) and SQL that failed are never cached
+        cacheable = dto.sql_query.strip() and not execution_failed and not (dto.extras or {}).get("degraded")
+        if cache_source != "answer_cache" and cacheable:
+            answer_cache.put(cache_key, _cacheable_answer(dto))
+        if cache_source is None and query_vec is not None and cacheable:
+            semantic_cache.add(query_vec, dto.rephrased_question, entities, catalog.version, model, _cacheable_answer(dto))
+        if cache_source is None and slots and cacheable:
+            template_cache.learn(masked_question, slots, dto.sql_query, catalog.version, model, _cacheable_answer(dto))
+
         # ---------------- Step 7: Finalize ----------------
+        dto.end_time = time.time()
+        if deadline.budget_seconds:
+            dto.extras = {**(dto.extras or {}), "deadline": {"budget_seconds": deadline.budget_seconds, "remaining_seconds": round(deadline.remaining(), 3)}}
         dto.finalize_timing()
         dto.total_tokens = dto.compute_total_tokens()
         logger.info("[Pipeline] Total Tokens Across All Steps: %d", dto.total_tokens)
@@ -463,4 +697,119 @@ def run_pipeline(question: str, username: str = "default_user", model: str = "ge
         logger.error("[Pipeline] General Error caught: %s", str(e))
         dto.errors.append(str(e))
         dto.finalize_timing()
-        return dto.to_dict()
\ No newline at end of file
+        return dto.to_dict()
+
+
+def run_pipeline(question: str, username: str = "default_user", model: str = "gemini-flash-latest", query_vec=None, deadline=None, rephrased_question=None) -> dict:
+    """Synchronous entry point (Flask routes, ask.py) around run_pipeline_async."""
+    return asyncio.run(run_pipeline_async(question, username=username, model=model, query_vec=query_vec, deadline=deadline,
+                                          rephrased_question=rephrased_question))
+
+
+def run_pipeline_coalesced(question: str, username: str = "default_user", model: str = "gemini-flash-latest", deadline=None) -> dict:
+    """
+    run_pipeline with single-flight coalescing: concurrent callers asking the same
+    (normalized, rephrased) question share one in-flight execution. Every caller
+    still gets its own audit master row; followers log a zero-token
+    "coalesced_wait" step covering the time they waited. A follower waits at most
+    its own deadline; if the leader is still running then, it returns a degraded
+    result without SQL or rows.
+    """
+    deadline = _request_deadline(deadline)
+    rephrased = rephrase_question(question)
+    key = (normalize_question(rephrased), model)
+    wait_start = time.time()
+    try:
+        result, shared = single_flight.do(key, run_pipeline, question, username=username, model=model, deadline=deadline,
+                                          rephrased_question=rephrased, wait_timeout=deadline.timeout())
+    except SingleFlightTimeout:
+        dto = PipelineDTO(input_question=question, rephrased_question=rephrased)
+        dto.errors.append(f"Deadline of {deadline.budget_seconds:.1f}s exceeded while waiting for the same question already in flight")
+        _degrade(dto, "coalesced_wait", "deadline exceeded waiting for the in-flight request")
+        dto.finalize_timing()
+        result, shared = dto.to_dict(), True
+    if shared:
+        wait_end = time.time()
+        master_id = save_master_record(
+            username=username,
+            question=question,
+            response=result.get("response", []),
+            intent=result.get("selected_metric", {}),
+            sql_query=result.get("sql_query"),
+            tokens={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            start_time=wait_start,
+            end_time=wait_end,
+            status=not result.get("errors")
+        )
+        save_child_records(master_id, [{
+            "step": "coalesced_wait",
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "start_time": wait_start,
+            "end_time": wait_end
+        }])
+        result = dict(result, input_question=question)
+    return result
+
+
+def get_pipeline_metrics() -> dict:
+    """Counters for the caches and request coalescing (served on /user/metrics)."""
+    return {
+        "answer_cache": answer_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "template_cache": template_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "llm_models": model_registry.stats(),
+        "llm_response_cache": llm_response_cache.stats(),
+        "llm_steps": llm_step_stats.stats(),
+        "prompt_prefixes": prompt_prefixes.stats(),
+        "prompt_templates": prompt_registry.stats(),
+        "fewshot_index": fewshot_index.stats(),
+        "embedder": resources.peek("embedder").stats() if resources.peek("embedder") is not None else None,
+        "reference_catalog": {"version": getattr(reference_catalogs.current(), "version", None), "swaps": reference_catalogs.swaps},
+        "gazetteer": gazetteers.stats(),
+        "memory": {**process_memory(), "pid": os.getpid(), "fewshot_mapped": resources.mapped},
+    }
+
+
+def run_pipeline_batch(questions, username: str = "default_user", model: str = "gemini-flash-latest", concurrency: int = 4):
+    """
+    Run many questions and yield results as soon as each one finishes.
+
+    - Questions that rephrase to the same text are executed once and the result
+      is fanned out to every duplicate.
+    - Few-shot embeddings for all unique questions come from one batched
+      Embedder.embed_batch call instead of one encode per question.
+    - LLM stages run through a bounded pool of `concurrency` worker threads.
+
+    Yields dicts: {"index": <position in questions>, "question": ..., "result": <run_pipeline dict>}
+    """
+    questions = list(questions)
+    if not questions:
+        return
+
+    # ---------------- Dedupe on the rephrased question ----------------
+    groups = {}  # rephrased question -> list of input positions
+    for i, q in enumerate(questions):
+        groups.setdefault(rephrase_question(q), []).append(i)
+    logger.info("[Batch] %d questions, %d unique after rephrase", len(questions), len(groups))
+
+    # ---------------- One batched embedding call ----------------
+    unique = list(groups)
+    vectors = resources.get("embedder").embed_batch([normalize(q) for q in unique])
+
+    # ---------------- Bounded fan-out ----------------
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {
+            pool.submit(run_pipeline, questions[groups[rq][0]], username, model, vectors[n], rephrased_question=rq): rq
+            for n, rq in enumerate(unique)
+        }
+        for future in as_completed(futures):
+            rq = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:  # run_pipeline already converts stage errors; this is a last resort
+                logger.error("[Batch] Question failed: %s", str(e))
+                result = {"input_question": questions[groups[rq][0]], "errors": [str(e)]}
+            for i in groups[rq]:
+                yield {"index": i, "question": questions[i], "result": result}
@@ -0,0 +1,120 @@
+# answer_cache.py
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def normalize_question(question: str) -> str:
+    """Case/whitespace/trailing-punctuation insensitive form of a question used for cache keys."""
+    question = re.sub(r"\s+", " ", (question or "").strip().lower())
+    return question.rstrip(" ?.!")
+
+
+class AnswerCache:
+    """
+    In-memory end-to-end answer cache: rephrased question -> generated SQL (+ intent,
+    columns, joins and last response).
+
+    Entries expire after `ttl_seconds` and the cache keeps at most `max_entries`,
+    evicting the least recently used entry first. Thread-safe.
+    """
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(rephrased_question: str, reference_version: str, model: str = "") -> str:
+        raw = "\x1f".join([normalize_question(rephrased_question), reference_version or "", model or ""])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            stored_at, value = item
+            if self.ttl_seconds and time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key):
+        """The value if present and not expired, without counting a lookup or refreshing its LRU position."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or (self.ttl_seconds and time.time() - item[0] > self.ttl_seconds):
+                return None
+            return item[1]
+
+    def put(self, key, value):
+        """Store value; returns the (key, value) pairs evicted to make room."""
+        if self.max_entries <= 0:
+            return []
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            return self._evict_to(self.max_entries)
+
+    def trim(self, size: int):
+        """Evict least recently used entries until at most `size` remain; returns them."""
+        with self._lock:
+            return self._evict_to(size)
+
+    def _evict_to(self, size):
+        evicted = []
+        while len(self._entries) > max(size, 0):
+            key, (_, value) = self._entries.popitem(last=False)
+            evicted.append((key, value))
+            self.evictions += 1
+        return evicted
+
+    def expire(self):
+        """Drop every expired entry; returns the (key, value) pairs removed."""
+        if not self.ttl_seconds:
+            return []
+        with self._lock:
+            cutoff = time.time() - self.ttl_seconds
+            expired = [(key, value) for key, (stored_at, value) in self._entries.items() if stored_at < cutoff]
+            for key, _ in expired:
+                del self._entries[key]
+            self.expirations += len(expired)
+            return expired
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Single shared instance for the process
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+)
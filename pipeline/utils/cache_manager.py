@@ -18,5 +18,9 @@ class CacheManager:
         return None
 
     def save(self, name, obj):
-        with open(self.get_cache_path(name), "wb") as f:
-            pickle.dump(obj, f)
+        # write-then-rename so concurrent readers/workers never see a partial pickle
+        path = self.get_cache_path(name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
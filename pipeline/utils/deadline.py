@@ -0,0 +1,53 @@
+# deadline.py
+import math
+import time
+
+
+class DeadlineExceeded(RuntimeError):
+    """Raised when a request runs out of its end-to-end latency budget."""
+    pass
+
+
+class Deadline:
+    """
+    End-to-end latency budget for one pipeline request.
+    Created once in run_pipeline and passed to every stage so each stage can ask how
+    much time is left and degrade (skip, reuse cached results, abort) instead of
+    blowing the budget. Deadline(None) never expires.
+    """
+    def __init__(self, budget_seconds: float = None):
+        self.budget_seconds = budget_seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget_seconds if budget_seconds else None
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def has(self, seconds: float) -> bool:
+        """True when at least `seconds` of budget is left."""
+        return self.remaining() >= seconds
+
+    def timeout(self, cap: float = None):
+        """Per-call timeout: remaining budget (optionally capped), or cap/None without a deadline."""
+        remaining = self.remaining()
+        if remaining == math.inf:
+            return cap
+        return min(remaining, cap) if cap else remaining
+
+    def check(self, stage: str):
+        if self.expired():
+            raise DeadlineExceeded(
+                f"[{stage}] Request deadline of {self.budget_seconds:.1f}s exceeded"
+            )
+
+
+def as_deadline(deadline) -> Deadline:
+    """Accept a Deadline, a number of seconds or None."""
+    if isinstance(deadline, Deadline):
+        return deadline
+    return Deadline(deadline)
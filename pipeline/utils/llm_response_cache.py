@@ -0,0 +1,171 @@
+# llm_response_cache.py
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """
+    Content-addressed on-disk cache of raw LLM outputs, shared by worker processes.
+
+    - key: sha256 of (model, step, prompt); one JSON file per key under
+      <cache_dir>/<key[:2]>/<key>.json
+    - writes go to a temp file in the same directory and are os.replace'd in, so
+      readers in other processes never see a partial entry
+    - TTL: entries older than ttl_seconds are misses and get deleted
+    - LRU + size cap: a hit touches the file's mtime; when the directory grows past
+      max_bytes the least recently used files are removed down to 90% of the cap
+    - hits/misses are counted per step (this process only)
+    """
+    def __init__(self, cache_dir: str = "cache/llm_responses", ttl_seconds: float = 24 * 3600,
+                 max_bytes: int = 256 * 1024 * 1024, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._bytes = None          # approximate directory size, scanned lazily
+        self.step_stats = {}        # step -> {"hits": n, "misses": n}
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model: str, step: str, prompt: str) -> str:
+        return hashlib.sha256("\x00".join((model, step, prompt)).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _count(self, step, field):
+        with self._lock:
+            self.step_stats.setdefault(step, {"hits": 0, "misses": 0})[field] += 1
+
+    # ---------------- Public API ----------------
+    def get(self, model: str, step: str, prompt: str):
+        """Cached output string, or None."""
+        if not self.enabled:
+            return None
+        path = self._path(self.make_key(model, step, prompt))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count(step, "misses")
+            return None
+
+        if time.time() - entry.get("created", 0) > self.ttl_seconds:
+            self._remove(path)
+            self._count(step, "misses")
+            return None
+        try:
+            os.utime(path)  # LRU: mtime = last access
+        except OSError:
+            pass
+        self._count(step, "hits")
+        return entry["output"]
+
+    def put(self, model: str, step: str, prompt: str, output: str):
+        if not self.enabled or not output:
+            return
+        path = self._path(self.make_key(model, step, prompt))
+        payload = json.dumps({"model": model, "step": step, "created": time.time(), "output": output})
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("[LLMCache] Could not write %s: %s", path, e)
+            return
+
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._scan_size()
+            else:
+                self._bytes += len(payload)
+            over = self._bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def discard(self, model: str, step: str, prompt: str):
+        """Drop an entry whose output turned out unusable (e.g. invalid JSON)."""
+        self.discard_key(self.make_key(model, step, prompt))
+
+    def discard_key(self, key: str):
+        """discard() by make_key() value, for callers that only kept the key (e.g. SQL that failed to run)."""
+        self._remove(self._path(key))
+
+    def stats(self) -> dict:
+        with self._lock:
+            steps = {}
+            for step, counts in self.step_stats.items():
+                lookups = counts["hits"] + counts["misses"]
+                steps[step] = dict(counts, hit_ratio=counts["hits"] / lookups if lookups else 0.0)
+            return {
+                "enabled": self.enabled,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "steps": steps,
+            }
+
+    # ---------------- Housekeeping ----------------
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _files(self):
+        """(mtime, size, path) of every entry; other processes may delete files meanwhile."""
+        files = []
+        if not os.path.isdir(self.cache_dir):
+            return files
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, entry.path))
+        return files
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._files())
+
+    def _evict(self):
+        """Remove least recently used entries (expired ones first) until under 90% of max_bytes."""
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        now = time.time()
+        files.sort(key=lambda f: (now - f[0] <= self.ttl_seconds, f[0]))
+        removed = 0
+        for mtime, size, path in files:
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+        with self._lock:
+            self._bytes = total
+            self.evictions += removed
+        logger.info("[LLMCache] Evicted %d entries, %.1f MB left", removed, total / 1e6)
+
+
+# Single shared instance for the process (the directory is shared across processes)
+llm_response_cache = LLMResponseCache(
+    cache_dir=os.getenv("LLM_CACHE_DIR", "cache/llm_responses"),
+    ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 3600))),
+    max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024),
+    enabled=os.getenv("LLM_CACHE_ENABLED", "1") == "1",
+)
@@ -0,0 +1,134 @@
+# prompt_prefix.py
+import os
+import time
+import hashlib
+import logging
+import threading
+import weakref
+from datetime import timedelta
+
+from pipeline.modules.prompt_loader import load_prompt_prefix, prompt_registry
+from pipeline.modules.token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixHandle:
+    """A rendered static prompt prefix, its token count and (optionally) a provider context cache."""
+    __slots__ = ("key", "text", "tokens", "cached_content", "expires_at")
+
+    def __init__(self, key, text, tokens, cached_content=None, expires_at=None):
+        self.key = key
+        self.text = text
+        self.tokens = tokens
+        self.cached_content = cached_content   # genai CachedContent, None for the local stand-in
+        self.expires_at = expires_at
+
+
+class PromptPrefixCache:
+    """
+    Static prompt prefixes (system text + reference CSVs + examples) rendered once
+    and reused across requests; only the small per-question suffix is built per call.
+
+    render(): prefix text, cached until the prompt file is edited (the registry
+        reloads it) or one of its source objects (e.g. the tables_reference
+        DataFrame) is replaced, so to_csv() runs once per load.
+    handle(): per (model, prefix) handle used by call_llm.
+        backend "local"  - stand-in: keeps the prefix text and its token count;
+                           the full prompt is still sent.
+        backend "gemini" - a genai.caching.CachedContent holding the prefix; only
+                           the suffix is sent and Gemini bills the prefix as cached.
+                           Falls back to local if creation fails (e.g. prefix below
+                           the model's minimum cacheable size).
+    """
+    def __init__(self, backend: str = "local", ttl_seconds: float = 3600):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._rendered = {}     # (filename, source ids) -> (weakrefs, prompt mtime_ns, prefix)
+        self._handles = {}      # (model, sha) -> PrefixHandle
+        self._failed = set()    # (model, sha) the provider refused to cache
+        self.renders = 0
+        self.render_hits = 0
+        self.provider_creates = 0
+
+    # ---------------- Prefix rendering ----------------
+    def render(self, filename, sources, build):
+        """
+        Static prefix of a prompt file.
+        sources: objects the static part is derived from (identity-checked via weakrefs)
+        build:   zero-arg callable returning the static template kwargs
+        """
+        key = (filename, tuple(id(s) for s in sources))
+        mtime_ns = prompt_registry.get(filename).mtime_ns
+        with self._lock:
+            cached = self._rendered.get(key)
+            if (cached is not None and cached[1] == mtime_ns
+                    and all(ref() is src for ref, src in zip(cached[0], sources))):
+                self.render_hits += 1
+                return cached[2]
+
+        prefix = load_prompt_prefix(filename, **build())
+        # drop the entry as soon as a source object is garbage collected
+        forget = lambda _ref, key=key: self._rendered.pop(key, None)
+        with self._lock:
+            self._rendered[key] = (tuple(weakref.ref(s, forget) for s in sources), mtime_ns, prefix)
+            self.renders += 1
+        return prefix
+
+    # ---------------- Context cache handles ----------------
+    def handle(self, model_name, prefix) -> PrefixHandle:
+        sha = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        key = (model_name, sha)
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None and (handle.expires_at is None or handle.expires_at > time.time()):
+                return handle
+
+        handle = PrefixHandle(sha, prefix, count_tokens(prefix, model_name))
+        if self.backend == "gemini" and key not in self._failed:
+            self._attach_provider_cache(handle, model_name, key)
+        with self._lock:
+            self._handles[key] = handle
+        return handle
+
+    def _attach_provider_cache(self, handle, model_name, key):
+        import google.generativeai as genai
+        try:
+            handle.cached_content = genai.caching.CachedContent.create(
+                model=model_name if model_name.startswith("models/") else f"models/{model_name}",
+                display_name=f"prefix-{handle.key[:12]}",
+                contents=[handle.text],
+                ttl=timedelta(seconds=self.ttl_seconds),
+            )
+            # refresh a little before the provider drops it
+            handle.expires_at = time.time() + self.ttl_seconds * 0.9
+            self.provider_creates += 1
+            logger.info("[PromptPrefix] Created context cache %s (%d tokens)", handle.cached_content.name, handle.tokens)
+        except Exception as e:
+            self._failed.add(key)
+            logger.warning("[PromptPrefix] Context cache unavailable for %s, using local prefix: %s", model_name, e)
+
+    def clear(self):
+        with self._lock:
+            self._rendered.clear()
+            self._handles.clear()
+            self._failed.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "renders": self.renders,
+                "render_hits": self.render_hits,
+                "handles": len(self._handles),
+                "provider_caches": sum(1 for h in self._handles.values() if h.cached_content is not None),
+                "provider_creates": self.provider_creates,
+            }
+
+
+# Single shared instance for the process
+prompt_prefixes = PromptPrefixCache(
+    backend=os.getenv("PROMPT_CONTEXT_CACHE", "local"),
+    ttl_seconds=float(os.getenv("PROMPT_CONTEXT_CACHE_TTL_SECONDS", "3600")),
+)
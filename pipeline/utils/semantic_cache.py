@@ -0,0 +1,245 @@
+# semantic_cache.py
+import os
+import time
+import threading
+import itertools
+import numpy as np
+import faiss
+
+from pipeline.utils.answer_cache import AnswerCache
+from pipeline.modules.ann_index import index_spec, build_index
+
+
+class SemanticCache:
+    """
+    Near-duplicate question cache.
+
+    Every successfully answered question is embedded (same normalized, L2-normalized
+    vector used for few-shot retrieval) and appended to a growing FAISS inner-product
+    index. A new question reuses a stored answer only when
+      - cosine similarity >= threshold, and
+      - its extracted entity literals (branch IDs, months, locations, numbers, ...)
+        are exactly equal, so a paraphrase for another branch can never match, and
+      - reference version and model are the same.
+
+    Entries live in an AnswerCache (same TTL and LRU eviction as the answer
+    cache), so stored answers and response rows expire like theirs. Vectors are
+    kept in one FAISS index per (reference version, model), so entries of other
+    versions or models never take up the search_k candidates. When the cache is
+    full, the least recently used 5% are evicted at once and removed from their
+    index; expired entries are removed on the next add, or as soon as a search
+    returns them (the add-time sweep runs at most every sweep_seconds, a tenth of
+    the TTL capped at a minute, since it walks every entry).
+
+    The index type comes from ann_index (spec): flat (exact, the default) or
+    hnsw for a cache of hundreds of thousands of questions. IVF-PQ is not
+    offered, since it has to be trained before the first add. HNSW cannot
+    delete vectors, so removed entries are tombstoned: searches fetch that many
+    extra candidates and skip them, and a partition is rebuilt from its live
+    vectors once a fifth of it is tombstones.
+    """
+    def __init__(self, threshold: float = 0.92, max_entries: int = 50000, search_k: int = 5,
+                 ttl_seconds: float = 3600, spec: dict = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.search_k = search_k
+        self.spec = spec or index_spec("flat")
+        if self.spec["type"] not in ("flat", "hnsw"):
+            raise ValueError(f"semantic cache index must be flat or hnsw, got {self.spec['type']!r}")
+        self.store = AnswerCache(max_entries=max_entries, ttl_seconds=ttl_seconds)   # entry id -> entry dict
+        self._indexes = {}         # (reference_version, model) -> IndexIDMap2 over entry ids
+        self._live = {}            # partition -> ids still in the store
+        self._tombstones = {}      # partition -> removed ids still in an HNSW index
+        self._ids = itertools.count()
+        self.sweep_seconds = min(max(ttl_seconds, 0) / 10, 60)
+        self._next_sweep = 0.0
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.entity_rejects = 0
+
+    @staticmethod
+    def _as_query(vec):
+        return np.ascontiguousarray(np.asarray(vec, dtype="float32").reshape(1, -1))
+
+    def _new_index(self, dim, ids=(), vectors=None):
+        vectors = np.empty((0, dim), dtype="float32") if vectors is None else vectors
+        index = faiss.IndexIDMap2(build_index(vectors[:0], self.spec)[0])
+        if len(ids):
+            index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+        return index
+
+    def _remove(self, partition, ids):
+        index = self._indexes.get(partition)
+        if index is None:
+            return
+        live = self._live[partition]
+        live.difference_update(ids)
+        if not live:
+            del self._indexes[partition], self._live[partition]
+            self._tombstones.pop(partition, None)
+        elif self.spec["type"] == "flat":
+            index.remove_ids(faiss.IDSelectorBatch(np.asarray(ids, dtype=np.int64)))
+        else:
+            tombstones = self._tombstones.setdefault(partition, set())
+            tombstones.update(ids)
+            if len(tombstones) * 5 >= index.ntotal:
+                self._rebuild(partition)
+
+    def _rebuild(self, partition):
+        """New HNSW index over the partition's live vectors, dropping its tombstones."""
+        entries = {i: self.store.peek(i) for i in self._live[partition]}
+        ids = sorted(i for i, entry in entries.items() if entry is not None)   # None: expired meanwhile
+        self._tombstones.pop(partition, None)
+        if not ids:
+            del self._indexes[partition], self._live[partition]
+            return
+        vectors = np.stack([entries[i]["vector"] for i in ids])
+        self._indexes[partition] = self._new_index(vectors.shape[1], ids, vectors)
+        self._live[partition] = set(ids)
+        self.rebuilds += 1
+
+    def _drop(self, items):
+        """Remove evicted / expired store items from their indexes."""
+        by_partition = {}
+        for entry_id, entry in items:
+            by_partition.setdefault((entry["reference_version"], entry["model"]), []).append(entry_id)
+        for partition, ids in by_partition.items():
+            self._remove(partition, ids)
+
+    def _candidates(self, vec, reference_version, model):
+        """Top search_k live (entry_id, entry, score) of the partition, best first."""
+        partition = (reference_version, model)
+        query = self._as_query(vec)
+        while partition in self._indexes:
+            index = self._indexes[partition]
+            tombstones = self._tombstones.get(partition, ())
+            scores, ids = index.search(query, min(self.search_k + len(tombstones), index.ntotal))
+            found, dead = [], []
+            for score, idx in zip(scores[0], ids[0]):
+                if idx < 0:
+                    break
+                if idx in tombstones:
+                    continue
+                entry = self.store.peek(int(idx))
+                if entry is None:
+                    dead.append(int(idx))
+                else:
+                    found.append((int(idx), entry, float(score)))
+            if not dead:
+                return found[:self.search_k]
+            # Entries expired since the last add: drop every expired one, then search again
+            self._drop(self.store.expire())
+            self._remove(partition, dead)
+        return []
+
+    def lookup(self, vec, entities, reference_version, model=""):
+        """Return (entry, score) for the best acceptable match, or (None, best_score)."""
+        with self._lock:
+            candidates = self._candidates(vec, reference_version, model)
+            best = candidates[0][2] if candidates else 0.0
+            for entry_id, entry, score in candidates:
+                if score < self.threshold:
+                    break
+                if entry["entities"] != entities:
+                    self.entity_rejects += 1
+                    continue
+                self.store.get(entry_id)    # refresh its LRU position
+                self.hits += 1
+                return entry, score
+            self.misses += 1
+            return None, best
+
+    def nearest(self, vec, reference_version, model="", min_score: float = 0.8):
+        """
+        Closest stored question regardless of entity literals -> (entry, score) or (None, 0.0).
+        Not a cache hit: only its tables/columns/intent are reused, when a request
+        has no time left for the intent and column LLM calls.
+        """
+        with self._lock:
+            candidates = self._candidates(vec, reference_version, model)
+            if candidates and candidates[0][2] >= min_score:
+                return candidates[0][1], candidates[0][2]
+            return None, 0.0
+
+    def add(self, vec, question, entities, reference_version, model, payload):
+        if self.max_entries <= 0:
+            return False
+        with self._lock:
+            removed = []
+            if time.monotonic() >= self._next_sweep:
+                removed = self.store.expire()
+                self._next_sweep = time.monotonic() + self.sweep_seconds
+            if self.store.stats()["size"] >= self.max_entries:
+                removed += self.store.trim(self.max_entries - max(1, self.max_entries // 20))
+            self._drop(removed)
+
+            query = self._as_query(vec)
+            partition = (reference_version, model)
+            if partition not in self._indexes:
+                self._indexes[partition] = self._new_index(query.shape[1])
+                self._live[partition] = set()
+            entry_id = next(self._ids)
+            self.store.put(entry_id, {
+                "question": question,
+                "entities": entities,
+                "reference_version": reference_version,
+                "model": model,
+                "payload": payload,
+                # HNSW partitions are rebuilt from the stored vectors
+                "vector": query[0] if self.spec["type"] == "hnsw" else None,
+            })
+            self._indexes[partition].add_with_ids(query, np.asarray([entry_id], dtype=np.int64))
+            self._live[partition].add(entry_id)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self.store.clear()
+            self._indexes = {}
+            self._live = {}
+            self._tombstones = {}
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            store = self.store.stats()
+            return {
+                "size": store["size"],
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.store.ttl_seconds,
+                "partitions": len(self._indexes),
+                "index_type": self.spec["type"],
+                "tombstones": sum(len(t) for t in self._tombstones.values()),
+                "rebuilds": self.rebuilds,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "entity_rejects": self.entity_rejects,
+                "evictions": store["evictions"],
+                "expirations": store["expirations"],
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def semantic_index_spec(index_type: str = None) -> dict:
+    """ann_index spec of the question index: SEMANTIC_CACHE_INDEX_TYPE with its own HNSW knobs."""
+    index_type = (index_type or os.getenv("SEMANTIC_CACHE_INDEX_TYPE", "flat")).lower()
+    if index_type != "hnsw":
+        return index_spec(index_type)
+    return index_spec(
+        "hnsw",
+        build={"M": int(os.getenv("SEMANTIC_CACHE_HNSW_M", "32")),
+               "efConstruction": int(os.getenv("SEMANTIC_CACHE_HNSW_EF_CONSTRUCTION", "200"))},
+        search={"efSearch": int(os.getenv("SEMANTIC_CACHE_HNSW_EF_SEARCH", "64"))},
+    )
+
+
+# Single shared instance for the process
+semantic_cache = SemanticCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "50000")),
+    ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))),
+    spec=semantic_index_spec(),
+)
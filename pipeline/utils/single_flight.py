@@ -0,0 +1,82 @@
+# single_flight.py
+import threading
+
+
+class SingleFlightTimeout(TimeoutError):
+    """A follower stopped waiting for the in-flight call (its wait_timeout ran out)."""
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key: the first caller (leader) runs the
+    function, every caller that arrives while it is in flight (follower) waits and
+    receives the same result (or exception). Nothing is cached once the call finishes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+
+    def do(self, key, fn, *args, wait_timeout: float = None, **kwargs):
+        """
+        Return (result, shared); shared is True when the result came from another caller's run.
+        wait_timeout: longest a follower waits for the leader (None = until it finishes);
+        past it SingleFlightTimeout is raised and the leader's run is left alone.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.followers += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            if not call.done.wait(wait_timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise SingleFlightTimeout(f"in-flight call still running after {wait_timeout:.1f}s")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.leaders + self.followers
+            return {
+                "in_flight": len(self._calls),
+                "executions": self.leaders,
+                "coalesced": self.followers,
+                "follower_timeouts": self.timeouts,
+                "coalescing_rate": self.followers / total if total else 0.0,
+            }
+
+
+# Single shared instance for the process
+single_flight = SingleFlight()
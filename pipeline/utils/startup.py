@@ -0,0 +1,268 @@
+# startup.py
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import faiss
+import pandas as pd
+
+from pipeline.modules.reference_catalog import ReferenceCatalog, reference_catalogs
+from pipeline.modules.sparse_bm25 import SparseBM25, BM25_FILE, tokenize
+from pipeline.modules.fewshot_index import FEWSHOT_CSV, FAISS_FILE, fewshot_index
+from pipeline.modules.rephrase import gazetteers
+from pipeline.utils.cache_manager import CacheManager
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_FILES = ("crs_metrics.csv", "crs_columns.csv", "crs_tables.csv", "crs_joining_instructions.csv")
+
+SNAPSHOT_NAME = "startup_snapshot"
+SNAPSHOT_VERSION = 4
+
+# Resources restored from the snapshot; the embedder (torch model) is always loaded live
+SNAPSHOT_RESOURCES = ("references", "examples_df", "faiss_index", "bm25")
+RESOURCES = SNAPSHOT_RESOURCES + ("embedder",)
+
+
+def _fingerprint(paths):
+    """(path, size, mtime) of every source file; any edit invalidates the snapshot."""
+    fp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            fp.append((path, st.st_size, st.st_mtime_ns))
+        except OSError:
+            fp.append((path, None, None))
+    return tuple(fp)
+
+
+# ---------------- Individual loaders (safe: server still starts if files missing) ----------------
+def _load_catalog():
+    return reference_catalogs.swap(ReferenceCatalog.load())
+
+
+def _load_examples():
+    try:
+        return pd.read_csv(FEWSHOT_CSV)
+    except Exception as e:
+        logger.warning("Few-shot CSV not found: %s", e)
+        return pd.DataFrame(columns=["question", "sql"])
+
+
+def _load_faiss():
+    try:
+        index = fewshot_index.apply_manifest_params(faiss.read_index(FAISS_FILE))
+        logger.info("Loaded FAISS index from %s", FAISS_FILE)
+        return index
+    except Exception as e:
+        logger.warning("FAISS index not found or failed to load: %s", e)
+        return None
+
+
+def _load_bm25(examples_df):
+    bm25_model = None
+    try:
+        bm25_model = SparseBM25.load(BM25_FILE)
+        if bm25_model.corpus_size != len(examples_df):
+            raise ValueError(f"{bm25_model.corpus_size} documents, few-shot CSV has {len(examples_df)}")
+        logger.info("Loaded BM25 model from %s", BM25_FILE)
+    except Exception as e:
+        # Building from the CSV is cheap; the .npz only saves the tokenization pass
+        logger.warning("BM25 model not loaded (%s); building it from %s", e, FEWSHOT_CSV)
+        bm25_model = SparseBM25.from_documents(examples_df["question"])
+    # tokenized corpus for BM25
+    tokenized_corpus = [tokenize(q) for q in examples_df["question"]]
+    return bm25_model, tokenized_corpus
+
+
+def _load_embedder():
+    from pipeline.modules.embedder import Embedder  # imports torch; keep it off the import path
+    return Embedder()
+
+
+class StartupResources:
+    """
+    Pipeline resources (reference catalog, few-shot CSV, FAISS, BM25, embedder)
+    loaded on background threads instead of at import time.
+
+    - get(name) blocks only until that resource is available.
+    - is_ready() / status() back the /health/ready endpoint.
+    - Parsed references, examples, FAISS and BM25 are persisted as one pickle
+      snapshot (via CacheManager) keyed on the source files' size/mtime, so warm
+      restarts skip CSV parsing and encoding detection.
+    - With FEWSHOT_MMAP and a published generation, examples, FAISS and BM25 are
+      memory-mapped (fewshot_index.load_mapped) and shared between worker
+      processes; the snapshot then only holds the references.
+    """
+    def __init__(self, use_snapshot: bool = True, cache_dir: str = "cache"):
+        self.use_snapshot = use_snapshot
+        self.cache = CacheManager(cache_dir)
+        self._futures = {name: Future() for name in RESOURCES}
+        self._lock = threading.Lock()
+        self._started = False
+        self.started_at = None
+        self.ready_at = None
+        self.from_snapshot = False
+        self.mapped = False
+        self.timings = {}
+
+    # ---------------- Public API ----------------
+    def start(self):
+        """Kick off background loading (idempotent)."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self.started_at = time.time()
+        threading.Thread(target=self._load_all, name="pipeline-startup", daemon=True).start()
+
+    def get(self, name, timeout=None):
+        """Return a loaded resource, starting the loader lazily if needed."""
+        self.start()
+        return self._futures[name].result(timeout=timeout)
+
+    def peek(self, name):
+        """The resource if it has loaded, else None (never blocks)."""
+        future = self._futures[name]
+        if future.done() and future.exception() is None:
+            return future.result()
+        return None
+
+    def wait_ready(self, timeout=None):
+        for name in RESOURCES:
+            self.get(name, timeout=timeout)
+        return True
+
+    def is_ready(self) -> bool:
+        return all(f.done() and f.exception() is None for f in self._futures.values())
+
+    def status(self) -> dict:
+        resources = {}
+        for name, future in self._futures.items():
+            if not future.done():
+                resources[name] = "loading" if self._started else "pending"
+            elif future.exception() is not None:
+                resources[name] = f"failed: {future.exception()}"
+            else:
+                resources[name] = "ready"
+        return {
+            "ready": self.is_ready(),
+            "resources": resources,
+            "from_snapshot": self.from_snapshot,
+            "mapped": self.mapped,
+            "cold_start_seconds": (self.ready_at - self.started_at) if self.ready_at else None,
+            "timings": dict(self.timings),
+        }
+
+    # ---------------- Loading ----------------
+    def _run(self, name, loader, *args):
+        start = time.time()
+        try:
+            value = loader(*args)
+        except Exception as e:
+            logger.error("[Startup] Failed to load %s: %s", name, e)
+            self._futures[name].set_exception(e)
+            return None
+        self.timings[name] = time.time() - start
+        self._futures[name].set_result(value)
+        return value
+
+    def _load_all(self):
+        with ThreadPoolExecutor(max_workers=4, thread_name_prefix="startup") as pool:
+            # The model load is the slowest item; start it first and independently
+            pool.submit(self._run, "embedder", _load_embedder)
+
+            self.mapped = fewshot_index.mmap and self._load_mapped()
+            if not self._restore_snapshot():
+                references = pool.submit(self._run, "references", _load_catalog)
+                bm25 = None
+                if not self.mapped:
+                    faiss_index = pool.submit(self._run, "faiss_index", _load_faiss)
+                    examples_df = self._run("examples_df", _load_examples)
+                    if examples_df is not None:
+                        bm25 = self._run("bm25", _load_bm25, examples_df)
+                    else:
+                        self._futures["bm25"].set_exception(RuntimeError("few-shot examples unavailable"))
+                    faiss_index.result()
+                references.result()
+                if self.mapped or bm25 is not None:
+                    self._save_snapshot()
+            # The branch-master lookup needs the catalog; loads on its own thread
+            gazetteers.start()
+
+        self.ready_at = time.time()
+        logger.info("[Startup] Resources ready in %.2fs (snapshot=%s) %s",
+                    self.ready_at - self.started_at, self.from_snapshot, self.timings)
+
+    def _load_mapped(self) -> bool:
+        start = time.time()
+        try:
+            state = fewshot_index.load_mapped()
+        except Exception as e:
+            logger.info("[Startup] Few-shot store not memory-mapped (%s); loading private copies", e)
+            return False
+        # No tokenized corpus: retrieval scores with the BM25 weights only
+        for name, value in (("examples_df", state.examples_df), ("faiss_index", state.faiss_index),
+                            ("bm25", (state.bm25, None))):
+            self._futures[name].set_result(value)
+        self.timings["mapped"] = time.time() - start
+        logger.info("[Startup] Memory-mapped %d few-shot examples in %.3fs", len(state.hashes), self.timings["mapped"])
+        return True
+
+    def _snapshot_fingerprint(self):
+        if self.mapped:
+            return (SNAPSHOT_VERSION, "mapped", _fingerprint(REFERENCE_FILES))
+        return (SNAPSHOT_VERSION, _fingerprint(REFERENCE_FILES + (FEWSHOT_CSV, FAISS_FILE, BM25_FILE)))
+
+    def _restore_snapshot(self) -> bool:
+        if not self.use_snapshot:
+            return False
+        start = time.time()
+        try:
+            snapshot = self.cache.load(SNAPSHOT_NAME)
+        except Exception as e:
+            logger.warning("[Startup] Ignoring unreadable snapshot: %s", e)
+            return False
+        if not snapshot or snapshot.get("fingerprint") != self._snapshot_fingerprint():
+            return False
+
+        values = {"references": snapshot["references"]}
+        if not self.mapped:
+            faiss_bytes = snapshot["faiss_index"]
+            values.update({
+                "examples_df": snapshot["examples_df"],
+                "faiss_index": fewshot_index.apply_manifest_params(faiss.deserialize_index(faiss_bytes)) if faiss_bytes is not None else None,
+                "bm25": snapshot["bm25"],
+            })
+        reference_catalogs.swap(values["references"])
+        for name, value in values.items():
+            self._futures[name].set_result(value)
+        self.timings["snapshot"] = time.time() - start
+        self.from_snapshot = True
+        logger.info("[Startup] Restored %s from snapshot in %.3fs", ", ".join(values), self.timings["snapshot"])
+        return True
+
+    def _save_snapshot(self):
+        if not self.use_snapshot:
+            return
+        try:
+            snapshot = {
+                "fingerprint": self._snapshot_fingerprint(),
+                "references": self._futures["references"].result(),
+            }
+            if not self.mapped:
+                faiss_index = self._futures["faiss_index"].result()
+                snapshot.update({
+                    "examples_df": self._futures["examples_df"].result(),
+                    "faiss_index": faiss.serialize_index(faiss_index) if faiss_index is not None else None,
+                    "bm25": self._futures["bm25"].result(),
+                })
+            self.cache.save(SNAPSHOT_NAME, snapshot)
+        except Exception as e:
+            logger.warning("[Startup] Could not write snapshot: %s", e)
+
+
+# Single shared instance for the process
+resources = StartupResources(use_snapshot=os.getenv("STARTUP_SNAPSHOT", "1") == "1")
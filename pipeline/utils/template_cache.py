@@ -0,0 +1,187 @@
+# template_cache.py
+import os
+import re
+import calendar
+from pipeline.modules.rephrase import MONTH_PATTERN, CODE_PATTERN, location_gazetteer
+from pipeline.utils.answer_cache import AnswerCache
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+SQL_STRING_LITERAL = re.compile(r"'((?:[^']|'')*)'")
+
+
+# ---------------- Question masking ----------------
+def mask_question(rephrased_question, location_map=None):
+    """
+    Replace the literals rephrase.py labels with slots:
+        "disbursement amount for Month January 2025 in state Karnataka"
+     -> "disbursement amount for Month {month_0} in state {state_0}"
+    Returns (masked_question, slots) where slots is a list of
+    {"name", "kind", "value"} in order of appearance.
+    """
+    spans = []  # (start, end, kind, value)
+    for m in location_gazetteer(location_map).labeled(rephrased_question):
+        spans.append((m.start, m.end, m.label, rephrased_question[m.start:m.end]))
+    for m in MONTH_PATTERN.finditer(rephrased_question):
+        spans.append((m.start(1), m.end(2), "month", f"{m.group(1)} {m.group(2)}"))
+    for m in CODE_PATTERN.finditer(rephrased_question):
+        spans.append((m.start(), m.end(), "code", m.group(0)))
+
+    # Keep the earliest, then longest, non-overlapping spans
+    spans.sort(key=lambda s: (s[0], -(s[1] - s[0])))
+    kept, last_end = [], -1
+    for span in spans:
+        if span[0] >= last_end:
+            kept.append(span)
+            last_end = span[1]
+
+    slots, counters, parts, pos = [], {}, [], 0
+    for start, end, kind, value in kept:
+        kind_key = re.sub(r'\W', '_', kind)
+        name = f"{kind_key}_{counters.get(kind_key, 0)}"
+        counters[kind_key] = counters.get(kind_key, 0) + 1
+        slots.append({"name": name, "kind": kind, "value": value})
+        parts.append(rephrased_question[pos:start])
+        parts.append("{" + name + "}")
+        pos = end
+    parts.append(rephrased_question[pos:])
+    return "".join(parts), slots
+
+
+# ---------------- Literal forms ----------------
+def _literal_forms(slot):
+    """All textual forms a slot value may take inside a SQL string literal."""
+    if slot["kind"] != "month":
+        return {"value": slot["value"]}
+    month_name, year = slot["value"].split()
+    month, year = MONTHS[month_name.lower()], int(year)
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return {
+        "month_start": f"{year}-{month:02d}-01",
+        "month_end": f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}",
+        "next_month_start": f"{next_year}-{next_month:02d}-01",
+        "year_month": f"{year}-{month:02d}",
+        "month_name": month_name,
+    }
+
+
+def _residual_markers(slot):
+    """Text that must not survive outside bound literals, else the SQL still hard-codes the slot."""
+    if slot["kind"] != "month":
+        return [re.escape(slot["value"])]
+    month_name, year = slot["value"].split()
+    return [rf'\b{re.escape(year)}\b', rf'\b{re.escape(month_name)}\b']
+
+
+def _apply_case(value, case):
+    if case == "upper":
+        return value.upper()
+    if case == "lower":
+        return value.lower()
+    return value
+
+
+def templatize_sql(sql, slots):
+    """
+    Turn generated SQL into a skeleton with bound parameters, e.g.
+        WHERE state_name ILIKE '%Karnataka%'  ->  WHERE state_name ILIKE :p0
+    Returns (skeleton, binds) or None when any slot cannot be located unambiguously
+    (then the question shape is simply not templated).
+    """
+    forms = [(slot["name"], form, text) for slot in slots for form, text in _literal_forms(slot).items()]
+    binds, bound_slots, pieces, pos = [], set(), [], 0
+
+    for m in SQL_STRING_LITERAL.finditer(sql):
+        content = m.group(1).replace("''", "'")
+        core = content.strip("%")
+        prefix = content[:len(content) - len(content.lstrip("%"))]
+        suffix = content[len(prefix) + len(core):]
+        matches = [(name, form, text) for name, form, text in forms if core.lower() == text.lower()]
+        if not matches:
+            continue
+        if len({name for name, _, _ in matches}) > 1:
+            return None  # two slots share a value; can't tell which one this literal belongs to
+        name, form, text = matches[0]
+        case = "upper" if core == text.upper() and core != text else "lower" if core == text.lower() and core != text else "exact"
+        param = f"p{len(binds)}"
+        binds.append({"param": param, "slot": name, "form": form, "prefix": prefix, "suffix": suffix, "case": case})
+        bound_slots.add(name)
+        pieces.append(sql[pos:m.start()])
+        pieces.append(f":{param}")
+        pos = m.end()
+    pieces.append(sql[pos:])
+    skeleton = "".join(pieces)
+
+    for slot in slots:
+        if slot["name"] not in bound_slots:
+            return None
+        for marker in _residual_markers(slot):
+            if re.search(marker, skeleton, re.IGNORECASE):
+                return None
+    return skeleton, binds
+
+
+def bind_template(template, slots):
+    """Bind a new question's slot values into a cached skeleton -> (params, rendered_sql) or None."""
+    by_name = {slot["name"]: slot for slot in slots}
+    if set(by_name) != set(template["slot_kinds"]):
+        return None
+    if any(by_name[name]["kind"] != kind for name, kind in template["slot_kinds"].items()):
+        return None
+
+    params = {}
+    for bind in template["binds"]:
+        text = _literal_forms(by_name[bind["slot"]])[bind["form"]]
+        params[bind["param"]] = bind["prefix"] + _apply_case(text, bind["case"]) + bind["suffix"]
+
+    # Human-readable SQL for the response/audit; execution uses the skeleton + params
+    rendered = re.sub(
+        r":(p\d+)\b",
+        lambda m: "'" + params[m.group(1)].replace("'", "''") + "'",
+        template["skeleton"]
+    )
+    return params, rendered
+
+
+class TemplateCache:
+    """Masked question shape -> SQL skeleton with bound parameters (+ intent/columns/joins)."""
+    def __init__(self, max_entries: int = 2000, ttl_seconds: float = 24 * 3600):
+        self.store = AnswerCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.learned = 0
+        self.rejected = 0
+
+    def lookup(self, masked_question, slots, reference_version, model=""):
+        template = self.store.get(AnswerCache.make_key(masked_question, reference_version, model))
+        if template is None:
+            return None
+        bound = bind_template(template, slots)
+        if bound is None:
+            return None
+        params, rendered = bound
+        return template, params, rendered
+
+    def learn(self, masked_question, slots, sql, reference_version, model, payload):
+        result = templatize_sql(sql, slots)
+        if result is None:
+            self.rejected += 1
+            return False
+        skeleton, binds = result
+        self.store.put(AnswerCache.make_key(masked_question, reference_version, model), {
+            "skeleton": skeleton,
+            "binds": binds,
+            "slot_kinds": {slot["name"]: slot["kind"] for slot in slots},
+            "payload": payload,
+        })
+        self.learned += 1
+        return True
+
+    def stats(self) -> dict:
+        stats = self.store.stats()
+        stats.update({"learned": self.learned, "rejected": self.rejected})
+        return stats
+
+
+# Single shared instance for the process
+template_cache = TemplateCache(
+    max_entries=int(os.getenv("TEMPLATE_CACHE_MAX_ENTRIES", "2000")),
+    ttl_seconds=float(os.getenv("TEMPLATE_CACHE_TTL_SECONDS", str(24 * 3600))),
+)
@@ -1,6 +1,6 @@
 #routes_new.py
 from flask import Blueprint, request, jsonify
-from pipeline.pipeline import run_pipeline  
+from pipeline.pipeline import run_pipeline_coalesced, get_pipeline_metrics
 
 # change blueprint url prefix to /user
 query_bp = Blueprint("query", __name__, url_prefix="/user")
@@ -9,7 +9,7 @@ query_bp = Blueprint("query", __name__, url_prefix="/user")
 @query_bp.route("/query", methods=["POST"])
 def ask_question():
     """
-    Accepts a JSON body with 'question' and runs the pipeline.
+    Accepts a JSON body with 'question' (and optional 'deadline_seconds') and runs the pipeline.
     """
     try:
         data = request.get_json(silent=True)
@@ -18,7 +18,10 @@ def ask_question():
         question = data.get("question")
         print("DEBUG question:", question)
 
-        result = run_pipeline(question)
+        deadline_seconds = data.get("deadline_seconds")
+
+        # identical concurrent questions share one pipeline run
+        result = run_pipeline_coalesced(question, deadline=float(deadline_seconds) if deadline_seconds else None)
         return jsonify(result)
     
     except Exception as e:
@@ -26,3 +29,11 @@ def ask_question():
         print("DEBUG ERROR:", traceback.format_exc())
         return jsonify({"error": str(e)})
 
+
+@query_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Cache hit/miss counters and the request coalescing rate.
+    """
+    return jsonify(get_pipeline_metrics())
+
@@ -95,6 +95,7 @@ import csv
 import os
 import uuid
 import time
+import threading
 from datetime import datetime
 
 AUDIT_DIR = "audit_logs"
@@ -103,6 +104,10 @@ os.makedirs(AUDIT_DIR, exist_ok=True)
 MASTER_FILE = os.path.join(AUDIT_DIR, "monitor_master.csv")
 CHILD_FILE = os.path.join(AUDIT_DIR, "monitor_child.csv")
 
+# IDs are derived from the last row on disk, so concurrent runs (batch mode,
+# threaded Flask) must serialize the read-max-id + append sequence.
+_audit_lock = threading.Lock()
+
 
 def save_master_record(username, question, response, intent, sql_query, tokens, start_time, end_time, status=True,child_steps_total=0):#chnage
     """Save summary info per pipeline run."""
@@ -112,46 +117,47 @@ def save_master_record(username, question, response, intent, sql_query, tokens,
         "start_time", "end_time", "time_taken_in_seconds"
     ]
 
-    # Generate new ID
-    if os.path.exists(MASTER_FILE):
-        with open(MASTER_FILE, "r", encoding="utf-8") as f:
-            try:
-                last_id = max(int(row.split(",")[0]) for row in f.readlines()[1:])  # skip header
-            except ValueError:
-                last_id = 0
-    else:
-        last_id = 0
-
-    run_id = last_id + 1
-    time_taken = end_time - start_time
-
-    total_tokens = child_steps_total if child_steps_total else tokens.get("total_tokens", 0)#chnage
-
-
-    row = {
-        "id": run_id,
-        "username": username,
-        "request": question,
-        "response": response,
-        "status": status,
-        "intent": intent,
-        "query": sql_query,
-        "prompt_tokens": tokens.get("prompt_tokens", 0),
-        "completion_tokens": tokens.get("completion_tokens", 0),
-        "total_tokens": total_tokens, #chnage
-        "start_time": start_time,
-        "end_time": end_time,
-        "time_taken_in_seconds": time_taken
-    }
-
-    write_header = not os.path.exists(MASTER_FILE)
-    with open(MASTER_FILE, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if write_header:
-            writer.writeheader()
-        writer.writerow(row)
-
-    return run_id
+    with _audit_lock:
+        # Generate new ID
+        if os.path.exists(MASTER_FILE):
+            with open(MASTER_FILE, "r", encoding="utf-8") as f:
+                try:
+                    last_id = max(int(row.split(",")[0]) for row in f.readlines()[1:])  # skip header
+                except ValueError:
+                    last_id = 0
+        else:
+            last_id = 0
+
+        run_id = last_id + 1
+        time_taken = end_time - start_time
+
+        total_tokens = child_steps_total if child_steps_total else tokens.get("total_tokens", 0)#chnage
+
+
+        row = {
+            "id": run_id,
+            "username": username,
+            "request": question,
+            "response": response,
+            "status": status,
+            "intent": intent,
+            "query": sql_query,
+            "prompt_tokens": tokens.get("prompt_tokens", 0),
+            "completion_tokens": tokens.get("completion_tokens", 0),
+            "total_tokens": total_tokens, #chnage
+            "start_time": start_time,
+            "end_time": end_time,
+            "time_taken_in_seconds": time_taken
+        }
+
+        write_header = not os.path.exists(MASTER_FILE)
+        with open(MASTER_FILE, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            if write_header:
+                writer.writeheader()
+            writer.writerow(row)
+
+        return run_id
 
 
 def save_child_records(master_id, steps_usage):
@@ -162,36 +168,37 @@ def save_child_records(master_id, steps_usage):
     """
     fieldnames = ["id", "type", "master_id", "prompt_tokens", "completion_tokens", "total_tokens", "start_time", "end_time", "time_taken_in_seconds"]
 
-    if os.path.exists(CHILD_FILE):
-        with open(CHILD_FILE, "r", encoding="utf-8") as f:
-            try:
-                last_id = max(int(row.split(",")[0]) for row in f.readlines()[1:])
-            except ValueError:
-                last_id = 0
-    else:
-        last_id = 0
-
-    rows = []
-    for step in steps_usage:
-        last_id += 1
-        total_tokens = step.get("prompt_tokens", 0) + step.get("completion_tokens", 0)
-        time_taken = step.get("end_time", 0) - step.get("start_time", 0)
-        row = {
-            "id": last_id,
-            "type": step.get("step"),
-            "master_id": master_id,
-            "prompt_tokens": step.get("prompt_tokens", 0),
-            "completion_tokens": step.get("completion_tokens", 0),
-            "total_tokens": total_tokens,
-            "start_time": step.get("start_time", 0),
-            "end_time": step.get("end_time", 0),
-            "time_taken_in_seconds": time_taken
-        }
-        rows.append(row)
-
-    write_header = not os.path.exists(CHILD_FILE)
-    with open(CHILD_FILE, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if write_header:
-            writer.writeheader()
-        writer.writerows(rows)
+    with _audit_lock:
+        if os.path.exists(CHILD_FILE):
+            with open(CHILD_FILE, "r", encoding="utf-8") as f:
+                try:
+                    last_id = max(int(row.split(",")[0]) for row in f.readlines()[1:])
+                except ValueError:
+                    last_id = 0
+        else:
+            last_id = 0
+
+        rows = []
+        for step in steps_usage:
+            last_id += 1
+            total_tokens = step.get("prompt_tokens", 0) + step.get("completion_tokens", 0)
+            time_taken = step.get("end_time", 0) - step.get("start_time", 0)
+            row = {
+                "id": last_id,
+                "type": step.get("step"),
+                "master_id": master_id,
+                "prompt_tokens": step.get("prompt_tokens", 0),
+                "completion_tokens": step.get("completion_tokens", 0),
+                "total_tokens": total_tokens,
+                "start_time": step.get("start_time", 0),
+                "end_time": step.get("end_time", 0),
+                "time_taken_in_seconds": time_taken
+            }
+            rows.append(row)
+
+        write_header = not os.path.exists(CHILD_FILE)
+        with open(CHILD_FILE, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            if write_header:
+                writer.writeheader()
+            writer.writerows(rows)
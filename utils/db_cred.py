@@ -26,11 +26,32 @@ def verify_connection():
     except Exception as e:
         print("[ERROR] Connection failed:", e)
 
-def execute_sql(sql_query: str):
+class QueryError(RuntimeError):
+    """The statement failed (syntax error, missing table, lost connection, ...)."""
+    pass
+
+class QueryTimeout(QueryError):
+    """The statement was cancelled because it ran past its time budget."""
+    pass
+
+def execute_sql(sql_query: str, params: dict = None, timeout_seconds: float = None):
+    """
+    Execute SQL (optionally with :name bound parameters) and return rows as dicts.
+    timeout_seconds: server-side statement timeout (PostgreSQL); QueryTimeout is raised
+    when it fires. Any other failure raises QueryError instead of returning [], so a
+    broken query is never mistaken for an empty result.
+    """
     try:
         with next(get_session()) as session:
-            result = session.execute(text(sql_query))
+            if timeout_seconds is not None and engine.dialect.name == "postgresql":
+                # SET LOCAL only lasts for this transaction
+                session.execute(text(f"SET LOCAL statement_timeout = {max(1, int(timeout_seconds * 1000))}"))
+            result = session.execute(text(sql_query), params or {})
             return [dict(row) for row in result.mappings()]
     except Exception as e:
+        if "statement timeout" in str(e).lower():
+            # None: the server's own statement_timeout fired
+            limit = f"{timeout_seconds:.1f}s" if timeout_seconds is not None else "the server's"
+            raise QueryTimeout(f"[sql_execution] Query cancelled after {limit} statement timeout") from e
         print("[ERROR] SQL execution failed:", e)
-        return []
+        raise QueryError(f"[sql_execution] SQL execution failed: {e}") from e
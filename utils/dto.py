@@ -36,6 +36,7 @@ class PipelineDTO:
     # -------------------------
     sql_query: Optional[str] = None
     sql_usage: Optional[Dict[str, Any]] = None
+    sql_cache_key: Optional[str] = None     # llm_response_cache key of the generate_sql output
     few_shots: List[Dict[str, str]] = field(default_factory=list)
     few_shot_matched_indices: List[int] = field(default_factory=list)
 
@@ -105,7 +106,7 @@ class PipelineDTO:
             "sql_usage": self.sql_usage,
             # "few_shots": self.few_shots,
             "response": self.response,
-            # "query_in_cache": self.query_in_cache,
+            "query_in_cache": self.query_in_cache,
             # "chart_data": self.chart_data,
             "extras": self.extras,
             # "conv_chain_hist": self.conv_chain_hist,